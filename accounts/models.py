@@ -19,6 +19,8 @@ class User(AbstractUser):
     plan_expires = models.DateTimeField(null=True, blank=True)
     api_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever one of the user's links is created, edited or deleted
+    links_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         db_table = 'users'
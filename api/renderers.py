@@ -0,0 +1,31 @@
+"""
+API Renderers
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson: the same bytes for compact UTF-8
+    output (the API's default), several times faster. Indented and ASCII
+    output, and data orjson rejects, go through the stdlib encoder.
+    """
+
+    # Dates and times are left to DRF's encoder, which formats them differently
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like JSONRenderer, keeping the output a strict JavaScript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
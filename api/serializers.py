@@ -1,8 +1,15 @@
 """
 API Serializers
 """
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.encoding import iri_to_uri
+from django.utils.functional import cached_property
 from rest_framework import serializers
-from shortener.models import Link, Click
+from shortener import timeseries
+from shortener.models import Link, Click, qr_code
 
 
 class LinkSerializer(serializers.ModelSerializer):
@@ -21,11 +28,12 @@ class LinkSerializer(serializers.ModelSerializer):
             'title',
             'short_url',
             'clicks_count',
+            'bot_clicks',
             'created_at',
             'is_active',
             'qr_code',
         ]
-        read_only_fields = ['id', 'short_code', 'clicks_count', 'created_at']
+        read_only_fields = ['id', 'short_code', 'clicks_count', 'bot_clicks', 'created_at']
 
     def get_short_url(self, obj):
         request = self.context.get('request')
@@ -37,17 +45,77 @@ class LinkSerializer(serializers.ModelSerializer):
         return obj.generate_qr_code()
 
 
+class LinkRowSerializer(serializers.BaseSerializer):
+    """
+    Read-only LinkSerializer for values(*LinkRowSerializer.FIELDS) rows,
+    skipping model instances and per-field machinery. Output is identical.
+    """
+
+    FIELDS = [
+        'id',
+        'original_url',
+        'short_code',
+        'custom_alias',
+        'title',
+        'clicks_count',
+        'bot_clicks',
+        'created_at',
+        'is_active',
+    ]
+
+    @cached_property
+    def base_url(self):
+        """Scheme and host of the request, as build_absolute_uri prefixes them"""
+        return self.context['request'].build_absolute_uri('/')[:-1]
+
+    @cached_property
+    def output_timezone(self):
+        # Looked up once, not per row as serializers.DateTimeField does
+        return timezone.get_current_timezone()
+
+    def datetime(self, value):
+        """As serializers.DateTimeField renders it: ISO 8601 in the current time zone"""
+        value = value.astimezone(self.output_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    def short_url(self, code):
+        path = f'/{code}'
+        # Codes with slashes may be resolved relative to the request path
+        if '/' in code:
+            return self.context['request'].build_absolute_uri(path)
+        return iri_to_uri(self.base_url + path)
+
+    def to_representation(self, row):
+        code = row['custom_alias'] or row['short_code']
+        return {
+            'id': row['id'],
+            'original_url': row['original_url'],
+            'short_code': row['short_code'],
+            'custom_alias': row['custom_alias'],
+            'title': row['title'],
+            'short_url': self.short_url(code),
+            'clicks_count': row['clicks_count'],
+            'bot_clicks': row['bot_clicks'],
+            'created_at': self.datetime(row['created_at']),
+            'is_active': row['is_active'],
+            'qr_code': qr_code(f'/{code}'),
+        }
+
+
 class LinkCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating links via API"""
 
+    # Opt-in: return the caller's existing link to the URL instead
+    reuse = serializers.BooleanField(required=False, write_only=True)
+
     class Meta:
         model = Link
-        fields = ['original_url', 'custom_alias', 'title']
+        fields = ['original_url', 'custom_alias', 'title', 'reuse']
 
     def validate_custom_alias(self, value):
         if value:
             value = value.strip().lower()
-            if Link.objects.filter(custom_alias=value).exists():
+            if Link.all_objects.filter(custom_alias=value).exists():
                 raise serializers.ValidationError('This alias is already taken.')
             if len(value) < 3:
                 raise serializers.ValidationError('Alias must be at least 3 characters.')
@@ -57,11 +125,18 @@ class LinkCreateSerializer(serializers.ModelSerializer):
 class ClickSerializer(serializers.ModelSerializer):
     """Serializer for Click model"""
 
+    # Dictionary-encoded dimensions are exposed as their labels
+    device_type = serializers.CharField(source='get_device_type_display', read_only=True)
+    browser = serializers.CharField(source='get_browser_display', read_only=True)
+    os = serializers.CharField(source='get_os_display', read_only=True)
+    referrer = serializers.CharField(read_only=True)
+
     class Meta:
         model = Click
         fields = [
             'id',
             'clicked_at',
+            'hits',
             'country',
             'city',
             'device_type',
@@ -78,7 +153,89 @@ class LinkStatsSerializer(serializers.Serializer):
     clicks_today = serializers.IntegerField()
     clicks_this_week = serializers.IntegerField()
     clicks_this_month = serializers.IntegerField()
+    hits_this_month = serializers.IntegerField()
+    unique_visitors = serializers.IntegerField()
+    unique_visitors_this_month = serializers.IntegerField()
     top_browsers = serializers.ListField()
     top_devices = serializers.ListField()
     top_countries = serializers.ListField()
+    top_referrers = serializers.ListField()
     clicks_by_day = serializers.ListField()
+    # Pass as ?since= for deltas (single-link stats only)
+    cursor = serializers.CharField(required=False)
+
+
+class LinkBatchStatsSerializer(LinkStatsSerializer):
+    """Statistics of one link in a batch response"""
+
+    id = serializers.IntegerField()
+    short_code = serializers.CharField()
+
+
+class StatsBatchQuerySerializer(serializers.Serializer):
+    """Link ids of the batch statistics endpoint"""
+
+    MAX_LINKS = 500
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_LINKS,
+    )
+
+    def validate_ids(self, value):
+        # Repeated ids are answered once, in first-seen order
+        return list(dict.fromkeys(value))
+
+
+class TimeseriesQuerySerializer(serializers.Serializer):
+    """Query parameters of the link time-series endpoint"""
+
+    # Window ending now when no start is given
+    DEFAULT_SPANS = {
+        'minute': timedelta(hours=1),
+        'hour': timedelta(days=2),
+        'day': timedelta(days=30),
+        'week': timedelta(weeks=12),
+    }
+
+    granularity = serializers.ChoiceField(choices=timeseries.GRANULARITIES, default='day')
+    tz = serializers.CharField(required=False, allow_blank=True)
+    start = serializers.CharField(required=False)
+    end = serializers.CharField(required=False)
+    heatmap = serializers.BooleanField(default=False)
+
+    def validate_tz(self, value):
+        try:
+            return timeseries.get_timezone(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+    @staticmethod
+    def parse_moment(value, tz):
+        """ISO date or datetime; naive values are in tz"""
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise serializers.ValidationError(f'Invalid date or datetime: {value}')
+            moment = datetime.combine(day, time())
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment, tz)
+        return moment
+
+    def validate(self, attrs):
+        tz = attrs.get('tz') or timeseries.get_timezone()
+        attrs['tz'] = tz
+        try:
+            end = self.parse_moment(attrs['end'], tz) if 'end' in attrs else timezone.now()
+            start = (
+                self.parse_moment(attrs['start'], tz) if 'start' in attrs
+                else end - self.DEFAULT_SPANS[attrs['granularity']]
+            )
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+        if start >= end:
+            raise serializers.ValidationError('start must be before end.')
+        attrs['start'], attrs['end'] = start, end
+        return attrs
@@ -3,21 +3,35 @@ REST API Views
 """
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count
-from django.db.models.functions import TruncDate
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from django.db.models import Count, Q, Sum
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from django.utils import timezone
 from datetime import timedelta
+from functools import reduce
 
-from shortener.models import Link, Click
+from core.db_routers import replica_reads
+from shortener import archive, live, timeseries
+from shortener.conditional import DAY, MINUTE, conditional, link_etag, link_last_modified, user_etag
+from shortener.models import Link, Click, DailyLinkStats, LinkHeavyHitters
+from shortener.sketches import HyperLogLog
 from accounts.models import User
 from .serializers import (
     LinkSerializer,
     LinkCreateSerializer,
+    LinkRowSerializer,
     ClickSerializer,
+    LinkBatchStatsSerializer,
     LinkStatsSerializer,
+    StatsBatchQuerySerializer,
+    TimeseriesQuerySerializer,
 )
 
 
@@ -38,6 +52,17 @@ class APIKeyAuthentication(TokenAuthentication):
             raise AuthenticationFailed('Invalid API key.')
 
 
+class EventStreamRenderer(BaseRenderer):
+    """Lets EventSource clients (Accept: text/event-stream) reach the stream; errors become an event"""
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return live.event('error', data)
+
+
 class LinkViewSet(viewsets.ModelViewSet):
     """
     API endpoint for managing links.
@@ -60,6 +85,21 @@ class LinkViewSet(viewsets.ModelViewSet):
             return LinkCreateSerializer
         return LinkSerializer
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Opt-in: reusing an existing link needs no free slot (200, not 201)
+        reuse = serializer.validated_data.pop('reuse', settings.LINK_REUSE_DEFAULT)
+        if reuse and not serializer.validated_data.get('custom_alias'):
+            link = Link.find_reusable(request.user, serializer.validated_data['original_url'])
+            if link is not None:
+                return Response(self.get_serializer(link).data, status=status.HTTP_200_OK)
+
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
     def perform_create(self, serializer):
         user = self.request.user
 
@@ -75,11 +115,48 @@ class LinkViewSet(viewsets.ModelViewSet):
 
         serializer.save(user=user)
 
+    # Revalidated with ETags: a 304 skips the queryset and the serializer.
+    # Reads serialize values() rows (LinkRowSerializer), gzipped when accepted.
+
+    def get_row_serializer(self, rows, many=False):
+        return LinkRowSerializer(rows, many=many, context=self.get_serializer_context())
+
+    @method_decorator(gzip_page)
+    @method_decorator(conditional(user_etag()))
+    def list(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset()).values(*LinkRowSerializer.FIELDS)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.get_row_serializer(page, many=True).data)
+        return Response(self.get_row_serializer(rows, many=True).data)
+
+    @method_decorator(gzip_page)
+    @method_decorator(conditional(link_etag(), link_last_modified))
+    def retrieve(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset()).values(*LinkRowSerializer.FIELDS)
+        row = get_object_or_404(rows, pk=kwargs['pk'])
+        self.check_object_permissions(request, row)
+        return Response(self.get_row_serializer(row).data)
+
+    def perform_destroy(self, instance):
+        # Clicks are purged in the background
+        instance.soft_delete()
+
     @action(detail=True, methods=['get'])
+    @replica_reads
+    @method_decorator(conditional(link_etag(MINUTE, sketches=True)))
     def stats(self, request, pk=None):
-        """Get detailed statistics for a link"""
+        """Get detailed statistics for a link (?since=<cursor>: only what changed since)"""
         link = self.get_object()
 
+        if 'since' in request.query_params:
+            try:
+                since = live.parse_cursor(request.query_params['since'])
+            except ValueError:
+                from rest_framework.exceptions import ValidationError
+                raise ValidationError({'since': ['Invalid cursor.']})
+            return Response({'total_clicks': link.clicks_count, **live.delta(link.pk, since)})
+
         now = timezone.now()
         today = now.replace(hour=0, minute=0, second=0, microsecond=0)
         week_ago = now - timedelta(days=7)
@@ -87,40 +164,129 @@ class LinkViewSet(viewsets.ModelViewSet):
 
         # Calculate stats
         clicks = link.clicks.all()
-
+        daily_stats = link.daily_stats.all()
+        heavy_hitters = LinkHeavyHitters.for_link(link)
+
+        # One pass over the month; archived clicks only count when a window
+        # reaches past the archive horizon
+        windows = clicks.filter(clicked_at__gte=month_ago).aggregate(
+            today=Count('id', filter=Q(clicked_at__gte=today)),
+            week=Count('id', filter=Q(clicked_at__gte=week_ago)),
+            month=Count('id'),
+            hits=Sum('hits'),
+        )
         stats = {
             'total_clicks': link.clicks_count,
-            'clicks_today': clicks.filter(clicked_at__gte=today).count(),
-            'clicks_this_week': clicks.filter(clicked_at__gte=week_ago).count(),
-            'clicks_this_month': clicks.filter(clicked_at__gte=month_ago).count(),
-            'top_browsers': list(
-                clicks.values('browser')
-                .annotate(count=Count('id'))
-                .order_by('-count')[:5]
-            ),
-            'top_devices': list(
-                clicks.values('device_type')
-                .annotate(count=Count('id'))
-                .order_by('-count')
-            ),
-            'top_countries': list(
-                clicks.values('country')
-                .exclude(country='')
-                .annotate(count=Count('id'))
-                .order_by('-count')[:5]
-            ),
-            'clicks_by_day': list(
-                clicks.filter(clicked_at__gte=month_ago)
-                .annotate(date=TruncDate('clicked_at'))
-                .values('date')
-                .annotate(count=Count('id'))
-                .order_by('date')
-            ),
+            'clicks_today': windows['today'] + archive.count([link.pk], since=today),
+            'clicks_this_week': windows['week'] + archive.count([link.pk], since=week_ago),
+            'clicks_this_month': windows['month'] + archive.count([link.pk], since=month_ago),
+            # Clicks are unique per dedup window; hits include the repeats
+            'hits_this_month': (windows['hits'] or 0) + archive.hits([link.pk], since=month_ago),
+            'unique_visitors': daily_stats.unique_visitors(),
+            'unique_visitors_this_month': daily_stats.filter(
+                date__gte=timezone.localdate(month_ago)
+            ).unique_visitors(),
+            # Top-N from the Space-Saving sketches instead of GROUP BY over clicks
+            'top_browsers': heavy_hitters.top('browser'),
+            'top_devices': heavy_hitters.top('device_type', n=LinkHeavyHitters.CAPACITY),
+            'top_countries': heavy_hitters.top('country'),
+            'top_referrers': heavy_hitters.top('referrer_domain'),
+            'clicks_by_day': timeseries.daily([link.pk], days=30),
+            'cursor': str(live.cursor(link.pk)),
         }
 
         serializer = LinkStatsSerializer(stats)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get', 'post'], url_path='stats/batch')
+    @replica_reads
+    def stats_batch(self, request):
+        """
+        Statistics of many links at once: ?ids=1,2,3 or a POST body of
+        {"ids": [1, 2, 3]}. Ids that are not yours are listed in not_found.
+        """
+        if request.method == 'GET':
+            data = {'ids': [
+                part for value in request.query_params.getlist('ids')
+                for part in value.split(',') if part.strip()
+            ]}
+        else:
+            data = request.data
+        query = StatsBatchQuerySerializer(data=data)
+        query.is_valid(raise_exception=True)
+        ids = query.validated_data['ids']
+
+        links = {
+            row['pk']: row
+            for row in self.get_queryset().filter(pk__in=ids).values('pk', 'short_code', 'clicks_count')
+        }
+        found = [pk for pk in ids if pk in links]
+        stats = batch_stats([links[pk] for pk in found])
+        return Response({
+            'links': LinkBatchStatsSerializer(stats, many=True).data,
+            'not_found': [pk for pk in ids if pk not in links],
+        })
+
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path='clicks/stream',
+        # EventSource cannot send headers, so browsers rely on their session
+        authentication_classes=[APIKeyAuthentication, TokenAuthentication, SessionAuthentication],
+        renderer_classes=[JSONRenderer, EventStreamRenderer],
+    )
+    def clicks_stream(self, request, pk=None):
+        """
+        Server-Sent Events stream of new clicks and counter changes, resuming
+        after Last-Event-ID or ?since=<cursor> (default: from now on).
+        429 when this process already serves CLICK_STREAM_MAX_STREAMS streams.
+        """
+        link = self.get_object()
+        resume = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('since')
+        try:
+            cursor = live.parse_cursor(resume) if resume else live.cursor(link.pk)
+        except ValueError:
+            from rest_framework.exceptions import ValidationError
+            raise ValidationError({'since': ['Invalid cursor.']})
+
+        stream = live.open_stream(link.pk, cursor)
+        if stream is None:
+            from rest_framework.exceptions import Throttled
+            raise Throttled(wait=settings.CLICK_STREAM_SECONDS, detail='Too many live streams are open; retry later.')
+
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Unbuffered behind nginx
+        return response
+
+    @action(detail=True, methods=['get'])
+    @replica_reads
+    def timeseries(self, request, pk=None):
+        """Click series at minute/hour/day/week granularity in the caller's timezone"""
+        link = self.get_object()
+        query = TimeseriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tz = params['tz']
+        links = [link.pk]
+
+        try:
+            series = timeseries.series(links, params['granularity'], params['start'], params['end'], tz)
+        except ValueError as exc:
+            from rest_framework.exceptions import ValidationError
+            raise ValidationError({'granularity': [str(exc)]})
+
+        data = {
+            'granularity': params['granularity'],
+            'timezone': str(tz),
+            'start': params['start'],
+            'end': params['end'],
+            'series': series,
+        }
+        if params['heatmap']:
+            data['heatmap'] = timeseries.heatmap(links, params['start'], params['end'], tz)
+        return Response(data)
+
     @action(detail=True, methods=['get'])
     def qr(self, request, pk=None):
         """Get QR code for a link"""
@@ -134,24 +300,108 @@ class LinkViewSet(viewsets.ModelViewSet):
         })
 
 
+def batch_stats(links):
+    """
+    LinkViewSet.stats for many links ({'pk', 'short_code', 'clicks_count'}
+    rows): one query grouped by link per table and shard, not seven per link
+    """
+    now = timezone.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_ago = now - timedelta(days=7)
+    month_ago = now - timedelta(days=30)
+    month_start = timezone.localdate(month_ago)
+    first_day = timezone.localdate() - timedelta(days=29)
+    link_ids = [link['pk'] for link in links]
+
+    def windows(clicks):
+        return list(
+            clicks.filter(clicked_at__gte=month_ago)
+            .values('link_id')
+            .annotate(
+                today=Count('id', filter=Q(clicked_at__gte=today)),
+                week=Count('id', filter=Q(clicked_at__gte=week_ago)),
+                month=Count('id'),
+                hits=Sum('hits'),
+            )
+            .order_by()
+        )
+
+    def rollups(daily_stats):
+        return list(daily_stats.values_list('link_id', 'date', 'clicks', 'visitors'))
+
+    counts = {row['link_id']: row for rows in Click.objects.fan_out(windows, links=link_ids) for row in rows}
+    days = {}
+    for rows in DailyLinkStats.objects.fan_out(rollups, links=link_ids):
+        for link_id, day, clicks, visitors in rows:
+            days.setdefault(link_id, []).append((day, clicks, visitors))
+    heavy_hitters = {
+        row.link_id: row
+        for rows in LinkHeavyHitters.objects.fan_out(list, links=link_ids) for row in rows
+    }
+
+    results = []
+    for link in links:
+        pk = link['pk']
+        window = counts.get(pk, {'today': 0, 'week': 0, 'month': 0, 'hits': 0})
+        link_days = days.get(pk, [])
+        sketches = heavy_hitters.get(pk) or LinkHeavyHitters(link_id=pk)
+        # Same days as timeseries.daily: the last 30 server-local dates
+        by_day = {day: clicks for day, clicks, _ in link_days if day >= first_day}
+        # The all-time sketch reuses this month's instead of merging it again
+        this_month = HyperLogLog.union(visitors for day, _, visitors in link_days if day >= month_start)
+        all_time = HyperLogLog.union(visitors for day, _, visitors in link_days if day < month_start)
+        results.append({
+            'id': pk,
+            'short_code': link['short_code'],
+            'total_clicks': link['clicks_count'],
+            'clicks_today': window['today'] + archive.count([pk], since=today),
+            'clicks_this_week': window['week'] + archive.count([pk], since=week_ago),
+            'clicks_this_month': window['month'] + archive.count([pk], since=month_ago),
+            'hits_this_month': (window['hits'] or 0) + archive.hits([pk], since=month_ago),
+            'unique_visitors': all_time.merge(this_month).count(),
+            'unique_visitors_this_month': this_month.count(),
+            'top_browsers': sketches.top('browser'),
+            'top_devices': sketches.top('device_type', n=LinkHeavyHitters.CAPACITY),
+            'top_countries': sketches.top('country'),
+            'top_referrers': sketches.top('referrer_domain'),
+            'clicks_by_day': [
+                {'date': day, 'count': by_day.get(day, 0)}
+                for day in (first_day + timedelta(days=offset) for offset in range(30))
+            ],
+        })
+    return results
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
+@conditional(user_etag(DAY))
 def api_user_stats(request):
     """Get current user statistics"""
     user = request.user
 
-    total_links = user.links.count()
-    total_clicks = Click.objects.filter(link__user=user).count()
+    links = user.links.all()
+    total_links = links.count()
 
     # Clicks over time
     last_30_days = timezone.now() - timedelta(days=30)
-    clicks_by_day = (
-        Click.objects
-        .filter(link__user=user, clicked_at__gte=last_30_days)
-        .annotate(date=TruncDate('clicked_at'))
-        .values('date')
-        .annotate(count=Count('id'))
-        .order_by('date')
+
+    def visitor_sketches(daily_stats):
+        this_month = daily_stats.filter(date__gte=timezone.localdate(last_30_days))
+        return daily_stats.visitors_sketch(), this_month.visitors_sketch()
+
+    # Per click shard (queried in parallel when sharded)
+    total_clicks = sum(Click.objects.fan_out(lambda clicks: clicks.count(), links=links))
+    if archive.enabled():
+        # Clicks moved to the columnar archive
+        total_clicks += archive.count(list(links.values_list('pk', flat=True)))
+    clicks_by_day = timeseries.daily(links, days=30)
+
+    # Unique visitors from merged per-link daily sketches
+    sketches = DailyLinkStats.objects.fan_out(visitor_sketches, links=links)
+    unique_visitors, unique_visitors_this_month = (
+        reduce(HyperLogLog.merge, (sketch[index] for sketch in sketches)).count()
+        for index in (0, 1)
     )
 
     return Response({
@@ -160,7 +410,9 @@ def api_user_stats(request):
         'links_limit': user.links_limit,
         'links_used': total_links,
         'total_clicks': total_clicks,
-        'clicks_by_day': list(clicks_by_day),
+        'unique_visitors': unique_visitors,
+        'unique_visitors_this_month': unique_visitors_this_month,
+        'clicks_by_day': clicks_by_day,
     })
 
 
@@ -193,6 +445,7 @@ def api_shorten(request):
     url = request.data.get('url')
     custom_alias = request.data.get('alias')
     title = request.data.get('title', '')
+    reuse = request.data.get('reuse', settings.LINK_REUSE_DEFAULT)
 
     if not url:
         return Response(
@@ -207,12 +460,19 @@ def api_shorten(request):
                 {'error': 'Custom aliases require Pro or Business plan.'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        if Link.objects.filter(custom_alias=custom_alias).exists():
+        if Link.all_objects.filter(custom_alias=custom_alias).exists():
             return Response(
                 {'error': 'This alias is already taken.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    # Opt-in: hand back the caller's existing link to this URL (200, not 201)
+    link = None
+    if str(reuse).lower() in ('1', 'true', 'yes', 'on') and not custom_alias:
+        link = Link.find_reusable(user, url)
+    if link is not None:
+        return shortened(request, link, status.HTTP_200_OK)
+
     # Check user limit
     if user and not user.can_create_link():
         return Response(
@@ -228,10 +488,15 @@ def api_shorten(request):
         user=user
     )
 
+    return shortened(request, link, status.HTTP_201_CREATED)
+
+
+def shortened(request, link, status_code):
+    """api_shorten response for a link"""
     return Response({
         'success': True,
         'short_code': link.short_code,
         'short_url': request.build_absolute_uri(link.short_url),
         'original_url': link.original_url,
         'qr_code': link.generate_qr_code(),
-    }, status=status.HTTP_201_CREATED)
+    }, status=status_code)
@@ -0,0 +1,21 @@
+"""
+Shared cache detection
+
+Redirect records, bot policies and replica pins are written or evicted by
+the process that handled a change and must be seen by every other worker.
+Without a cache shared between processes (settings.REDIS_URL) they are not
+cached at all instead of going stale in each worker.
+"""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+
+# Backends whose entries live and die with one process
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache(alias=DEFAULT_CACHE_ALIAS):
+    """Whether the cache alias is shared by all worker processes"""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
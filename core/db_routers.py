@@ -0,0 +1,118 @@
+"""
+Database routing: analytics reads on an optional read replica
+
+Writes always go to `default`. Reads go to the `replica` alias only inside
+`replica_reads` views (and the admin changelists), for safe requests, and
+only when the user has not written anything within the last
+REPLICA_PIN_SECONDS (read-your-writes). Pins live in the cache, so
+without one shared by all workers (core.caching) every read stays on the
+primary.
+"""
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .caching import shared_cache
+
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_KEY_PREFIX = 'replica-pin:'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+def replica_configured():
+    """Whether a replica is configured and pins can be seen by every worker"""
+    return REPLICA_DB_ALIAS in settings.DATABASES and shared_cache()
+
+
+def pin_key(user):
+    return f'{PIN_KEY_PREFIX}{user.pk}'
+
+
+def pin_user(user):
+    """Serve this user's reads from the primary for REPLICA_PIN_SECONDS"""
+    cache.set(pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(pin_key(user)) is not None
+
+
+def read_database(request):
+    """Alias analytics reads for this request should use"""
+    if (
+        replica_configured()
+        and request.method in SAFE_METHODS
+        and not is_pinned(request.user)
+    ):
+        return REPLICA_DB_ALIAS
+    return DEFAULT_DB_ALIAS
+
+
+def current_read_alias():
+    """Alias set by the innermost `reading_from` block, if any"""
+    return getattr(_state, 'alias', None)
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads without an explicit .using() to alias within the block"""
+    previous = getattr(_state, 'alias', None)
+    _state.alias = alias
+    try:
+        yield
+    finally:
+        _state.alias = previous
+
+
+def replica_reads(view):
+    """Decorator for read-only analytics views (functions or view methods)"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        request = next(arg for arg in args if hasattr(arg, 'method'))
+        with reading_from(read_database(request)):
+            return view(*args, **kwargs)
+    return wrapped
+
+
+class ReplicaRouter:
+    """Send reads inside `reading_from` to its alias and every write to default"""
+
+    def db_for_read(self, model, **hints):
+        return current_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replica and shard rows all refer to primary rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Pin a user to the primary after a successful write request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and replica_configured()
+        ):
+            # DRF copies the authenticated API user onto the Django request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_user(user)
+        return response
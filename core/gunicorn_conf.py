@@ -0,0 +1,102 @@
+"""
+Gunicorn configuration for non-serverless deployments
+
+    gunicorn -c python:core.gunicorn_conf core.wsgi
+
+The app is preloaded and warmed up in the master, then the heap is frozen
+(gc.freeze) so the collector in each worker never touches the shared
+objects and copy-on-write pages stay shared. Per-worker unique memory (USS)
+is logged at boot and every GUNICORN_MEMORY_REPORT_SECONDS.
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+from core import startup
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+# More than one thread switches sync workers to gthread, which live click
+# streams need (see CLICK_STREAM_MAX_STREAMS)
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+preload_app = True
+
+memory_report_seconds = int(os.getenv('GUNICORN_MEMORY_REPORT_SECONDS', '300'))
+
+
+def _format_kib(kib):
+    return f'{kib / 1024:.1f} MiB'
+
+
+def report_memory(server):
+    """Log master and per-worker RSS/PSS/USS"""
+    master = startup.memory_usage(server.pid)
+    if master is None:
+        return
+    server.log.info(
+        'memory master pid=%s rss=%s uss=%s',
+        server.pid, _format_kib(master['rss']), _format_kib(master['uss']),
+    )
+    total_uss = 0
+    for pid in list(server.WORKERS):
+        usage = startup.memory_usage(pid)
+        if usage is None:
+            continue
+        total_uss += usage['uss']
+        server.log.info(
+            'memory worker pid=%s rss=%s pss=%s uss=%s',
+            pid, _format_kib(usage['rss']), _format_kib(usage['pss']), _format_kib(usage['uss']),
+        )
+    if server.WORKERS:
+        server.log.info(
+            'memory workers=%d mean_uss=%s', len(server.WORKERS),
+            _format_kib(total_uss / len(server.WORKERS)),
+        )
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before the first fork
+    summary = startup.warm_up()
+    frozen = startup.freeze_heap()
+    server.log.info(
+        'warm-up: %d templates, %d preloaded modules; %d objects frozen',
+        summary['templates'], summary['modules'], frozen,
+    )
+
+    if memory_report_seconds > 0:
+        def loop():
+            while True:
+                time.sleep(memory_report_seconds)
+                report_memory(server)
+        threading.Thread(target=loop, name='memory-report', daemon=True).start()
+
+
+def pre_fork(server, worker):
+    # Objects the master allocated since the last fork (e.g. respawns)
+    startup.freeze_heap()
+
+
+def post_fork(server, worker):
+    # Never share database connections opened in the master
+    from django.db import connections
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # Fill the shared redirect cache before serving (no-op without one)
+    from shortener import redirect_cache
+    warmed = redirect_cache.warm()
+    worker.log.info('worker pid=%s warmed redirect cache with %d hot links', worker.pid, warmed)
+
+    usage = startup.memory_usage()
+    if usage is not None:
+        worker.log.info(
+            'worker pid=%s booted: rss=%s uss=%s',
+            worker.pid, _format_kib(usage['rss']), _format_kib(usage['uss']),
+        )
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.db_routers.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -96,6 +97,52 @@ else:
         }
     }
 
+# Optional read replica for analytics views and admin changelists, e.g.
+# REPLICA_DATABASE_URL=sqlite:///replica.sqlite3 to try it locally
+REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        REPLICA_DATABASE_URL,
+        conn_max_age=600,
+        ssl_require=REPLICA_DATABASE_URL.startswith('postgres'),
+    )
+    # Tests run against one database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Optional hash sharding of clicks and their rollups by link id, e.g.
+# CLICK_SHARD_URLS=sqlite:///clicks_0.sqlite3,sqlite:///clicks_1.sqlite3
+# (move existing rows with `manage.py shard_clicks`)
+CLICK_SHARDS = []
+for index, url in enumerate(filter(None, os.getenv('CLICK_SHARD_URLS', '').split(','))):
+    alias = f'clicks_{index}'
+    DATABASES[alias] = dj_database_url.parse(
+        url.strip(),
+        conn_max_age=600,
+        ssl_require=url.strip().startswith('postgres'),
+    )
+    CLICK_SHARDS.append(alias)
+
+DATABASE_ROUTERS = [
+    'shortener.sharding.ClickShardRouter',
+    'core.db_routers.ReplicaRouter',
+]
+# Seconds a user's reads stay on the primary after they write. Pins need
+# the shared cache (REDIS_URL); without it the replica is not read at all.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+
+# Cache shared by all workers, e.g. redis://host:6379/0. Redirect records,
+# bot policies and replica pins are only cached with one: a per-process
+# LocMemCache (the default) cannot see another worker's invalidations.
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+
 # Auth
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -147,6 +194,11 @@ REST_FRAMEWORK = {
     },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    'DEFAULT_RENDERER_CLASSES': [
+        # rest_framework.renderers.JSONRenderer for the stdlib encoder
+        os.getenv('API_JSON_RENDERER', 'api.renderers.ORJSONRenderer'),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # CORS
@@ -170,6 +222,7 @@ PLANS = {
         'custom_alias': False,
         'qr_codes': True,
         'api_access': False,
+        'bot_clicks': 'drop',  # record / count / drop (see shortener.bots)
     },
     'pro': {
         'name': 'Pro',
@@ -179,6 +232,7 @@ PLANS = {
         'custom_alias': True,
         'qr_codes': True,
         'api_access': True,
+        'bot_clicks': 'count',
     },
     'business': {
         'name': 'Business',
@@ -188,8 +242,69 @@ PLANS = {
         'custom_alias': True,
         'qr_codes': True,
         'api_access': True,
+        'bot_clicks': 'count',
     },
 }
 
+# Redirect cache (needs the shared cache, see REDIS_URL)
+REDIRECT_CACHE_TIMEOUT = int(os.getenv('REDIRECT_CACHE_TIMEOUT', '300'))
+# Hottest links loaded into the cache at worker start
+REDIRECT_CACHE_WARM_LINKS = int(os.getenv('REDIRECT_CACHE_WARM_LINKS', '1000'))
+# Default of the opt-in "reuse my existing link for this URL" mode
+LINK_REUSE_DEFAULT = os.getenv('LINK_REUSE_DEFAULT', 'False').lower() == 'true'
+# Optional host-wide shared-memory resolution table (`manage.py snapshot_link_table`).
+# Single-host deployments only: link edits patch the file on the host that saved
+# them, so other hosts would keep redirecting to old destinations. Leave unset
+# when links can be edited from more than one host.
+LINK_TABLE_PATH = os.getenv('LINK_TABLE_PATH', '')
+
+# Analytics
+# Seconds between flushes of buffered top-N dimension counts. Use 0 on
+# serverless deployments, where in-process buffers may be lost.
+HEAVY_HITTERS_FLUSH_SECONDS = int(os.getenv('HEAVY_HITTERS_FLUSH_SECONDS', '10'))
+# Repeats of a (link, IP, user agent) within this many seconds only bump
+# the first click's hit counter (0 disables; per-process window cache)
+CLICK_DEDUP_WINDOW_SECONDS = int(os.getenv('CLICK_DEDUP_WINDOW_SECONDS', '10'))
+CLICK_DEDUP_MAX_ENTRIES = int(os.getenv('CLICK_DEDUP_MAX_ENTRIES', '100000'))
+# Columnar archive of cold clicks (`manage.py archive_clicks`)
+CLICK_ARCHIVE_DIR = os.getenv('CLICK_ARCHIVE_DIR', str(BASE_DIR / 'click_archive'))
+CLICK_ARCHIVE_AFTER_DAYS = int(os.getenv('CLICK_ARCHIVE_AFTER_DAYS', '30'))
+# Deleted links are purged on a background thread after the request. Use
+# False on serverless deployments and run `manage.py purge_deleted_links`.
+LINK_PURGE_IN_BACKGROUND = os.getenv('LINK_PURGE_IN_BACKGROUND', 'True').lower() == 'true'
+LINK_PURGE_BATCH_SIZE = int(os.getenv('LINK_PURGE_BATCH_SIZE', '5000'))
+# Live click stream (/api/links/<id>/clicks/stream/). Each stream holds a
+# worker thread for CLICK_STREAM_SECONDS; keep it under the platform's request
+# limit. Under gunicorn, serve streams from gthread workers (GUNICORN_THREADS)
+# or an async worker class: a sync worker is tied up by a single stream and
+# killed after GUNICORN_TIMEOUT. Each process serves at most
+# CLICK_STREAM_MAX_STREAMS at once (keep it below GUNICORN_THREADS so redirects
+# still get threads); further streams get a 429.
+CLICK_STREAM_SECONDS = int(os.getenv('CLICK_STREAM_SECONDS', '55'))
+CLICK_STREAM_MAX_STREAMS = int(os.getenv('CLICK_STREAM_MAX_STREAMS', '4'))
+CLICK_STREAM_POLL_SECONDS = int(os.getenv('CLICK_STREAM_POLL_SECONDS', '2'))
+CLICK_STREAM_BATCH_SIZE = int(os.getenv('CLICK_STREAM_BATCH_SIZE', '100'))
+# Most clicks one ?since= stats delta reads
+CLICK_DELTA_MAX_CLICKS = int(os.getenv('CLICK_DELTA_MAX_CLICKS', '10000'))
+# Seconds cached dashboard and link page fragments are kept. Keys are
+# versioned, so this only bounds memory; uses the 'template_fragments'
+# cache when configured, else the default one.
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', '86400'))
+
+# Offline GeoIP range database (build with `manage.py import_geoip`)
+GEOIP_DATABASE = os.getenv('GEOIP_DATABASE', str(BASE_DIR / 'geoip.bin'))
+GEOIP_CACHE_SIZE = int(os.getenv('GEOIP_CACHE_SIZE', '65536'))
+
+# Cold start (checked by `manage.py importtime`)
+COLD_START_IMPORT_BUDGET_MS = float(os.getenv('COLD_START_IMPORT_BUDGET_MS', '1000'))
+# Heavy modules that must stay lazy on the redirect path
+COLD_START_FORBIDDEN_IMPORTS = [
+    'qrcode',
+    'PIL.Image',
+    'numpy',
+    'rest_framework.serializers',
+    'rest_framework.views',
+]
+
 # Email (console for development, configure SMTP for production)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
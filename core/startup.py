@@ -0,0 +1,78 @@
+"""
+Process start-up helpers for preforked (gunicorn) deployments
+"""
+import gc
+import os
+from pathlib import Path
+
+
+# Imported in the master so forked workers share their pages
+PRELOAD_MODULES = [
+    'qrcode',
+    'qrcode.image.pil',
+    'PIL.Image',
+    'PIL.PngImagePlugin',
+    'api.views',
+]
+
+
+def warm_up():
+    """Load everything requests would otherwise load lazily in each worker"""
+    import importlib
+
+    from django.conf import settings
+    from django.template import engines
+    from django.urls import get_resolver
+
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+
+    # Import every URLconf and build the reverse lookup tables
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for urlconf in resolver.url_patterns:
+        getattr(urlconf, 'reverse_dict', None)
+
+    # Compile project templates into the cached loader
+    loaded = 0
+    for engine in engines.all():
+        for directory in engine.dirs:
+            for path in Path(directory).rglob('*.html'):
+                engine.get_template(path.relative_to(directory).as_posix())
+                loaded += 1
+
+    return {
+        'templates': loaded,
+        'modules': len(PRELOAD_MODULES),
+        'debug': settings.DEBUG,
+    }
+
+
+def freeze_heap():
+    """Move every tracked object to the permanent generation before forking"""
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def memory_usage(pid=None):
+    """
+    RSS, PSS and USS (unique set size) of a process in KiB, from
+    /proc/<pid>/smaps_rollup. Returns None where that file does not exist.
+    """
+    path = f'/proc/{pid or os.getpid()}/smaps_rollup'
+    try:
+        with open(path) as f:
+            fields = {}
+            for line in f:
+                key, _, value = line.partition(':')
+                parts = value.split()
+                if parts and parts[-1] == 'kB':
+                    fields[key] = int(parts[0])
+    except OSError:
+        return None
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
@@ -2,10 +2,21 @@
 URL Configuration for URL Shortener SaaS
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, URLResolver
+from django.urls.resolvers import RoutePattern
 from django.conf import settings
 from django.conf.urls.static import static
 
+
+def lazy_include(route, urlconf):
+    """
+    Like path(route, include(urlconf)), but the URLconf module (and whatever it
+    imports) is only loaded once a request reaches this prefix or a URL is
+    reversed. Keeps DRF out of cold starts that only serve redirects.
+    """
+    return URLResolver(RoutePattern(route, is_endpoint=False), urlconf)
+
+
 urlpatterns = [
     # Admin
     path('admin/', admin.site.urls),
@@ -16,8 +27,8 @@ urlpatterns = [
     # Accounts (auth)
     path('accounts/', include('accounts.urls')),
 
-    # API
-    path('api/', include('api.urls')),
+    # API (loaded on first use)
+    lazy_include('api/', 'api.urls'),
 ]
 
 if settings.DEBUG:
@@ -1,22 +1,209 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.options import IS_FACETS_VAR, IS_POPUP_VAR, TO_FIELD_VAR
+from django.contrib.admin.views.main import ERROR_FLAG, ORDER_VAR, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from core.db_routers import read_database
 from .models import Link, Click
 
 
+# Upper bound of prefix ranges: sorts after any character (binary collation)
+PREFIX_END = '\U0010ffff'
+
+# Changelist parameters that do not narrow the rows
+UNFILTERED_PARAMS = {PAGE_VAR, ORDER_VAR, ERROR_FLAG, IS_POPUP_VAR, TO_FIELD_VAR, IS_FACETS_VAR, 'shard'}
+
+
+def prefix_match(queryset, field, term):
+    """Q for values of field starting with term, matched on the field's index"""
+    if connections[queryset.db].vendor == 'sqlite':
+        # SQLite's LIKE ignores case and skips the index; its text compares
+        # bytewise, so the prefix is a plain index range
+        return Q(**{f'{field}__gte': term, f'{field}__lt': term + PREFIX_END})
+    # A range is wrong under other collations; LIKE 'term%' is indexed there
+    # (on PostgreSQL by the varchar_pattern_ops index Django adds to unique
+    # CharFields, whatever the collation)
+    return Q(**{f'{field}__startswith': term})
+
+
+def estimated_rows(queryset):
+    """The database's own row estimate for a queryset's table, or None"""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        elif connection.vendor == 'sqlite' and 'sqlite_stat1' in connection.introspection.table_names(cursor):
+            # Written by ANALYZE: "rows [rows per key ...]" per index
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a large table in full: unfiltered lists take
+    the database's row estimate, anything else counts up to COUNT_LIMIT rows
+    """
+
+    COUNT_LIMIT = 10000
+
+    def __init__(self, *args, unfiltered=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.unfiltered = unfiltered
+
+    @cached_property
+    def count(self):
+        if self.unfiltered:
+            estimate = estimated_rows(self.object_list)
+            if estimate is not None and estimate > self.COUNT_LIMIT:
+                return estimate
+        return self.object_list[:self.COUNT_LIMIT + 1].count()
+
+
+class LargeTableAdminMixin:
+    """
+    Changelist settings for tables too large to count or scan: estimated
+    page counts, and a date hierarchy that costs two index lookups
+    (admin/shortener/change_list.html)
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        unfiltered = not set(request.GET) - UNFILTERED_PARAMS
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, unfiltered=unfiltered)
+
+
+class ReplicaChangeListMixin:
+    """Serve changelist reads from the read replica when configured"""
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if match and match.url_name and match.url_name.endswith('_changelist'):
+            queryset = queryset.using(read_database(request))
+        return queryset
+
+
+class ClickShardFilter(admin.SimpleListFilter):
+    """Pick the click shard to browse (clicks cannot be listed across shards)"""
+
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.CLICK_SHARDS]
+
+    def choices(self, changelist):
+        # No "All" choice: the first shard is the default
+        current = self.value() if self.value() in settings.CLICK_SHARDS else settings.CLICK_SHARDS[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': alias == current,
+                'query_string': changelist.get_query_string({self.parameter_name: alias}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        alias = self.value() if self.value() in settings.CLICK_SHARDS else settings.CLICK_SHARDS[0]
+        return queryset.using(alias)
+
+
 @admin.register(Link)
-class LinkAdmin(admin.ModelAdmin):
+class LinkAdmin(LargeTableAdminMixin, ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ['short_code', 'original_url_truncated', 'user', 'clicks_count', 'created_at', 'is_active']
-    list_filter = ['is_active', 'created_at']
-    search_fields = ['short_code', 'original_url', 'custom_alias']
-    readonly_fields = ['clicks_count', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['is_active']
+    date_hierarchy = 'created_at'
+    # Matched by get_search_results: code/alias prefixes and exact URLs only
+    search_fields = ['short_code', 'custom_alias', 'original_url']
+    search_help_text = 'Start of a short code or alias, or a full URL.'
+    readonly_fields = ['clicks_count', 'bot_clicks', 'created_at']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Index range scans only; substring matches would read every link
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if '://' in term:
+            return queryset.filter(url_digest=Link.digest_url(term)), False
+        return queryset.filter(
+            prefix_match(queryset, 'short_code', term) | prefix_match(queryset, 'custom_alias', term)
+        ), False
 
     def original_url_truncated(self, obj):
         return obj.original_url[:50] + '...' if len(obj.original_url) > 50 else obj.original_url
     original_url_truncated.short_description = 'Original URL'
 
+    # Deleting soft-deletes: clicks are purged in the background (shortener.purge)
+
+    def get_deleted_objects(self, objs, request):
+        # The stock summary would collect every click of every link
+        return [str(obj) for obj in objs], {Link._meta.verbose_name_plural: len(objs)}, set(), []
+
+    def delete_model(self, request, obj):
+        obj.soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        # The changelist may read from the replica
+        queryset.using(router.db_for_write(Link)).soft_delete()
+
 
 @admin.register(Click)
-class ClickAdmin(admin.ModelAdmin):
-    list_display = ['link', 'clicked_at', 'device_type', 'browser', 'country']
-    list_filter = ['device_type', 'browser', 'os', 'clicked_at']
-    search_fields = ['link__short_code', 'ip_address']
+class ClickAdmin(LargeTableAdminMixin, ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ['link', 'clicked_at', 'hits', 'device_type', 'browser', 'country']
+    list_select_related = ['link']
+    # No column filters: none of the click columns is indexed for them, so
+    # each filter would scan the table (date_hierarchy uses clicked_at)
+    list_filter = []
+    date_hierarchy = 'clicked_at'
+    # Matched by get_search_results
+    search_fields = ['link__short_code']
+    search_help_text = 'Exact short code or alias (link id when clicks are sharded).'
     readonly_fields = ['link', 'clicked_at', 'ip_address', 'user_agent']
+
+    def get_list_filter(self, request):
+        if settings.CLICK_SHARDS:
+            return [ClickShardFilter, *self.list_filter]
+        return self.list_filter
+
+    # Shards have no links to join against: show link ids
+
+    def get_list_display(self, request):
+        if settings.CLICK_SHARDS:
+            return ['link_ref' if field == 'link' else field for field in self.list_display]
+        return self.list_display
+
+    @admin.display(description='link id', ordering='link_id')
+    def link_ref(self, obj):
+        return obj.link_id
+
+    def get_list_select_related(self, request):
+        return False if settings.CLICK_SHARDS else self.list_select_related
+
+    def get_search_results(self, request, queryset, search_term):
+        # Resolve the code first: joining links would walk every click
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if settings.CLICK_SHARDS:
+            return (queryset.filter(link_id=int(term)) if term.isdigit() else queryset.none()), False
+        link_ids = Link.all_objects.filter(Q(short_code=term) | Q(custom_alias=term)).values_list('pk', flat=True)
+        return queryset.filter(link_id__in=list(link_ids)), False
@@ -0,0 +1,410 @@
+"""
+Columnar archive of cold clicks
+
+Clicks from months that ended before the archive cutoff are moved out of the
+clicks table by `manage.py archive_clicks` into one file per link and month:
+
+    <CLICK_ARCHIVE_DIR>/<link_id % 256>/<link_id>/<YYYY-MM>.clk
+
+    8s magic, I header length, JSON header, then every column as one
+    contiguous little-endian array (offsets relative to the 8-byte aligned
+    end of the header)
+
+The header holds the row count, the column layout and the string tables the
+country/city columns index into. Readers memory-map the columns with NumPy
+and aggregate them vectorized; files are replaced atomically, never edited.
+NumPy is imported lazily so the redirect path does not pay for it, and is
+optional (requirements-archive.txt): without it the archive is disabled and
+archived clicks are left out of analytics.
+
+<CLICK_ARCHIVE_DIR>/HORIZON holds the cutoff: archived clicks are all older,
+so windows starting at or after it never open a file.
+"""
+import importlib.util
+import json
+import os
+import shutil
+import struct
+import tempfile
+from collections import Counter
+from datetime import date, datetime, timezone as dt_timezone
+from functools import cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .sketches import HyperLogLog, hash64
+
+
+MAGIC = b'CLKARCH1'
+PREFIX = struct.Struct('<8sI')
+SUFFIX = '.clk'
+HORIZON_FILE = 'HORIZON'
+
+COLUMNS = [
+    ('id', '<i8'),
+    ('ts', '<i8'),  # Epoch seconds (UTC)
+    ('hits', '<u4'),  # Requests collapsed into the click (shortener.dedup)
+    ('device_type', 'u1'),
+    ('browser', 'u1'),
+    ('os', 'u1'),
+    ('country', '<u2'),  # Index into header['countries']
+    ('city', '<u2'),  # Index into header['cities']
+    ('visitor', '<u8'),  # hash64 of the IP; enough for HyperLogLog
+    ('user_agent', '<i8'),  # Dictionary key, 0 when empty
+    ('referrer', '<i8'),
+]
+
+# Value of columns added after a file was written
+COLUMN_DEFAULTS = {'hits': 1}
+
+# Location columns and the header string table they index into
+LOCATION_TABLES = {'country': 'countries', 'city': 'cities'}
+
+# Clicks table fields that make up an archived row
+CLICK_FIELDS = [
+    'id', 'clicked_at', 'hits', 'device_type', 'browser', 'os', 'country', 'city',
+    'ip_address', 'user_agent_ref_id', 'referrer_ref_id',
+]
+
+
+# (path, inode, mtime, cutoff) of the last HORIZON file read
+_horizon = None
+
+
+def horizon():
+    """Epoch seconds before which clicks may be archived (None: no archive)"""
+    global _horizon
+    path = os.path.join(settings.CLICK_ARCHIVE_DIR, HORIZON_FILE)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # Re-read only when set_horizon() has replaced the file
+    cached = _horizon
+    if cached is not None and cached[:3] == (path, stat.st_ino, stat.st_mtime_ns):
+        return cached[3]
+    try:
+        with open(path) as f:
+            edge = int(f.read())
+    except FileNotFoundError:
+        return None
+    _horizon = (path, stat.st_ino, stat.st_mtime_ns, edge)
+    return edge
+
+
+def set_horizon(ts):
+    """Record the archive cutoff; must happen before clicks are moved"""
+    os.makedirs(settings.CLICK_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(settings.CLICK_ARCHIVE_DIR, HORIZON_FILE)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(ts))
+    os.replace(tmp_path, path)
+
+
+@cache
+def numpy_available():
+    # Looked up without importing it
+    return importlib.util.find_spec('numpy') is not None
+
+
+def enabled():
+    return numpy_available() and horizon() is not None
+
+
+def covers(since):
+    """True if archived clicks can fall into a window starting at since"""
+    edge = horizon() if numpy_available() else None
+    return edge is not None and (since is None or since.timestamp() < edge)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def link_dir(link_id):
+    return os.path.join(settings.CLICK_ARCHIVE_DIR, f'{link_id % 256:02x}', str(link_id))
+
+
+def month_of(ts):
+    """'YYYY-MM' (UTC) of an epoch timestamp"""
+    return datetime.fromtimestamp(ts, dt_timezone.utc).strftime('%Y-%m')
+
+
+def months(link_id):
+    """Archived months of a link, oldest first"""
+    try:
+        names = os.listdir(link_dir(link_id))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len(SUFFIX)] for name in names if name.endswith(SUFFIX))
+
+
+def delete_link(link_id):
+    shutil.rmtree(link_dir(link_id), ignore_errors=True)
+
+
+def archived_links():
+    """Ids of every link with archived clicks"""
+    root = settings.CLICK_ARCHIVE_DIR
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        int(name)
+        for bucket in os.listdir(root) if os.path.isdir(os.path.join(root, bucket))
+        for name in os.listdir(os.path.join(root, bucket)) if name.isdigit()
+    )
+
+
+class ArchiveFile:
+    """Memory-mapped view of one link-month file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, length = PREFIX.unpack(f.read(PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not a click archive file.')
+            self.header = json.loads(f.read(length))
+        self._data_at = _align(PREFIX.size + length)
+        self.count = self.header['count']
+        self.countries = self.header['countries']
+        self.cities = self.header['cities']
+
+    def column(self, name):
+        import numpy as np
+
+        layout = self.header['columns'].get(name)
+        if layout is None:
+            return np.full(self.count, COLUMN_DEFAULTS[name], dtype=dict(COLUMNS)[name])
+        if not self.count:
+            return np.empty(0, dtype=layout['dtype'])
+        return np.memmap(
+            self.path, dtype=layout['dtype'], mode='r',
+            offset=self._data_at + layout['offset'], shape=(self.count,),
+        )
+
+
+def open_months(link_id, since=None):
+    """ArchiveFile for each archived month of a link that may hold rows >= since"""
+    first = month_of(since.timestamp()) if since is not None else None
+    return [
+        ArchiveFile(os.path.join(link_dir(link_id), f'{month}{SUFFIX}'))
+        for month in months(link_id)
+        if first is None or month >= first
+    ]
+
+
+def write(path, columns, countries, cities):
+    """Write a file from {name: array} and swap it in atomically"""
+    count = len(columns['id'])
+    layout = {}
+    header = {'count': count, 'columns': layout, 'countries': countries, 'cities': cities}
+
+    offset = 0
+    for name, dtype in COLUMNS:
+        layout[name] = {'dtype': dtype, 'offset': offset}
+        offset = _align(offset + count * columns[name].dtype.itemsize)
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    data_at = _align(PREFIX.size + len(header_bytes))
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.archive-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(PREFIX.pack(MAGIC, len(header_bytes)))
+            out.write(header_bytes)
+            for name, dtype in COLUMNS:
+                out.write(b'\0' * (data_at + layout[name]['offset'] - out.tell()))
+                out.write(columns[name].astype(dtype, copy=False).tobytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def append(link_id, month, rows):
+    """
+    Merge clicks (CLICK_FIELDS tuples) into a link-month file; rows already
+    archived (same click id) are skipped, so an interrupted job can rerun.
+    """
+    import numpy as np
+
+    path = os.path.join(link_dir(link_id), f'{month}{SUFFIX}')
+    existing = ArchiveFile(path) if os.path.exists(path) else None
+    countries = list(existing.countries) if existing else []
+    cities = list(existing.cities) if existing else []
+    country_index = {value: i for i, value in enumerate(countries)}
+    city_index = {value: i for i, value in enumerate(cities)}
+
+    def index_of(table, index, value):
+        if value not in index:
+            index[value] = len(table)
+            table.append(value)
+        return index[value]
+
+    new = {name: [] for name, _ in COLUMNS}
+    for click_id, clicked_at, hits, device_type, browser, os_name, country, city, ip, user_agent, referrer in rows:
+        new['id'].append(click_id)
+        new['ts'].append(int(clicked_at.timestamp()))
+        new['hits'].append(hits)
+        new['device_type'].append(device_type)
+        new['browser'].append(browser)
+        new['os'].append(os_name)
+        new['country'].append(index_of(countries, country_index, country))
+        new['city'].append(index_of(cities, city_index, city))
+        new['visitor'].append(hash64(ip or ''))
+        new['user_agent'].append(user_agent or 0)
+        new['referrer'].append(referrer or 0)
+
+    columns = {name: np.array(new[name], dtype=dtype) for name, dtype in COLUMNS}
+    if existing is not None:
+        old = {name: np.array(existing.column(name)) for name, _ in COLUMNS}
+        fresh = ~np.isin(columns['id'], old['id'])
+        columns = {name: np.concatenate([old[name], columns[name][fresh]]) for name, _ in COLUMNS}
+    if len(countries) > 0xFFFF or len(cities) > 0xFFFF:
+        raise ValueError(f'Too many distinct locations for {path}.')
+
+    order = np.argsort(columns['ts'], kind='stable')
+    write(path, {name: values[order] for name, values in columns.items()}, countries, cities)
+    return len(rows)
+
+
+# Vectorized aggregation
+
+def _files(link_ids, since=None):
+    """Yield (file, first row index) for archived rows of link_ids at or after since"""
+    import numpy as np
+
+    if not covers(since):
+        return
+    cutoff = int(since.timestamp()) if since is not None else None
+    for link_id in link_ids:
+        for archive_file in open_months(link_id, since):
+            start = 0
+            if cutoff is not None:
+                # Rows are sorted by timestamp
+                start = int(np.searchsorted(archive_file.column('ts'), cutoff, side='left'))
+            if start < archive_file.count:
+                yield archive_file, start
+
+
+def count(link_ids, since=None):
+    """Archived clicks of link_ids (optionally at or after since)"""
+    return sum(archive_file.count - start for archive_file, start in _files(link_ids, since))
+
+
+def hits(link_ids, since=None):
+    """Requests behind the archived clicks of link_ids (see Click.hits)"""
+    return sum(int(archive_file.column('hits')[start:].sum()) for archive_file, start in _files(link_ids, since))
+
+
+def value_counts(link_ids, column, since=None):
+    """Counter of a column's values; country/city resolved to strings"""
+    import numpy as np
+
+    totals = Counter()
+    for archive_file, start in _files(link_ids, since):
+        values, counts = np.unique(archive_file.column(column)[start:], return_counts=True)
+        values = values.tolist()
+        if column in LOCATION_TABLES:
+            table = getattr(archive_file, LOCATION_TABLES[column])
+            values = [table[value] for value in values]
+        totals.update(dict(zip(values, counts.tolist())))
+    return totals
+
+
+def timestamps(link_ids, since=None, until=None):
+    """Sorted epoch seconds of archived clicks of link_ids in [since, until)"""
+    import numpy as np
+
+    end = int(until.timestamp()) if until is not None else None
+    parts = []
+    for archive_file, start in _files(link_ids, since):
+        ts = archive_file.column('ts')
+        stop = archive_file.count if end is None else int(np.searchsorted(ts, end, side='left'))
+        if stop > start:
+            parts.append(ts[start:stop])
+    return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype='<i8')
+
+
+def local_values(ts, tz, key):
+    """key(local datetime in tz) of each epoch timestamp, as an int array"""
+    import numpy as np
+
+    # Offsets only change on quarter-hour boundaries: convert each distinct
+    # quarter hour once instead of every timestamp
+    slots, inverse = np.unique(np.asarray(ts, dtype='<i8') // 900, return_inverse=True)
+    values = np.array([
+        key(datetime.fromtimestamp(int(slot) * 900, dt_timezone.utc).astimezone(tz))
+        for slot in slots
+    ], dtype='<i8')
+    return values[inverse]
+
+
+def bucket_counts(link_ids, boundaries):
+    """Archived clicks per [boundaries[i], boundaries[i + 1]) of epoch seconds"""
+    import numpy as np
+
+    since, until = (datetime.fromtimestamp(edge, dt_timezone.utc) for edge in (boundaries[0], boundaries[-1]))
+    ts = timestamps(link_ids, since, until)
+    return np.diff(np.searchsorted(ts, np.array(boundaries, dtype='<i8'), side='left')).tolist()
+
+
+def key_counts(link_ids, since, until, tz, key, size):
+    """Archived clicks per key(local datetime in tz) in [since, until), for keys 0 to size - 1"""
+    import numpy as np
+
+    ts = timestamps(link_ids, since, until)
+    if not len(ts):
+        return [0] * size
+    return np.bincount(local_values(ts, tz, key), minlength=size).tolist()
+
+
+def sketch_of(hashes, precision=12):
+    """HyperLogLog of 64-bit hashes, built vectorized (same as add() per value)"""
+    import numpy as np
+
+    hashes = np.asarray(hashes, dtype='<u8')
+    remaining = 64 - precision
+    index = (hashes >> np.uint64(remaining)).astype(np.intp)
+    w = hashes & np.uint64((1 << remaining) - 1)
+
+    # Bit length of w by binary search over shifts
+    bits = np.zeros(len(w), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = w >= np.uint64(1 << shift)
+        bits[high] += shift
+        w = np.where(high, w >> np.uint64(shift), w)
+    bits += (w > 0)
+
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    np.maximum.at(registers, index, (remaining - bits + 1).astype(np.uint8))
+    return HyperLogLog(precision, registers.tobytes())
+
+
+def daily_rollups(link_id):
+    """Yield (date, clicks, visitor sketch) per local date of a link's archive"""
+    import numpy as np
+
+    tz = timezone.get_current_timezone()
+    for archive_file in open_months(link_id):
+        if not archive_file.count:
+            continue
+        days = local_values(archive_file.column('ts'), tz, lambda moment: moment.date().toordinal())
+        visitors = archive_file.column('visitor')
+        # Timestamps are sorted, so each day is one contiguous run
+        starts = np.flatnonzero(np.diff(days, prepend=days[0] - 1))
+        ends = np.append(starts[1:], len(days))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield date.fromordinal(int(days[start])), end - start, sketch_of(visitors[start:end])
+
+
+def delete_link_files(sender, instance, **kwargs):
+    """Drop a deleted link's archive once the deletion commits"""
+    link_id = instance.pk
+    transaction.on_commit(lambda: delete_link(link_id), using=kwargs.get('using'))
@@ -0,0 +1,88 @@
+"""
+Bot and prefetch classification for the click pipeline
+
+Link-preview crawlers, monitoring probes, HEAD requests and browser
+prefetches still get their redirect, but what happens to the click is up
+to the link owner's plan (settings.PLANS[...]['bot_clicks']):
+
+    record  store it like any other click
+    count   only bump Link.bot_clicks
+    drop    nothing is written
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.caching import shared_cache
+
+RECORD = 'record'
+COUNT = 'count'
+DROP = 'drop'
+
+POLICY_KEY_PREFIX = 'bot-policy:'
+
+# Methods that never come from a person following a link
+NON_CLICK_METHODS = ('HEAD', 'OPTIONS')
+
+# Headers browsers and proxies send on speculative requests: (header, values)
+PREFETCH_HEADERS = [
+    ('HTTP_PURPOSE', ('prefetch', 'preview')),
+    ('HTTP_SEC_PURPOSE', ('prefetch', 'prefetch;prerender')),
+    ('HTTP_X_PURPOSE', ('prefetch', 'preview')),
+    ('HTTP_X_MOZ', ('prefetch',)),
+]
+
+# Link-preview crawlers, search and monitoring bots, HTTP libraries
+BOT_USER_AGENT = re.compile(
+    r'bot\b|crawl|spider|slurp|preview|facebookexternalhit|facebookcatalog|'
+    r'whatsapp|skypeuripreview|embedly|vkshare|pinterest|bitlybot|outbrain|'
+    r'headlesschrome|phantomjs|lighthouse|uptime|pingdom|statuscake|monitor|'
+    r'curl/|wget/|python-requests|python-urllib|aiohttp|httpx|go-http-client|'
+    r'okhttp|java/|libwww-perl|node-fetch|axios/',
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=4096)
+def is_bot_user_agent(user_agent):
+    return bool(BOT_USER_AGENT.search(user_agent))
+
+
+def classify(request):
+    """Why a request is not a human click ('method', 'prefetch', 'bot'), or None"""
+    if request.method in NON_CLICK_METHODS:
+        return 'method'
+    meta = request.META
+    for header, values in PREFETCH_HEADERS:
+        if meta.get(header, '').strip().lower() in values:
+            return 'prefetch'
+    if is_bot_user_agent(meta.get('HTTP_USER_AGENT', '')[:500]):
+        return 'bot'
+    return None
+
+
+def plan_policy(plan):
+    """Bot click policy of a plan (anonymous links use the free plan)"""
+    config = settings.PLANS.get(plan) or settings.PLANS['free']
+    return config.get('bot_clicks', RECORD)
+
+
+def forget(link_id):
+    cache.delete(f'{POLICY_KEY_PREFIX}{link_id}')
+
+
+def policy_for(link_id):
+    """Bot click policy of a link's owner, cached like redirect records (shared cache only)"""
+    from .models import Link
+
+    key = f'{POLICY_KEY_PREFIX}{link_id}'
+    cached = shared_cache()
+    policy = cache.get(key) if cached else None
+    if policy is None:
+        plan = Link.objects.filter(pk=link_id).values_list('user__plan', flat=True).first()
+        policy = plan_policy(plan)
+        if cached:
+            cache.set(key, policy, settings.REDIRECT_CACHE_TIMEOUT)
+    return policy
@@ -0,0 +1,130 @@
+"""
+Conditional GETs from version markers
+
+A link's responses change when it is edited (Link.updated_at) or clicked
+(Link.last_clicked_at, with its counters); a user's pages also change when
+one of their links is created, edited or deleted (User.links_version).
+ETags hash those markers, so a client revalidating with If-None-Match gets
+a 304 without the aggregations and serializers: a link's markers are one
+indexed read, a user's also take Max(last_clicked_at) over all their links
+(read through the user index, so it grows with the number of links).
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Link
+
+LINK_MARKERS = ('user_id', 'updated_at', 'last_clicked_at', 'clicks_count', 'bot_clicks')
+
+# How long responses built from relative time stay current
+MINUTE = 'minute'
+DAY = 'day'
+
+
+def conditional(etag_func, last_modified_func=None):
+    """
+    django.views.decorators.http.condition, marking responses for
+    revalidation on every use and for the requesting user only
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapped
+    return decorator
+
+
+def _etag(request, *markers):
+    # One representation per URL and Accept header
+    parts = (request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), *markers)
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def _period(freshness):
+    if freshness == MINUTE:
+        return timezone.now().strftime('%Y%m%d%H%M')
+    if freshness == DAY:
+        return timezone.localdate().isoformat()
+    return None
+
+
+def _pending_messages(request):
+    # A 304 would swallow a flash message (HTML pages only)
+    return hasattr(request, '_messages') and len(messages.get_messages(request)) > 0
+
+
+def _link_markers(request, **lookup):
+    """Markers of a link the user may see, or None (read once per request)"""
+    if not hasattr(request, '_link_markers'):
+        try:
+            row = Link.objects.filter(**lookup).values(*LINK_MARKERS).first()
+        except (TypeError, ValueError):
+            # Malformed pk: the view answers 404
+            row = None
+        if row is not None and row['user_id'] not in (None, request.user.pk):
+            row = None
+        request._link_markers = row
+    return request._link_markers
+
+
+def settling(last_clicked_at):
+    """Whether a link's top-N sketches may still lack its latest clicks"""
+    # Sketches lag clicks by up to a flush interval
+    window = timedelta(seconds=settings.HEAVY_HITTERS_FLUSH_SECONDS)
+    return last_clicked_at is not None and timezone.now() - last_clicked_at < window
+
+
+def link_etag(freshness=None, sketches=False):
+    """
+    ETag function for views of one link (pk or code URL kwarg).
+    freshness: MINUTE / DAY when the response shows relative time;
+    sketches: the response reads the top-N sketches.
+    """
+    def etag(request, pk=None, code=None, **kwargs):
+        if _pending_messages(request):
+            return None
+        row = _link_markers(request, **({'pk': pk} if pk is not None else {'short_code': code}))
+        if row is None or (sketches and settling(row['last_clicked_at'])):
+            return None
+        return _etag(request, *row.values(), _period(freshness))
+    return etag
+
+
+def link_last_modified(request, pk=None, code=None, **kwargs):
+    row = _link_markers(request, **({'pk': pk} if pk is not None else {'short_code': code}))
+    if row is None:
+        return None
+    return max(filter(None, (row['updated_at'], row['last_clicked_at'])))
+
+
+def user_markers(request):
+    """
+    Markers of all the requesting user's links (read once per request);
+    aggregates over every link the user has
+    """
+    if not hasattr(request, '_user_markers'):
+        user = request.user
+        last_click = user.links.aggregate(last=Max('last_clicked_at'))['last']
+        request._user_markers = (user.pk, user.plan, user.links_version, last_click)
+    return request._user_markers
+
+
+def user_etag(freshness=None):
+    """ETag function for views of all the requesting user's links"""
+    def etag(request, *args, **kwargs):
+        if not request.user.is_authenticated or _pending_messages(request):
+            return None
+        return _etag(request, *user_markers(request), _period(freshness))
+    return etag
@@ -0,0 +1,64 @@
+"""
+Time-windowed click deduplication
+
+Double-clicks, browser retries and redirect chains repeat the same
+(link, IP, user agent) within seconds. The first request of such a burst
+records a click; repeats within CLICK_DEDUP_WINDOW_SECONDS only bump that
+click's hit counter. Click rows are therefore unique per window and
+Click.hits keeps the raw request count.
+
+The window cache lives in process memory, bounded by CLICK_DEDUP_MAX_ENTRIES,
+so repeats that land on another worker are recorded as new clicks.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .sketches import hash64
+
+
+# fingerprint -> (expires at, click id), oldest first
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def enabled():
+    return settings.CLICK_DEDUP_WINDOW_SECONDS > 0
+
+
+def fingerprint(link_id, ip, user_agent):
+    return hash64(f'{link_id}\0{ip or ""}\0{user_agent}')
+
+
+def _expire(now):
+    # Entries share one window, so insertion order is expiry order
+    while _entries:
+        key, (expires, _) = next(iter(_entries.items()))
+        if expires > now and len(_entries) <= settings.CLICK_DEDUP_MAX_ENTRIES:
+            return
+        del _entries[key]
+
+
+def seen(key):
+    """Id of the click this fingerprint repeats within the window, or None"""
+    now = time.monotonic()
+    with _lock:
+        _expire(now)
+        entry = _entries.get(key)
+    return entry[1] if entry is not None else None
+
+
+def remember(key, click_id):
+    """Start a window for a newly recorded click"""
+    now = time.monotonic()
+    with _lock:
+        _entries.pop(key, None)
+        _entries[key] = (now + settings.CLICK_DEDUP_WINDOW_SECONDS, click_id)
+        _expire(now)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
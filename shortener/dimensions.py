@@ -0,0 +1,100 @@
+"""
+Dictionary-encoded click dimensions
+
+Device type, browser and OS are stored on clicks as small-integer codes;
+user-agent strings and referrer URLs live once in hash-keyed dictionary
+tables. Codes are append-only: never renumber an existing member.
+"""
+from functools import lru_cache
+
+from django.db import models
+
+from .sketches import hash64
+
+
+class DeviceType(models.IntegerChoices):
+    UNKNOWN = 0, ''
+    DESKTOP = 1, 'desktop'
+    MOBILE = 2, 'mobile'
+    TABLET = 3, 'tablet'
+
+
+class Browser(models.IntegerChoices):
+    UNKNOWN = 0, ''
+    OTHER = 1, 'Other'
+    CHROME = 2, 'Chrome'
+    FIREFOX = 3, 'Firefox'
+    SAFARI = 4, 'Safari'
+    EDGE = 5, 'Edge'
+
+
+class OperatingSystem(models.IntegerChoices):
+    UNKNOWN = 0, ''
+    OTHER = 1, 'Other'
+    WINDOWS = 2, 'Windows'
+    MACOS = 3, 'macOS'
+    LINUX = 4, 'Linux'
+    ANDROID = 5, 'Android'
+    IOS = 6, 'iOS'
+
+
+def code_of(choices, label):
+    """Code of a label; unrecognised labels map to OTHER (or UNKNOWN)"""
+    if not label:
+        return choices.UNKNOWN
+    for member in choices:
+        if member.label == label:
+            return member
+    return getattr(choices, 'OTHER', choices.UNKNOWN)
+
+
+def label_of(choices, code):
+    """Label of a stored code ('' for codes this release does not know)"""
+    try:
+        return choices(code).label
+    except ValueError:
+        return ''
+
+
+def digest(value):
+    """Signed 64-bit dictionary key of a string (fits a BIGINT column)"""
+    return hash64(value) - (1 << 63)
+
+
+@lru_cache(maxsize=4096)
+def parse_user_agent(user_agent):
+    """(device type, browser, OS) codes of a user-agent string"""
+    ua_lower = user_agent.lower()
+
+    # Parse device type (basic)
+    device_type = DeviceType.DESKTOP
+    if 'mobile' in ua_lower or 'android' in ua_lower:
+        device_type = DeviceType.MOBILE
+    elif 'tablet' in ua_lower or 'ipad' in ua_lower:
+        device_type = DeviceType.TABLET
+
+    # Parse browser (basic)
+    browser = Browser.OTHER
+    if 'chrome' in ua_lower:
+        browser = Browser.CHROME
+    elif 'firefox' in ua_lower:
+        browser = Browser.FIREFOX
+    elif 'safari' in ua_lower:
+        browser = Browser.SAFARI
+    elif 'edge' in ua_lower:
+        browser = Browser.EDGE
+
+    # Parse OS (basic)
+    os_name = OperatingSystem.OTHER
+    if 'windows' in ua_lower:
+        os_name = OperatingSystem.WINDOWS
+    elif 'mac' in ua_lower:
+        os_name = OperatingSystem.MACOS
+    elif 'linux' in ua_lower:
+        os_name = OperatingSystem.LINUX
+    elif 'android' in ua_lower:
+        os_name = OperatingSystem.ANDROID
+    elif 'iphone' in ua_lower or 'ipad' in ua_lower:
+        os_name = OperatingSystem.IOS
+
+    return device_type, browser, os_name
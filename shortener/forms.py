@@ -1,10 +1,21 @@
 from django import forms
+from django.conf import settings
 from .models import Link
 
 
+def reuse_field():
+    return forms.BooleanField(
+        required=False,
+        initial=settings.LINK_REUSE_DEFAULT,
+        label='Reuse my existing short link for this URL',
+    )
+
+
 class LinkForm(forms.ModelForm):
     """Form for creating short links"""
 
+    reuse = reuse_field()
+
     class Meta:
         model = Link
         fields = ['original_url', 'custom_alias', 'title']
@@ -29,7 +40,7 @@ class LinkForm(forms.ModelForm):
             # Remove spaces and special chars
             alias = alias.strip().lower()
             # Check if already exists
-            if Link.objects.filter(custom_alias=alias).exists():
+            if Link.all_objects.filter(custom_alias=alias).exists():
                 raise forms.ValidationError('This alias is already taken.')
             # Check length
             if len(alias) < 3:
@@ -48,3 +59,4 @@ class QuickLinkForm(forms.Form):
             'placeholder': 'Paste your long URL here...',
         })
     )
+    reuse = reuse_field()
@@ -0,0 +1,53 @@
+"""
+Versioned template fragment caching
+
+The dashboard and link pages cache their costly parts with {% cache %},
+keyed on the same version markers as their ETags (shortener.conditional):
+a link's fragments on its edit and click markers, a user's on their links
+version and latest click. Any change gives new keys, so entries are never
+invalidated, only left to expire (settings.FRAGMENT_CACHE_TIMEOUT). Views
+pass the values behind a fragment as deferred(...) so its queries only run
+when the fragment has to be rendered.
+"""
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from .conditional import settling, user_markers
+
+
+def deferred(func):
+    """Context value computed by func on first use in the template"""
+    return SimpleLazyObject(func)
+
+
+def _version(*markers):
+    return '-'.join('' if marker is None else str(marker) for marker in markers)
+
+
+def link_version(link):
+    """Fragment key part that changes whenever a link is edited or clicked"""
+    updated_at = link.updated_at.timestamp() if link.updated_at else None
+    last_click = link.last_clicked_at.timestamp() if link.last_clicked_at else None
+    return _version(link.pk, updated_at, last_click, link.clicks_count, link.bot_clicks)
+
+
+def user_version(request):
+    """Fragment key part that changes whenever any of the user's links is"""
+    user_id, plan, links_version, last_click = user_markers(request)
+    return _version(user_id, plan, links_version, last_click.timestamp() if last_click else None)
+
+
+def today():
+    """Fragment key part for content built from recent days"""
+    return timezone.localdate().isoformat()
+
+
+def timeout(sketches_of=None):
+    """
+    {% cache %} timeout; 0 (not stored) for fragments of a link's top-N
+    sketches while they may still lack its latest clicks
+    """
+    if sketches_of is not None and settling(sketches_of.last_clicked_at):
+        return 0
+    return settings.FRAGMENT_CACHE_TIMEOUT
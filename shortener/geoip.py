@@ -0,0 +1,215 @@
+"""
+Offline GeoIP lookups from a memory-mapped IP range database
+
+File layout (little-endian header, big-endian addresses):
+
+    header      8s magic, I version, I range count, I location count
+    ranges      range count x (16s first address, 16s last address, I location)
+    offsets     (location count + 1) x I, offsets into the string blob
+    blob        UTF-8 "country\\0city" entries
+
+Addresses are 128-bit; IPv4 is stored IPv4-mapped (::ffff:a.b.c.d) so both
+families share one sorted array. The file is only ever replaced atomically,
+which lets every gunicorn worker map the same pages from the page cache.
+"""
+import csv
+import ipaddress
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+
+MAGIC = b'GEOIPRNG'
+VERSION = 1
+HEADER = struct.Struct('<8sIII')
+RANGE = struct.Struct('>16s16sI')
+OFFSET = struct.Struct('<I')
+
+IPV4_MAPPED = 0xFFFF << 32
+
+EMPTY = ('', '')
+
+
+def file_version(stat):
+    """What changes when the database file is replaced or rewritten"""
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def address_to_int(value):
+    """Integer key of an IPv4/IPv6 address (IPv4 is mapped into IPv6 space)"""
+    address = ipaddress.ip_address(value.strip() if isinstance(value, str) else value)
+    if address.version == 4:
+        return IPV4_MAPPED | int(address)
+    return int(address)
+
+
+class GeoIPDatabase:
+    """Read-only view over a range database file"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.version = file_version(os.fstat(f.fileno()))
+        magic, version, self.range_count, self.location_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f'{self.path} is not a GeoIP range database (version {VERSION}).')
+        self._ranges_at = HEADER.size
+        self._offsets_at = self._ranges_at + self.range_count * RANGE.size
+        self._blob_at = self._offsets_at + (self.location_count + 1) * OFFSET.size
+
+    def close(self):
+        self._mm.close()
+
+    def _start(self, index):
+        offset = self._ranges_at + index * RANGE.size
+        return int.from_bytes(self._mm[offset:offset + 16], 'big')
+
+    def _location(self, index):
+        start, end = struct.unpack_from('<II', self._mm, self._offsets_at + index * OFFSET.size)
+        country, _, city = self._mm[self._blob_at + start:self._blob_at + end].decode().partition('\0')
+        return country, city
+
+    def lookup(self, ip):
+        """Return (country, city) for an address, or ('', '') when unknown"""
+        try:
+            key = address_to_int(ip)
+        except ValueError:
+            return EMPTY
+
+        # Rightmost range whose first address is <= key
+        lo, hi = 0, self.range_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._start(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return EMPTY
+
+        _, last, location = RANGE.unpack_from(self._mm, self._ranges_at + (lo - 1) * RANGE.size)
+        if key > int.from_bytes(last, 'big'):
+            return EMPTY
+        return self._location(location)
+
+
+def build_database(csv_path, output_path):
+    """
+    Convert a CSV of ranges into a database file; returns the range count.
+
+    Columns: first address, last address, country, city (header optional).
+    Addresses may be dotted/colon notation or plain integers (IPv4).
+    Ranges must not overlap; lookups return the range with the greatest
+    first address at or below the queried address.
+    """
+    ranges = []
+    locations = {}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or not row[0].strip():
+                continue
+            try:
+                first, last = (
+                    IPV4_MAPPED | int(value) if value.strip().isdigit() else address_to_int(value)
+                    for value in row[:2]
+                )
+            except ValueError:
+                # Header line or malformed row
+                continue
+            if last < first:
+                first, last = last, first
+            location = (row[2].strip(), row[3].strip() if len(row) > 3 else '')
+            index = locations.setdefault(location, len(locations))
+            ranges.append((first, last, index))
+
+    ranges.sort()
+
+    blob = bytearray()
+    offsets = [0]
+    for country, city in locations:
+        blob += f'{country}\0{city}'.encode()
+        offsets.append(len(blob))
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.geoip-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, VERSION, len(ranges), len(locations)))
+            for first, last, index in ranges:
+                out.write(RANGE.pack(first.to_bytes(16, 'big'), last.to_bytes(16, 'big'), index))
+            for offset in offsets:
+                out.write(OFFSET.pack(offset))
+            out.write(blob)
+        os.chmod(tmp_path, 0o644)
+        # Atomic swap: running workers keep their mapping of the old inode
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(ranges)
+
+
+# Process-wide database, reopened when an import replaces the file
+_database = None
+_checked_at = 0.0
+_database_lock = threading.Lock()
+REOPEN_CHECK_SECONDS = 1.0
+
+
+def get_database():
+    """Process-wide database, or None when GEOIP_DATABASE is missing"""
+    global _database, _checked_at
+    path = settings.GEOIP_DATABASE
+    if not path:
+        return None
+
+    now = time.monotonic()
+    if _database is not None and now - _checked_at < REOPEN_CHECK_SECONDS:
+        return _database
+
+    with _database_lock:
+        _checked_at = now
+        try:
+            version = file_version(os.stat(path))
+        except OSError:
+            return None
+        if _database is None or _database.version != version:
+            # Lookups still using the old mapping keep a reference to it
+            _database = GeoIPDatabase(path)
+            _lookup.cache_clear()
+        return _database
+
+
+def reload():
+    """Drop the open database and cached lookups (e.g. after an import)"""
+    global _database
+    with _database_lock:
+        if _database is not None:
+            _database.close()
+        _database = None
+    _lookup.cache_clear()
+
+
+def lookup(ip):
+    """(country, city) for an address; ('', '') if unknown"""
+    if not ip:
+        return EMPTY
+    database = get_database()
+    if database is None:
+        # Not cached: lookups resume as soon as a database is imported
+        return EMPTY
+    return _lookup(database, ip)
+
+
+@lru_cache(maxsize=settings.GEOIP_CACHE_SIZE)
+def _lookup(database, ip):
+    # Keyed by database so a reopened file never serves the old answers
+    return database.lookup(ip)
@@ -0,0 +1,209 @@
+"""
+Bulk import of links from CSV
+
+Columns (by header): url, alias, title, owner, expires_at; only url is
+required. Rows are streamed and handled in chunks, each costing the same
+few queries however many rows it holds: one each for the chunk's owners
+and aliases, one per round of short codes drawn (rarely more than one),
+one bulk INSERT, one to see which rows went in and one to bump the
+owners' links versions. Each chunk commits on its own and is then
+recorded in the checkpoint file, so an interrupted import resumes after
+the last committed chunk.
+"""
+import csv
+import json
+import os
+import tempfile
+from datetime import datetime, time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Link
+
+COLUMNS = ('url', 'alias', 'title', 'owner', 'expires_at')
+
+URL_MAX_LENGTH = Link._meta.get_field('original_url').max_length
+ALIAS_MAX_LENGTH = Link._meta.get_field('custom_alias').max_length
+TITLE_MAX_LENGTH = Link._meta.get_field('title').max_length
+
+validate_url = URLValidator()
+
+
+class RowError(ValueError):
+    """A CSV row that cannot be imported"""
+
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+
+
+def read_rows(path, skip=0):
+    """Yield (line number, {column: value}) for the rows of a CSV file after the first skip"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None or 'url' not in reader.fieldnames:
+            raise ValueError(f'{path} has no url column (header: {", ".join(reader.fieldnames or [])}).')
+        for row in islice(reader, skip, None):
+            yield reader.line_num, {column: (row.get(column) or '').strip() for column in COLUMNS}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def load_checkpoint(path):
+    """Rows already imported according to a checkpoint file (0 if there is none)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['rows']
+    except FileNotFoundError:
+        return 0
+
+
+def save_checkpoint(path, rows):
+    # Replaced atomically: an interruption leaves the previous checkpoint
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.import-links-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as out:
+        json.dump({'rows': rows}, out)
+    os.replace(tmp_path, path)
+
+
+def parse_expiry(value):
+    """ISO date or datetime; naive values are in the current time zone"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid expiry date: {value}')
+        moment = datetime.combine(day, time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def owners_by_name(names):
+    """{username or email: user id} for the given owner names (one query)"""
+    if not names:
+        return {}
+    owners = {}
+    users = get_user_model().objects.filter(Q(username__in=names) | Q(email__in=names))
+    for pk, username, email in users.values_list('pk', 'username', 'email'):
+        owners[username] = pk
+        # A username wins over another account's email
+        if email:
+            owners.setdefault(email, pk)
+    return owners
+
+
+def _short_codes(count):
+    """count short codes not used by any link (one query per round)"""
+    codes = set()
+    while len(codes) < count:
+        drawn = {Link.generate_short_code() for _ in range(count - len(codes))} - codes
+        taken = set(Link.all_objects.filter(short_code__in=drawn).values_list('short_code', flat=True))
+        codes |= drawn - taken
+    return list(codes)
+
+
+# What tells an imported link from another created with the same code meanwhile
+IDENTITY = ('short_code', 'custom_alias', 'url_digest', 'user_id')
+
+
+def _identity(link):
+    return tuple(getattr(link, field) for field in IDENTITY)
+
+
+def _build(rows, default_owner):
+    """Validate rows; returns ([(line, Link)], [RowError])"""
+    errors = []
+    names = {row['owner'] for _, row in rows if row['owner']}
+    owners = owners_by_name(names)
+    aliases = {row['alias'].lower() for _, row in rows if row['alias']}
+    taken = set(Link.all_objects.filter(custom_alias__in=aliases).values_list('custom_alias', flat=True))
+
+    links = []
+    for line, row in rows:
+        try:
+            url = row['url']
+            if not url:
+                raise ValueError('URL is required.')
+            if len(url) > URL_MAX_LENGTH:
+                raise ValueError(f'URL is longer than {URL_MAX_LENGTH} characters.')
+            try:
+                validate_url(url)
+            except ValidationError:
+                raise ValueError(f'Invalid URL: {url}')
+
+            alias = row['alias'].lower() or None
+            if alias is not None:
+                if alias in taken:
+                    raise ValueError(f'Alias is already taken: {alias}')
+                if not 3 <= len(alias) <= ALIAS_MAX_LENGTH:
+                    raise ValueError(f'Alias must be 3 to {ALIAS_MAX_LENGTH} characters: {alias}')
+                # Later rows with the same alias are rejected
+                taken.add(alias)
+
+            if len(row['title']) > TITLE_MAX_LENGTH:
+                raise ValueError(f'Title is longer than {TITLE_MAX_LENGTH} characters.')
+
+            owner_id = default_owner
+            if row['owner']:
+                owner_id = owners.get(row['owner'])
+                if owner_id is None:
+                    raise ValueError(f'Unknown owner: {row["owner"]}')
+
+            expires_at = parse_expiry(row['expires_at']) if row['expires_at'] else None
+        except ValueError as exc:
+            errors.append(RowError(line, str(exc)))
+            continue
+
+        links.append((line, Link(
+            original_url=url,
+            url_digest=Link.digest_url(url),
+            custom_alias=alias,
+            title=row['title'],
+            user_id=owner_id,
+            expires_at=expires_at,
+        )))
+    return links, errors
+
+
+def import_chunk(rows, default_owner=None):
+    """
+    Import one chunk of read_rows() output in a transaction; returns
+    (links created, [RowError]), the errors including rows that lost
+    their alias to a link created meanwhile.
+    """
+    links, errors = _build(rows, default_owner)
+    if not links:
+        return 0, errors
+
+    for (_, link), code in zip(links, _short_codes(len(links))):
+        link.short_code = code
+    codes = [link.short_code for _, link in links]
+
+    with transaction.atomic():
+        # Not Link.save(): new codes have no cached redirects to invalidate
+        Link.objects.bulk_create([link for _, link in links], ignore_conflicts=True)
+        # A row only lost a conflict if its code now belongs to another link
+        created = set(Link.all_objects.filter(short_code__in=codes).values_list(*IDENTITY))
+        inserted = [link for _, link in links if _identity(link) in created]
+        owner_ids = {link.user_id for link in inserted if link.user_id is not None}
+        # Owners' dashboards and listings revalidate (shortener.conditional)
+        get_user_model().objects.filter(pk__in=owner_ids).update(links_version=F('links_version') + 1)
+
+    for line, link in links:
+        if _identity(link) not in created:
+            errors.append(RowError(line, f'Conflicts with a link created meanwhile (alias {link.custom_alias}).'))
+    errors.sort(key=lambda error: error.line)
+    return len(inserted), errors
@@ -0,0 +1,371 @@
+"""
+Shared-memory link resolution table
+
+An mmap-backed open-addressing hash table mapping short codes and aliases to
+(link id, URL, flags, expiry), shared by every worker on a host through the
+page cache. Built by `manage.py snapshot_link_table` and patched in place when
+links change; optional (enabled by settings.LINK_TABLE_PATH).
+
+Only for single-host deployments: a change is patched into the file by the
+process that saved it, which every process mapping that file sees, but the
+copies on other hosts would keep serving the old destination.
+
+Layout (little-endian):
+
+    header  8s magic, I version, I reserved, Q capacity, Q entries,
+            Q heap size, Q heap used, Q generation           (64 bytes)
+    slots   capacity x (B key length, 50s key, B flags, q link id,
+            q expires epoch or 0, Q URL offset, I URL length)
+    heap    UTF-8 destination URLs
+
+Writers hold an flock on "<path>.lock" and bump the generation counter to an
+odd value while writing and back to even when done (a seqlock); readers
+retry when it changed under them. A miss always falls back to the database,
+so a full table only degrades to the regular cache path.
+"""
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from .sketches import hash64
+
+
+MAGIC = b'LINKTBL1'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQQQ')
+HEADER_SIZE = 64
+GENERATION_OFFSET = 48
+GENERATION = struct.Struct('<Q')
+
+KEY_SIZE = 50
+SLOT = struct.Struct(f'<B{KEY_SIZE}sBqqQI')
+RECORD = struct.Struct('<BqqQI')  # flags .. URL length, right after the key
+RECORD_OFFSET = 1 + KEY_SIZE
+
+FLAG_ACTIVE = 0x01
+FLAG_TOMBSTONE = 0x02
+
+MAX_LOAD = 0.75
+READ_RETRIES = 8
+
+
+class TableFull(Exception):
+    """No free slot or heap space left; a fresh snapshot is needed"""
+
+
+def _next_power_of_two(n):
+    return 1 << max(4, (n - 1).bit_length())
+
+
+def _row_entries(row):
+    """(key bytes, link id, URL bytes, flags, expires) for each code of a link row"""
+    expires = row['expires_at']
+    expires = int(expires.timestamp()) if expires else 0
+    flags = FLAG_ACTIVE if row['is_active'] else 0
+    url = row['original_url'].encode()
+    for code in (row['short_code'], row['custom_alias']):
+        if code:
+            key = code.encode()
+            if len(key) <= KEY_SIZE:
+                yield key, row['id'], url, flags, expires
+
+
+class LinkTable:
+    """View over a table file; writable views must hold the writer lock"""
+
+    def __init__(self, path, writable=False):
+        import mmap
+
+        self.path = str(path)
+        self._file = open(self.path, 'r+b' if writable else 'rb')
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=access)
+        self.inode = os.fstat(self._file.fileno()).st_ino
+
+        magic, version, _, self.capacity, _, self.heap_size, _, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{self.path} is not a link table (version {VERSION}).')
+        self._mask = self.capacity - 1
+        self._heap_at = HEADER_SIZE + self.capacity * SLOT.size
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    @property
+    def entries(self):
+        return HEADER.unpack_from(self._mm, 0)[4]
+
+    @property
+    def heap_used(self):
+        return HEADER.unpack_from(self._mm, 0)[6]
+
+    # Reading
+
+    def _find(self, key):
+        """Slot offset holding key (tombstoned or not), or None"""
+        mm = self._mm
+        index = hash64(key) & self._mask
+        length = len(key)
+        for _ in range(self.capacity):
+            offset = HEADER_SIZE + index * SLOT.size
+            stored = mm[offset]
+            if stored == 0:
+                return None
+            if stored == length and mm[offset + 1:offset + 1 + length] == key:
+                return offset
+            index = (index + 1) & self._mask
+        return None
+
+    def lookup(self, code):
+        """
+        Return (link id, URL, is active, expires epoch or None), or None on a
+        miss or a deleted code.
+        """
+        key = code.encode()
+        if not key or len(key) > KEY_SIZE:
+            return None
+        mm = self._mm
+        for _ in range(READ_RETRIES):
+            before = GENERATION.unpack_from(mm, GENERATION_OFFSET)[0]
+            if before & 1:
+                continue
+            offset = self._find(key)
+            result = None
+            if offset is not None:
+                flags, link_id, expires, url_offset, url_length = RECORD.unpack_from(mm, offset + RECORD_OFFSET)
+                if not flags & FLAG_TOMBSTONE:
+                    start = self._heap_at + url_offset
+                    result = (
+                        link_id,
+                        mm[start:start + url_length].decode(),
+                        bool(flags & FLAG_ACTIVE),
+                        expires or None,
+                    )
+            if GENERATION.unpack_from(mm, GENERATION_OFFSET)[0] == before:
+                return result
+        return None
+
+    # Writing (caller holds the lock)
+
+    def _begin(self):
+        generation = GENERATION.unpack_from(self._mm, GENERATION_OFFSET)[0]
+        GENERATION.pack_into(self._mm, GENERATION_OFFSET, generation | 1)
+
+    def _end(self):
+        generation = GENERATION.unpack_from(self._mm, GENERATION_OFFSET)[0]
+        GENERATION.pack_into(self._mm, GENERATION_OFFSET, (generation | 1) + 1)
+
+    def _set_counts(self, entries, heap_used):
+        header = list(HEADER.unpack_from(self._mm, 0))
+        header[4], header[6] = entries, heap_used
+        HEADER.pack_into(self._mm, 0, *header)
+
+    def upsert(self, key, link_id, url, flags, expires):
+        """Insert or replace the record for key; raises TableFull"""
+        mm = self._mm
+        offset = self._find(key)
+        entries, heap_used = self.entries, self.heap_used
+
+        url_offset = None
+        append = False
+        if offset is not None:
+            _, _, _, old_offset, old_length = RECORD.unpack_from(mm, offset + RECORD_OFFSET)
+            start = self._heap_at + old_offset
+            if mm[start:start + old_length] == url:
+                url_offset = old_offset
+        else:
+            if entries + 1 > self.capacity * MAX_LOAD:
+                raise TableFull('link table load factor exceeded')
+            index = hash64(key) & self._mask
+            while mm[HEADER_SIZE + index * SLOT.size] != 0:
+                index = (index + 1) & self._mask
+            offset = HEADER_SIZE + index * SLOT.size
+            entries += 1
+
+        if url_offset is None:
+            if heap_used + len(url) > self.heap_size:
+                raise TableFull('link table URL heap exhausted')
+            url_offset = heap_used
+            heap_used += len(url)
+            append = True
+
+        self._begin()
+        try:
+            if append:
+                start = self._heap_at + url_offset
+                mm[start:start + len(url)] = url
+            SLOT.pack_into(mm, offset, len(key), key, flags, link_id, expires, url_offset, len(url))
+            self._set_counts(entries, heap_used)
+        finally:
+            self._end()
+
+    def remove(self, key):
+        """Tombstone key so lookups fall back to the database"""
+        offset = self._find(key)
+        if offset is None:
+            return
+        self._begin()
+        try:
+            flags = self._mm[offset + RECORD_OFFSET]
+            self._mm[offset + RECORD_OFFSET] = flags | FLAG_TOMBSTONE
+        finally:
+            self._end()
+
+    # Building
+
+    @classmethod
+    def build(cls, path, rows, load_factor=0.5, heap_slack=0.25, min_slack=1 << 20):
+        """Write a fresh table for link rows and swap it in atomically"""
+        entries = {}
+        aliases = set()
+        for row in rows:
+            alias = row['custom_alias'].encode() if row['custom_alias'] else None
+            for entry in _row_entries(row):
+                key = entry[0]
+                # A custom alias wins over another link's short code with the same value
+                if key in aliases and key != alias:
+                    continue
+                if key == alias:
+                    aliases.add(key)
+                entries[key] = entry
+        entries = list(entries.values())
+        capacity = _next_power_of_two(int(len(entries) / load_factor) + 1)
+        heap_needed = sum(len(entry[2]) for entry in entries)
+        heap_size = heap_needed + max(min_slack, int(heap_needed * heap_slack))
+
+        heap_at = HEADER_SIZE + capacity * SLOT.size
+        buffer = bytearray(heap_at + heap_size)
+        mask = capacity - 1
+        heap_used = 0
+        for key, link_id, url, flags, expires in entries:
+            index = hash64(key) & mask
+            while True:
+                offset = HEADER_SIZE + index * SLOT.size
+                if buffer[offset] == 0:
+                    break
+                index = (index + 1) & mask
+            buffer[heap_at + heap_used:heap_at + heap_used + len(url)] = url
+            SLOT.pack_into(buffer, offset, len(key), key, flags, link_id, expires, heap_used, len(url))
+            heap_used += len(url)
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, 0, capacity, len(entries), heap_size, heap_used, 0)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.linktable-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(buffer)
+            os.chmod(tmp_path, 0o644)
+            with writer_lock(path):
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return {'entries': len(entries), 'capacity': capacity, 'heap_used': heap_used, 'heap_size': heap_size}
+
+
+class writer_lock:
+    """Exclusive cross-process lock for table writers (POSIX flock)"""
+
+    def __init__(self, path):
+        self.lock_path = f'{path}.lock'
+
+    def __enter__(self):
+        import fcntl
+
+        self._file = open(self.lock_path, 'a')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        import fcntl
+
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+# Process-wide reader, reopened when a new snapshot replaces the file
+_reader = None
+_checked_at = 0.0
+_reader_lock = threading.Lock()
+REOPEN_CHECK_SECONDS = 1.0
+
+
+def get_table():
+    """Reader for settings.LINK_TABLE_PATH, or None when disabled/missing"""
+    global _reader, _checked_at
+    path = settings.LINK_TABLE_PATH
+    if not path:
+        return None
+
+    now = time.monotonic()
+    if _reader is not None and now - _checked_at < REOPEN_CHECK_SECONDS:
+        return _reader
+
+    with _reader_lock:
+        _checked_at = now
+        try:
+            inode = os.stat(path).st_ino
+        except OSError:
+            return None
+        if _reader is None or _reader.inode != inode:
+            old, _reader = _reader, LinkTable(path)
+            # Readers still using the old mapping keep a reference to it
+            del old
+        return _reader
+
+
+def lookup(code):
+    table = get_table()
+    if table is None:
+        return None
+    return table.lookup(code)
+
+
+def apply_link_change(row, stale_codes=()):
+    """
+    Patch the shared table after a link was saved (row is a values() dict)
+    or deleted (row is None). Codes that cannot be written are tombstoned so
+    they fall back to the database.
+    """
+    path = settings.LINK_TABLE_PATH
+    if not path or not os.path.exists(path):
+        return
+    try:
+        _apply(path, row, stale_codes)
+    except (OSError, ValueError):
+        # Unpatchable table: drop it so every worker falls back to the cache/DB
+        # until the next snapshot instead of serving stale destinations
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _apply(path, row, stale_codes):
+    with writer_lock(path):
+        table = LinkTable(path, writable=True)
+        try:
+            current = set()
+            if row is not None:
+                owner = table.lookup(row['short_code'])
+                for key, link_id, url, flags, expires in _row_entries(row):
+                    current.add(key)
+                    # Another link's custom alias keeps its entry over this short code
+                    if key == row['short_code'].encode() and owner is not None and owner[0] != link_id:
+                        continue
+                    try:
+                        table.upsert(key, link_id, url, flags, expires)
+                    except TableFull:
+                        table.remove(key)
+            for code in stale_codes:
+                if code and code.encode() not in current:
+                    table.remove(code.encode())
+        finally:
+            table.close()
@@ -0,0 +1,158 @@
+"""
+Incremental click reads for live dashboards
+
+A cursor is the id of the newest click a client has seen. Click ids only
+grow on a link's shard, so "what happened since" is a range of the
+(link, id) index however many clicks came before it. Repeats folded into
+an existing click (shortener.dedup) bump its hits without moving the cursor.
+"""
+import json
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .dimensions import Browser, DeviceType, OperatingSystem, label_of
+from .models import Click, Link
+
+
+def parse_cursor(value):
+    """Cursor from a query parameter or Last-Event-ID header (ValueError if malformed)"""
+    cursor = int(value)
+    if cursor < 0:
+        raise ValueError(f'Invalid cursor: {value}')
+    return cursor
+
+
+def cursor(link_id):
+    """Cursor of a link's newest click (0 before its first)"""
+    clicks = Click.objects.for_link(link_id).filter(link_id=link_id)
+    return clicks.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def _after(link_id, cursor, limit):
+    return Click.objects.for_link(link_id).filter(link_id=link_id, pk__gt=cursor).order_by('pk')[:limit]
+
+
+def clicks_since(link_id, cursor, limit):
+    """([click event, ...], new cursor) for up to limit clicks after cursor, oldest first"""
+    rows = list(_after(link_id, cursor, limit).values_list(
+        'pk', 'clicked_at', 'hits', 'device_type', 'browser', 'os', 'country', 'city',
+    ))
+    events = [
+        {
+            'id': pk,
+            'clicked_at': clicked_at,
+            'hits': hits,
+            'device_type': label_of(DeviceType, device_type),
+            'browser': label_of(Browser, browser),
+            'os': label_of(OperatingSystem, os_name),
+            'country': country,
+            'city': city,
+        }
+        for pk, clicked_at, hits, device_type, browser, os_name, country, city in rows
+    ]
+    return events, rows[-1][0] if rows else cursor
+
+
+def delta(link_id, cursor, limit=None):
+    """
+    What changed after cursor: new clicks and hits, and their breakdowns
+    shaped like the stats top lists. At most limit clicks are read; 'more'
+    says to ask again from the returned cursor.
+    """
+    limit = limit or settings.CLICK_DELTA_MAX_CLICKS
+    rows = list(_after(link_id, cursor, limit).values_list('pk', 'hits', 'browser', 'device_type', 'country'))
+    browsers, devices, countries = Counter(), Counter(), Counter()
+    for _, _, browser, device_type, country in rows:
+        browsers[label_of(Browser, browser)] += 1
+        devices[label_of(DeviceType, device_type)] += 1
+        countries[country] += 1
+    # Unknown values are left out, as in the stats top lists
+    for counter in (browsers, devices, countries):
+        counter.pop('', None)
+    return {
+        'since': str(cursor),
+        'cursor': str(rows[-1][0] if rows else cursor),
+        'more': len(rows) == limit,
+        'new_clicks': len(rows),
+        'new_hits': sum(row[1] for row in rows),
+        'browsers': [{'browser': value, 'count': count} for value, count in browsers.most_common()],
+        'devices': [{'device_type': value, 'count': count} for value, count in devices.most_common()],
+        'countries': [{'country': value, 'count': count} for value, count in countries.most_common()],
+    }
+
+
+def event(name, data, event_id=None):
+    """One Server-Sent Events message"""
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+def event_stream(link_id, cursor):
+    """
+    Server-Sent Events for a link: a 'clicks' event whenever clicks arrive or
+    its counters move, keep-alive comments in between. Each event's id is
+    its cursor, so when the stream ends (after CLICK_STREAM_SECONDS)
+    EventSource reconnects with Last-Event-ID and misses nothing.
+    """
+    yield f'retry: {settings.CLICK_STREAM_POLL_SECONDS * 1000}\n\n'
+    deadline = time.monotonic() + settings.CLICK_STREAM_SECONDS
+    counters = None
+    while True:
+        events, cursor = clicks_since(link_id, cursor, settings.CLICK_STREAM_BATCH_SIZE)
+        totals = Link.objects.filter(pk=link_id).values('clicks_count', 'bot_clicks').first()
+        if totals is None:
+            yield event('deleted', {'id': link_id})
+            return
+        if events or totals != counters:
+            counters = totals
+            yield event('clicks', {'clicks': events, **totals}, event_id=cursor)
+        else:
+            yield ': keep-alive\n\n'
+        if time.monotonic() >= deadline:
+            return
+        # A full batch means more are waiting
+        if len(events) < settings.CLICK_STREAM_BATCH_SIZE:
+            time.sleep(settings.CLICK_STREAM_POLL_SECONDS)
+
+
+# Streams open in this process
+_open_streams = 0
+_streams_lock = threading.Lock()
+
+
+class _Slot:
+    """An event stream holding one of the process's stream slots until closed"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._closed = False
+
+    def __iter__(self):
+        return self._stream
+
+    def close(self):
+        # Called by the response, whether or not the stream was read
+        global _open_streams
+        with _streams_lock:
+            if self._closed:
+                return
+            self._closed = True
+            _open_streams -= 1
+        self._stream.close()
+
+
+def open_stream(link_id, cursor):
+    """
+    event_stream() in one of the CLICK_STREAM_MAX_STREAMS slots of this
+    process, or None when they are all taken
+    """
+    global _open_streams
+    with _streams_lock:
+        if _open_streams >= settings.CLICK_STREAM_MAX_STREAMS:
+            return None
+        _open_streams += 1
+    return _Slot(event_stream(link_id, cursor))
@@ -0,0 +1,74 @@
+"""
+Move clicks from closed months into the columnar click archive
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from shortener import archive, sharding
+from shortener.models import Click
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive clicks from UTC months that ended more than --days ago into '
+        'per-link, per-month columnar files (settings.CLICK_ARCHIVE_DIR), '
+        'deleting them from the clicks table once written. Rollups and '
+        'heavy-hitter sketches are kept; rebuilds read the archive too. '
+        'Safe to rerun after an interruption.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CLICK_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1.')
+        if not archive.numpy_available():
+            raise CommandError('The click archive needs NumPy: pip install -r requirements-archive.txt')
+
+        # Whole months only, so archived months are never appended to again
+        edge = timezone.now() - timedelta(days=options['days'])
+        cutoff = datetime(edge.year, edge.month, 1, tzinfo=dt_timezone.utc)
+        previous = archive.horizon()
+        if previous is None or previous < int(cutoff.timestamp()):
+            archive.set_horizon(int(cutoff.timestamp()))
+
+        archived = 0
+        links = 0
+        for alias, _ in sharding.partition():
+            alias = alias or DEFAULT_DB_ALIAS
+            cold = Click.objects.using(alias).filter(clicked_at__lt=cutoff)
+            link_ids = cold.order_by().values_list('link_id', flat=True).distinct()
+            for link_id in list(link_ids):
+                archived += self.archive_link(cold.filter(link_id=link_id), link_id, options['batch_size'])
+                links += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} clicks of {links} links from before {cutoff:%Y-%m-%d}.'
+        ))
+
+    def archive_link(self, clicks, link_id, batch_size):
+        """Archive one link's cold clicks, a month at a time"""
+        archived = 0
+        while True:
+            first = clicks.order_by('clicked_at').values_list('clicked_at', flat=True).first()
+            if first is None:
+                return archived
+            start = datetime(first.year, first.month, 1, tzinfo=dt_timezone.utc)
+            end = (start + timedelta(days=32)).replace(day=1)
+
+            # The month's file is rewritten whole, so its rows are read whole
+            month = clicks.filter(clicked_at__gte=start, clicked_at__lt=end)
+            rows = list(month.order_by('clicked_at').values_list(*archive.CLICK_FIELDS).iterator(chunk_size=batch_size))
+            archive.append(link_id, start.strftime('%Y-%m'), rows)
+
+            # Only delete once the file holding the rows is in place
+            ids = [row[0] for row in rows]
+            for offset in range(0, len(ids), batch_size):
+                month.filter(pk__in=ids[offset:offset + batch_size]).delete()
+            archived += len(rows)
@@ -0,0 +1,71 @@
+"""
+Fill in country/city for historical clicks from the GeoIP database
+"""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from shortener import geoip, sharding
+from shortener.models import Click, LinkHeavyHitters
+
+
+class Command(BaseCommand):
+    help = 'Geolocate stored clicks that have no country yet, in keyset-ordered batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--all', action='store_true',
+                            help='Re-resolve every click, not only those without a country.')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Skip rebuilding country sketches of the touched links.')
+
+    def handle(self, *args, **options):
+        if geoip.get_database() is None:
+            raise CommandError('GeoIP database not found; run import_geoip first.')
+
+        updated = 0
+        touched_links = set()
+        for alias, _ in sharding.partition():
+            updated += self.backfill(alias or DEFAULT_DB_ALIAS, touched_links, options)
+
+        if touched_links and not options['no_rebuild']:
+            LinkHeavyHitters.flush()
+            LinkHeavyHitters.rebuild(link_ids=sorted(touched_links))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Geolocated {updated} clicks across {len(touched_links)} links.'
+        ))
+
+    def backfill(self, alias, touched_links, options):
+        """Geolocate the clicks stored on one database; returns the update count"""
+        clicks = Click.objects.using(alias).exclude(ip_address=None)
+        if not options['all']:
+            clicks = clicks.filter(country='')
+
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(
+                clicks.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'link_id', 'ip_address')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            # One UPDATE per distinct location in the batch
+            by_location = defaultdict(list)
+            for click_id, link_id, ip in batch:
+                country, city = geoip.lookup(ip)
+                if country or city:
+                    by_location[(country[:100], city[:100])].append(click_id)
+                    touched_links.add(link_id)
+            for (country, city), ids in by_location.items():
+                updated += Click.objects.using(alias).filter(id__in=ids).update(country=country, city=city)
+
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {alias}: up to click {last_id}: {updated} updated')
+        return updated
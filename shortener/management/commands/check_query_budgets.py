@@ -0,0 +1,259 @@
+"""
+Query-count and query-plan regression harness for every view
+"""
+import re
+from contextlib import ExitStack
+from importlib import import_module
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import URLResolver, reverse
+
+from shortener.models import LinkHeavyHitters
+from shortener.seeding import seed_dataset
+
+
+# URL configurations whose every named route must have a budget below
+BUDGETED_URLCONFS = ['shortener.urls', 'api.urls', 'accounts.urls']
+
+# Tables on which a full scan fails the run
+GUARDED_TABLES = ['clicks', 'links']
+
+# One entry per request to replay against the seeded dataset.
+#   auth: None (anonymous), 'session' (logged in owner), 'bearer' (owner API key),
+#         'session+bearer' (both), 'admin'
+#   args: 'code' / 'pk' of the hottest seeded link, passed to reverse()
+#   allow_scans: guarded tables this request may still scan in full (known debt)
+#   revalidate: replay with the ETag of a first (uncounted) response; must be a 304
+BUDGETS = [
+    {'name': 'robots_txt', 'max_queries': 0},
+    {'name': 'sitemap_xml', 'max_queries': 0},
+    # Site-wide totals: known full scans
+    {'name': 'home', 'max_queries': 2, 'allow_scans': ['clicks', 'links']},
+    {'name': 'dashboard', 'auth': 'session', 'max_queries': 8},
+    # Session, user, then Max(last_clicked_at) over the owner's links
+    {'name': 'dashboard', 'auth': 'session', 'revalidate': True, 'max_queries': 3},
+    {'name': 'links_list', 'auth': 'session', 'max_queries': 3},
+    {'name': 'create_link', 'auth': 'session', 'max_queries': 2},
+    {'name': 'link_detail', 'auth': 'session', 'args': 'code', 'max_queries': 10},
+    {'name': 'link_detail', 'auth': 'session', 'args': 'code', 'revalidate': True, 'max_queries': 3},
+    {'name': 'delete_link', 'auth': 'session', 'args': 'code', 'max_queries': 3},
+    {'name': 'redirect_link', 'args': 'code', 'max_queries': 7},
+    {'name': 'signup', 'max_queries': 0},
+    {'name': 'login', 'max_queries': 0},
+    {'name': 'logout', 'auth': 'session', 'max_queries': 4},
+    {'name': 'profile', 'auth': 'session', 'max_queries': 3},
+    {'name': 'generate_api_key', 'auth': 'session', 'method': 'post', 'max_queries': 3},
+    {'name': 'api-root', 'max_queries': 0},
+    {'name': 'link-list', 'auth': 'bearer', 'max_queries': 4},
+    {'name': 'link-list', 'auth': 'bearer', 'revalidate': True, 'max_queries': 2},
+    {'name': 'link-list', 'auth': 'bearer', 'method': 'post', 'max_queries': 3,
+     'data': {'original_url': 'https://example.com/query-budget'}},
+    {'name': 'link-detail', 'auth': 'bearer', 'args': 'pk', 'max_queries': 3},
+    {'name': 'link-detail', 'auth': 'bearer', 'args': 'pk', 'revalidate': True, 'max_queries': 2},
+    {'name': 'link-stats', 'auth': 'bearer', 'args': 'pk', 'max_queries': 9},
+    {'name': 'link-stats', 'auth': 'bearer', 'args': 'pk', 'revalidate': True, 'max_queries': 2},
+    {'name': 'link-qr', 'auth': 'bearer', 'args': 'pk', 'max_queries': 2},
+    {'name': 'link-timeseries', 'auth': 'bearer', 'args': 'pk', 'max_queries': 3},
+    # Until the stream is read: the events run their own polls
+    {'name': 'link-clicks-stream', 'auth': 'bearer', 'args': 'pk', 'max_queries': 3},
+    # Every seeded link id; the owner's are answered, the rest are not_found
+    {'name': 'link-stats-batch', 'auth': 'bearer', 'method': 'post', 'max_queries': 5,
+     'data': {'ids': list(range(1, 301))}},
+    # A key alone does not pass the default IsAuthenticatedOrReadOnly (401)
+    {'name': 'api_shorten', 'auth': 'bearer', 'method': 'post', 'max_queries': 0,
+     'data': {'url': 'https://example.com/query-budget'}},
+    # Session and user rows, then the key lookup
+    {'name': 'api_shorten', 'auth': 'session+bearer', 'method': 'post', 'max_queries': 5,
+     'data': {'url': 'https://example.com/query-budget/shorten', 'reuse': False}},
+    # Digest lookup of the link created above
+    {'name': 'api_shorten', 'auth': 'session+bearer', 'method': 'post', 'max_queries': 4,
+     'data': {'url': 'https://example.com/query-budget/shorten', 'reuse': True}},
+    {'name': 'api_user_stats', 'auth': 'session', 'max_queries': 8},
+    # Session, user, then Max(last_clicked_at) over the owner's links
+    {'name': 'api_user_stats', 'auth': 'session', 'revalidate': True, 'max_queries': 3},
+    {'name': 'admin:shortener_link_changelist', 'auth': 'admin', 'max_queries': 7},
+    {'name': 'admin:shortener_click_changelist', 'auth': 'admin', 'max_queries': 7},
+]
+
+SCAN_PATTERNS = {
+    'sqlite': r'^SCAN (?:TABLE )?"?{table}"?\b',
+    'postgresql': r'Seq Scan on "?{table}"?\b',
+    'mysql': r'^ALL$',
+}
+
+# SQLite reports ordered index walks as scans; under a LIMIT they stop early,
+# but only when the index yields the ORDER BY (no temporary sort in the plan)
+SQLITE_LIMITED_WALK = r'^SCAN (?:TABLE )?"?{table}"? USING (?:COVERING )?INDEX\b'
+SQLITE_SORT = r'^USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST \d+ TERMS OF )?ORDER BY$'
+
+
+def named_routes(urlconf):
+    """Yield every route name defined by a URL configuration module"""
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns)
+            elif pattern.name:
+                yield pattern.name
+
+    yield from walk(import_module(urlconf).urlpatterns)
+
+
+def explain(sql):
+    """Return the plan lines for a captured SELECT on the default connection"""
+    vendor = connection.vendor
+    prefix = 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        rows = cursor.fetchall()
+    if vendor == 'sqlite':
+        return [row[-1] for row in rows]
+    if vendor == 'mysql':
+        # (id, select_type, table, partitions, type, ...) - report "table: type"
+        return [f'{row[2]}: {row[4]}' for row in rows]
+    return [row[0] for row in rows]
+
+
+def full_scans(plan, tables, limited=False):
+    """Return the guarded tables that a plan scans in full (limited: the query has a LIMIT and an ORDER BY)"""
+    vendor = connection.vendor
+    found = set()
+    if limited and vendor == 'sqlite':
+        limited = not any(re.search(SQLITE_SORT, line.strip()) for line in plan)
+    for line in plan:
+        for table in tables:
+            if vendor == 'mysql':
+                name, _, access = line.partition(': ')
+                if name == table and access == 'ALL':
+                    found.add(table)
+            elif limited and vendor == 'sqlite' and re.search(SQLITE_LIMITED_WALK.format(table=table), line.strip()):
+                continue
+            elif re.search(SCAN_PATTERNS.get(vendor, SCAN_PATTERNS['postgresql']).format(table=table), line.strip()):
+                found.add(table)
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay every view in shortener, api and accounts against a seeded test '
+        'database and fail when a view exceeds its query budget or fully scans '
+        'the clicks/links tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--links', type=int, default=300, help='Seeded links.')
+        parser.add_argument('--clicks', type=int, default=5000, help='Seeded clicks.')
+        parser.add_argument('--explain', action='store_true', help='Print the EXPLAIN output of captured SELECTs.')
+        parser.add_argument('--show-sql', action='store_true', help='Print every captured query.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            failures = self._run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError('Query budget check failed:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('All views are within their query budgets.'))
+
+    def _run(self, options):
+        failures = []
+
+        budgeted = {entry['name'] for entry in BUDGETS}
+        for urlconf in BUDGETED_URLCONFS:
+            for name in sorted(set(named_routes(urlconf))):
+                if name not in budgeted:
+                    failures.append(f'{name}: no query budget defined (add it to BUDGETS)')
+
+        users, links = seed_dataset(users=5, links=options['links'], clicks=options['clicks'], seed=0)
+        owner = users[0]
+        link = next(link for link in links if link.user_id == owner.pk)
+        User = get_user_model()
+        admin = User.objects.create_superuser('querybudget-admin', 'admin@example.com', 'unused')
+
+        self.stdout.write(f'{"view":<36} {"method":<6} {"status":>6} {"queries":>8} {"budget":>7}')
+        for entry in BUDGETS:
+            method = entry.get('method', 'get')
+            client = Client(HTTP_HOST='localhost')
+            auth = entry.get('auth')
+            if auth in ('session', 'session+bearer'):
+                client.force_login(owner)
+            elif auth == 'admin':
+                client.force_login(admin)
+            if auth in ('bearer', 'session+bearer'):
+                # generate_api_key may have rotated the key
+                owner.refresh_from_db(fields=['api_key'])
+                client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {owner.api_key}'
+
+            args = entry.get('args')
+            kwargs = {'code': link.short_code} if args == 'code' else {'pk': link.pk} if args == 'pk' else {}
+            url = reverse(entry['name'], kwargs=kwargs)
+
+            # Start every request with an empty, freshly flushed click buffer
+            LinkHeavyHitters.flush()
+
+            with ExitStack() as stack:
+                headers = {}
+                if entry.get('revalidate'):
+                    # The buffer is flushed, so sketches do not lag recent clicks
+                    stack.enter_context(override_settings(HEAVY_HITTERS_FLUSH_SECONDS=0))
+                    headers['HTTP_IF_NONE_MATCH'] = client.get(url).get('ETag', '')
+
+                # Count queries on every alias (analytics reads may use the replica;
+                # parallel click-shard fan-out runs on pool threads and is not counted)
+                captured = [stack.enter_context(CaptureQueriesContext(conn)) for conn in connections.all()]
+                if method == 'post':
+                    response = client.post(url, data=entry.get('data', {}), content_type='application/json')
+                else:
+                    response = client.get(url, **headers)
+
+            # Budgets include session and authentication lookups
+            queries = [q['sql'] for context in captured for q in context.captured_queries]
+            label = entry['name']
+            budget = entry['max_queries']
+            marker = '' if len(queries) <= budget else '  OVER BUDGET'
+            self.stdout.write(f'{label:<36} {method.upper():<6} {response.status_code:>6} {len(queries):>8} {budget:>7}{marker}')
+            if options['verbosity'] > 1 and response.status_code >= 400:
+                self.stdout.write(f'    {response.content[:300]!r}')
+            if entry.get('revalidate') and response.status_code != 304:
+                failures.append(f'{label} ({method.upper()}): revalidation got {response.status_code}, not 304')
+            if response.status_code >= 500:
+                failures.append(f'{label} ({method.upper()}): server error {response.status_code}')
+            if len(queries) > budget:
+                failures.append(f'{label} ({method.upper()}): {len(queries)} queries, budget is {budget}')
+
+            allowed = set(entry.get('allow_scans', []))
+            for sql in queries:
+                if options['show_sql']:
+                    self.stdout.write(f'    {sql}')
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                plan = explain(sql)
+                if options['explain']:
+                    self.stdout.write(f'    EXPLAIN {sql}')
+                    for line in plan:
+                        self.stdout.write(f'      {line}')
+                limited = (
+                    re.search(r'\bORDER BY\b', sql, re.IGNORECASE) is not None
+                    and re.search(r'\bLIMIT \d+', sql, re.IGNORECASE) is not None
+                )
+                scanned = full_scans(plan, GUARDED_TABLES, limited) - allowed
+                if scanned:
+                    failures.append(
+                        f'{label} ({method.upper()}): full scan on {", ".join(sorted(scanned))}: {sql}'
+                    )
+        return failures
@@ -0,0 +1,37 @@
+"""
+Build the offline GeoIP range database from a CSV export
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener import geoip
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert a CSV of IP ranges (first address, last address, country, city) '
+        'into the memory-mapped database used for click geolocation.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV file with first_ip,last_ip,country,city rows.')
+        parser.add_argument('--output', default=None,
+                            help='Database path (defaults to settings.GEOIP_DATABASE).')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.GEOIP_DATABASE
+        if not output:
+            raise CommandError('No output path: pass --output or set GEOIP_DATABASE.')
+
+        started = time.perf_counter()
+        try:
+            count = geoip.build_database(options['csv_path'], output)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        geoip.reload()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {count} ranges to {output} in {time.perf_counter() - started:.1f}s.'
+        ))
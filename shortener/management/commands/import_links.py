@@ -0,0 +1,68 @@
+"""
+Import links in bulk from a CSV file
+"""
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener import link_import
+
+
+class Command(BaseCommand):
+    help = (
+        'Create links from a CSV file with a header naming the columns url, '
+        'alias, title, owner (username or email) and expires_at (ISO date or '
+        'datetime); only url is required. Rows are validated and inserted in '
+        'chunks, each in its own transaction; invalid rows are reported and '
+        'skipped. Plan link limits are not applied. With --checkpoint, an '
+        'interrupted import resumes after the last committed chunk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV file with a url,alias,title,owner,expires_at header.')
+        parser.add_argument('--owner', default=None,
+                            help='Username or email owning rows without an owner (default: anonymous).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', default=None,
+                            help='File recording the rows imported so far; resumes from it when it exists.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        default_owner = None
+        if options['owner']:
+            owner = options['owner']
+            default_owner = link_import.owners_by_name({owner}).get(owner)
+            if default_owner is None:
+                raise CommandError(f'Unknown owner: {owner}')
+
+        checkpoint = options['checkpoint']
+        done = link_import.load_checkpoint(checkpoint) if checkpoint else 0
+        if done:
+            self.stdout.write(f'Resuming after {done} rows.')
+
+        started = time.perf_counter()
+        created = invalid = 0
+        try:
+            rows = link_import.read_rows(options['csv_path'], skip=done)
+            for chunk in link_import.chunked(rows, batch_size):
+                count, errors = link_import.import_chunk(chunk, default_owner)
+                created += count
+                invalid += len(errors)
+                for error in errors:
+                    self.stderr.write(str(error))
+                done += len(chunk)
+                if checkpoint:
+                    link_import.save_checkpoint(checkpoint, done)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{done} rows read, {created} links created.')
+        except (OSError, ValueError, csv.Error) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} links, skipped {invalid} rows in '
+            f'{time.perf_counter() - started:.1f}s ({done} rows read in total).'
+        ))
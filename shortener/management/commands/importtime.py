@@ -0,0 +1,99 @@
+"""
+Import-time breakdown of a cold start serving a redirect
+"""
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter: load the WSGI app and resolve a redirect URL,
+# which is everything a cold lambda does before touching the database
+COLD_START_SCRIPT = """
+import importlib, sys
+module, _, attr = sys.argv[1].rpartition('.')
+getattr(importlib.import_module(module), attr)
+from django.urls import resolve
+resolve(sys.argv[2])
+"""
+
+
+def parse_importtime(output):
+    """Parse `-X importtime` stderr into [(module, self_us, cumulative_us, depth)]"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            depth = (len(name) - len(name.lstrip())) // 2
+            rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure import time of a cold start (WSGI app + redirect URL resolution) '
+        'in a fresh interpreter and fail above the configured budget or when a '
+        'forbidden heavy module is imported.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/abc1234', help='URL path to resolve (default: a short code).')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to start; the fastest is reported.')
+        parser.add_argument('--top', type=int, default=20, help='Number of slowest modules to list.')
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help='Fail above this total (default: settings.COLD_START_IMPORT_BUDGET_MS).')
+
+    def handle(self, *args, **options):
+        budget_ms = options['budget_ms']
+        if budget_ms is None:
+            budget_ms = settings.COLD_START_IMPORT_BUDGET_MS
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        best = None
+        for _ in range(max(1, options['runs'])):
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', COLD_START_SCRIPT,
+                 settings.WSGI_APPLICATION, options['path']],
+                env=env, capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                raise CommandError(f'Cold start failed:\n{result.stderr[-2000:]}')
+            rows = parse_importtime(result.stderr)
+            total = sum(row[1] for row in rows)
+            if best is None or total < best[0]:
+                best = (total, rows)
+
+        total_us, rows = best
+        self.stdout.write(f'Cold start imports: {len(rows)} modules, {total_us / 1000:.1f} ms total\n')
+
+        self.stdout.write(f'{"cumulative ms":>14} {"self ms":>9}  module')
+        for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: -row[2])[:options['top']]:
+            self.stdout.write(f'{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {"  " * depth}{name}')
+
+        packages = defaultdict(int)
+        for name, self_us, _, _ in rows:
+            packages[name.split('.')[0]] += self_us
+        self.stdout.write(f'\n{"package ms":>14}  package')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'{self_us / 1000:>14.1f}  {package}')
+
+        failures = []
+        imported = {row[0] for row in rows}
+        for module in settings.COLD_START_FORBIDDEN_IMPORTS:
+            if module in imported:
+                failures.append(f'{module} is imported during a cold start')
+        if budget_ms and total_us / 1000 > budget_ms:
+            failures.append(f'import time {total_us / 1000:.1f} ms exceeds the {budget_ms:.0f} ms budget')
+
+        if failures:
+            raise CommandError('Cold start check failed:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f'\nWithin budget ({total_us / 1000:.1f} ms of {budget_ms:.0f} ms).'
+        ))
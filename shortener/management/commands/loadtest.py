@@ -0,0 +1,302 @@
+"""
+End-to-end load generator with Zipf-distributed traffic
+"""
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from importlib import import_module
+from unittest import mock
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from shortener.models import Link
+from shortener.seeding import SEED_USER_PREFIX, ZipfSampler, clear_dataset, seed_dataset
+
+
+ENDPOINTS = ['redirect', 'create', 'stats', 'dashboard']
+
+DEFAULT_MIX = 'redirect=90,create=4,stats=3,dashboard=3'
+
+
+def parse_mix(value):
+    """Parse 'redirect=90,create=4' into a {endpoint: weight} dict"""
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise CommandError(f'Unknown endpoint "{name}" in --mix (choose from {", ".join(ENDPOINTS)}).')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight for "{name}" in --mix.')
+    if not mix or sum(mix.values()) <= 0:
+        raise CommandError('--mix must contain at least one positive weight.')
+    return mix
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+def session_cookie_for(user):
+    """Create a logged-in session for user without going through the login form"""
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.save()
+    return f'{settings.SESSION_COOKIE_NAME}={store.session_key}'
+
+
+class InProcessTransport:
+    """Drive the WSGI application in this process through the test client"""
+
+    def __init__(self, host):
+        self.client = Client(HTTP_HOST=host)
+
+    def request(self, method, path, headers, body=None):
+        extra = {f'HTTP_{k.upper().replace("-", "_")}': v for k, v in headers.items()}
+        if method == 'POST':
+            response = self.client.post(path, data=body, content_type='application/json', **extra)
+        else:
+            response = self.client.get(path, **extra)
+        return response.status_code
+
+
+class HTTPTransport:
+    """Drive a running server (e.g. local gunicorn) over keep-alive HTTP"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        if parts.scheme == 'https':
+            self.conn = http.client.HTTPSConnection(parts.netloc, timeout=30)
+        else:
+            self.conn = http.client.HTTPConnection(parts.netloc, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, headers, body=None):
+        headers = dict(headers)
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            return 0
+        if response.will_close:
+            self.conn.close()
+        return response.status
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed links and historical clicks, then drive redirect/create/stats/dashboard '
+        'traffic with Zipf popularity and report throughput and latency per endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Number of seeded users.')
+        parser.add_argument('--links', type=int, default=1000, help='Number of seeded links (N).')
+        parser.add_argument('--clicks', type=int, default=20000, help='Number of seeded historical clicks (M).')
+        parser.add_argument('--requests', type=int, default=5000, help='Measured requests to send.')
+        parser.add_argument('--warmup', type=int, default=100, help='Unmeasured requests sent first.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of worker threads.')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Endpoint weights (default: {DEFAULT_MIX}).')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for link/user popularity.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs.')
+        parser.add_argument(
+            '--url',
+            help='Base URL of a running server (e.g. http://127.0.0.1:8000). '
+                 'Without it the WSGI app is driven in-process.',
+        )
+        parser.add_argument('--host', default='localhost', help='Host header for in-process requests.')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse the previously seeded dataset.')
+        parser.add_argument('--keep-data', action='store_true', help='Do not delete the seeded dataset afterwards.')
+        parser.add_argument(
+            '--no-throttle', action='store_true',
+            help='Disable DRF throttling for in-process runs (remote servers keep their own settings).',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        rng = random.Random(options['seed'])
+
+        if options['skip_seed']:
+            users = list(get_user_model().objects.filter(username__startswith=SEED_USER_PREFIX).order_by('id'))
+            links = list(Link.objects.filter(user__in=users).order_by('id'))
+            if not links:
+                raise CommandError('No seeded dataset found; run without --skip-seed first.')
+        else:
+            clear_dataset()
+            started = time.perf_counter()
+            users, links = seed_dataset(
+                users=options['users'],
+                links=options['links'],
+                clicks=options['clicks'],
+                zipf_s=options['zipf'],
+                seed=options['seed'],
+            )
+            self.stdout.write(
+                f'Seeded {len(users)} users, {len(links)} links, {options["clicks"]} clicks '
+                f'in {time.perf_counter() - started:.1f}s'
+            )
+
+        owners = {user.pk: user for user in users}
+        cookies = {user.pk: session_cookie_for(user) for user in users}
+        link_sampler = ZipfSampler(len(links), s=options['zipf'], rng=rng)
+        user_sampler = ZipfSampler(len(users), s=options['zipf'], rng=rng)
+
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        total = options['warmup'] + options['requests']
+        plan = []
+        for i in range(total):
+            endpoint = rng.choices(names, weights)[0]
+            if endpoint == 'redirect':
+                link = links[link_sampler.sample()]
+                # One visitor per request, so no redirect is collapsed as a repeat
+                visitor = f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+                plan.append((endpoint, 'GET', f'/{link.short_code}', {'X-Forwarded-For': visitor}, None))
+            elif endpoint == 'stats':
+                link = links[link_sampler.sample()]
+                owner = owners[link.user_id]
+                plan.append((endpoint, 'GET', f'/api/links/{link.pk}/stats/',
+                             {'Authorization': f'Bearer {owner.api_key}'}, None))
+            elif endpoint == 'dashboard':
+                user = users[user_sampler.sample()]
+                plan.append((endpoint, 'GET', '/dashboard/', {'Cookie': cookies[user.pk]}, None))
+            else:
+                user = users[user_sampler.sample()]
+                body = json.dumps({'original_url': f'https://example.com/new/{i}/{rng.getrandbits(32):08x}'})
+                plan.append((endpoint, 'POST', '/api/links/',
+                             {'Authorization': f'Bearer {user.api_key}'}, body))
+
+        if options['url']:
+            def make_transport():
+                return HTTPTransport(options['url'])
+        else:
+            def make_transport():
+                return InProcessTransport(options['host'])
+
+        with ExitStack() as stack:
+            if options['no_throttle'] and not options['url']:
+                from rest_framework.throttling import SimpleRateThrottle
+                stack.enter_context(mock.patch.object(
+                    SimpleRateThrottle, 'allow_request', lambda self, request, view: True
+                ))
+
+            self._drive(plan[:options['warmup']], make_transport, options['concurrency'])
+            latencies, statuses, elapsed = self._drive(
+                plan[options['warmup']:], make_transport, options['concurrency']
+            )
+
+        report = self._report(latencies, statuses, elapsed)
+
+        if not options['keep_data']:
+            clear_dataset()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_report(report)
+
+    def _drive(self, plan, make_transport, concurrency):
+        """Replay plan across worker threads, returning latencies and status counts"""
+        latencies = defaultdict(list)
+        statuses = defaultdict(lambda: defaultdict(int))
+        lock = threading.Lock()
+        cursor = iter(plan)
+
+        def worker():
+            transport = make_transport()
+            local_latencies = defaultdict(list)
+            local_statuses = defaultdict(lambda: defaultdict(int))
+            while True:
+                with lock:
+                    item = next(cursor, None)
+                if item is None:
+                    break
+                endpoint, method, path, headers, body = item
+                started = time.perf_counter()
+                status = transport.request(method, path, headers, body)
+                local_latencies[endpoint].append(time.perf_counter() - started)
+                local_statuses[endpoint][status] += 1
+            with lock:
+                for endpoint, values in local_latencies.items():
+                    latencies[endpoint].extend(values)
+                for endpoint, counts in local_statuses.items():
+                    for status, count in counts.items():
+                        statuses[endpoint][status] += count
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, statuses, time.perf_counter() - started
+
+    def _report(self, latencies, statuses, elapsed):
+        endpoints = {}
+        total = 0
+        for endpoint in ENDPOINTS:
+            values = sorted(latencies.get(endpoint, []))
+            if not values:
+                continue
+            total += len(values)
+            errors = sum(
+                count for status, count in statuses[endpoint].items()
+                if not 200 <= status < 400
+            )
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': errors,
+                'rps': len(values) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+                'statuses': {str(k): v for k, v in sorted(statuses[endpoint].items())},
+            }
+        return {
+            'elapsed_s': elapsed,
+            'requests': total,
+            'rps': total / elapsed if elapsed else 0.0,
+            'endpoints': endpoints,
+        }
+
+    def _print_report(self, report):
+        self.stdout.write(
+            f'\n{report["requests"]} requests in {report["elapsed_s"]:.2f}s '
+            f'({report["rps"]:.1f} req/s)\n'
+        )
+        header = f'{"endpoint":<10} {"reqs":>7} {"errors":>7} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for endpoint, row in report['endpoints'].items():
+            self.stdout.write(
+                f'{endpoint:<10} {row["requests"]:>7} {row["errors"]:>7} {row["rps"]:>9.1f} '
+                f'{row["p50_ms"]:>9.2f} {row["p95_ms"]:>9.2f} {row["p99_ms"]:>9.2f} {row["max_ms"]:>9.2f}'
+            )
+        for endpoint, row in report['endpoints'].items():
+            codes = ', '.join(f'{status}: {count}' for status, count in row['statuses'].items())
+            self.stdout.write(f'  {endpoint} status codes: {codes}')
@@ -0,0 +1,36 @@
+"""
+Purge soft-deleted links and their clicks
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener import purge
+from shortener.models import Link
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove soft-deleted links with their clicks, rollups, sketches and '
+        'archived months, deleting rows in primary-key ordered batches. Run '
+        'from cron where links are not purged in the background '
+        '(LINK_PURGE_IN_BACKGROUND=False). Safe to rerun after an interruption.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.LINK_PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        link_ids = list(
+            Link.all_objects.filter(deleted_at__isnull=False)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        rows = 0
+        for link_id in link_ids:
+            rows += purge.purge_link(link_id, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {len(link_ids)} deleted links ({rows} click, rollup and sketch rows).'
+        ))
@@ -0,0 +1,76 @@
+"""
+Move clicks and their rollups from the default database to the click shards
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from shortener import sharding
+from shortener.models import Click, DailyLinkStats, LinkHeavyHitters, Referrer, UserAgent
+from shortener.seeding import backdated
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy Click, DailyLinkStats and LinkHeavyHitters rows from the default '
+        'database to the shard of their link (settings.CLICK_SHARDS), deleting '
+        'each batch from default once it is stored. User-agent and referrer '
+        'dictionaries are copied to every shard. Run with writes paused; an '
+        'interrupted run can duplicate at most one batch of clicks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not settings.CLICK_SHARDS:
+            raise CommandError('Sharding is off; set CLICK_SHARD_URLS first.')
+
+        for model in (UserAgent, Referrer):
+            copied = self.copy_dictionary(model, options['batch_size'])
+            self.stdout.write(f'{model.__name__}: copied {copied} rows to every shard')
+
+        for model in (Click, DailyLinkStats, LinkHeavyHitters):
+            with backdated(Click, 'clicked_at'):
+                moved = self.move(model, options['batch_size'])
+            self.stdout.write(f'{model.__name__}: moved {moved} rows')
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def copy_dictionary(self, model, batch_size):
+        source = model.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+        copied = 0
+        last_pk = None
+        while True:
+            rows = source if last_pk is None else source.filter(pk__gt=last_pk)
+            batch = list(rows[:batch_size])
+            if not batch:
+                return copied
+            last_pk = batch[-1].pk
+            for alias in settings.CLICK_SHARDS:
+                model.objects.using(alias).bulk_create(batch, ignore_conflicts=True)
+            copied += len(batch)
+
+    def move(self, model, batch_size):
+        # Auto ids are reassigned by the shard; link-keyed rows keep their key
+        keep_pk = model._meta.pk.name == 'link'
+        source = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+        moved = 0
+        last_pk = None
+        while True:
+            rows = source if last_pk is None else source.filter(pk__gt=last_pk)
+            batch = list(rows[:batch_size])
+            if not batch:
+                return moved
+            last_pk = batch[-1].pk
+
+            by_shard = {}
+            for row in batch:
+                by_shard.setdefault(sharding.shard_for(row.link_id), []).append(row)
+            for alias, shard_rows in by_shard.items():
+                if not keep_pk:
+                    for row in shard_rows:
+                        row.pk = None
+                with transaction.atomic(using=alias):
+                    model._base_manager.using(alias).bulk_create(shard_rows)
+            model._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__lte=last_pk).delete()
+            moved += len(batch)
@@ -0,0 +1,46 @@
+"""
+Build the shared-memory link resolution table from the links table
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener import link_table
+from shortener.models import Link
+from shortener.redirect_cache import RECORD_FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot every link into the mmap-backed resolution table shared by all '
+        'workers on this host (settings.LINK_TABLE_PATH; single-host deployments only). '
+        'Run after deploys and whenever the table reports it is full.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Table path (default: settings.LINK_TABLE_PATH).')
+        parser.add_argument('--load-factor', type=float, default=0.5,
+                            help='Target slot occupancy; lower leaves more room for new links.')
+        parser.add_argument('--heap-slack', type=float, default=0.25,
+                            help='Extra URL heap space for incremental patches, as a fraction.')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.LINK_TABLE_PATH
+        if not path:
+            raise CommandError('No table path: pass --output or set LINK_TABLE_PATH.')
+        if not 0 < options['load_factor'] < link_table.MAX_LOAD:
+            raise CommandError(f'--load-factor must be between 0 and {link_table.MAX_LOAD}.')
+
+        started = time.perf_counter()
+        rows = Link.objects.order_by().values(*RECORD_FIELDS).iterator(chunk_size=5000)
+        stats = link_table.LinkTable.build(
+            path, rows,
+            load_factor=options['load_factor'],
+            heap_slack=options['heap_slack'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {stats["entries"]} codes to {path} ({stats["capacity"]} slots, '
+            f'{stats["heap_used"] / 1024:.0f} of {stats["heap_size"] / 1024:.0f} KiB URL heap) '
+            f'in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,30 @@
+"""
+Load the hottest links into the redirect cache
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.caching import shared_cache
+
+from shortener import redirect_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Load resolution records of the N most-clicked active, non-expired links '
+        'into the redirect cache (useful right after a deploy with a shared cache).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Number of links (default: settings.REDIRECT_CACHE_WARM_LINKS).')
+
+    def handle(self, *args, **options):
+        if not shared_cache():
+            raise CommandError('No shared cache (set REDIS_URL): redirects are not cached.')
+
+        limit = options['limit']
+        if limit is None:
+            limit = settings.REDIRECT_CACHE_WARM_LINKS
+        warmed = redirect_cache.warm(limit)
+        self.stdout.write(self.style.SUCCESS(f'Warmed redirect cache with {warmed} links.'))
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:48
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+BATCH_SIZE = 1000
+
+# shortener.sketches.HyperLogLog as of this migration: precision 12,
+# blake2b 64-bit hashes, stored as precision byte + zlib of the registers
+PRECISION = 12
+
+
+def add_visitor(registers, value):
+    h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+    remaining = 64 - PRECISION
+    index = h >> remaining
+    rank = remaining - (h & ((1 << remaining) - 1)).bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def sketch_bytes(registers):
+    return bytes([PRECISION]) + zlib.compress(bytes(registers))
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """Roll up existing clicks per link and local day, one group at a time"""
+    alias = schema_editor.connection.alias
+    Click = apps.get_model('shortener', 'Click')
+    DailyLinkStats = apps.get_model('shortener', 'DailyLinkStats')
+
+    rows = (
+        Click.objects.using(alias)
+        .order_by('link_id', 'clicked_at')
+        .values_list('link_id', 'clicked_at', 'ip_address')
+    )
+    batch = []
+    key = None
+    for link_id, clicked_at, ip in rows.iterator(chunk_size=BATCH_SIZE):
+        day = timezone.localdate(clicked_at)
+        if key != (link_id, day):
+            # Clicks come ordered, so the previous link-day is complete
+            key = (link_id, day)
+            stats = DailyLinkStats(link_id=link_id, date=day, clicks=0, visitors=bytearray(1 << PRECISION))
+            batch.append(stats)
+            if len(batch) > BATCH_SIZE:
+                store(DailyLinkStats, alias, batch[:-1])
+                del batch[:-1]
+        stats.clicks += 1
+        add_visitor(stats.visitors, ip or '')
+    store(DailyLinkStats, alias, batch)
+
+
+def store(DailyLinkStats, alias, batch):
+    for stats in batch:
+        stats.visitors = sketch_bytes(stats.visitors)
+    DailyLinkStats.objects.using(alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLinkStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('visitors', models.BinaryField(blank=True, default=bytes)),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='shortener.link')),
+            ],
+            options={
+                'db_table': 'link_daily_stats',
+                'ordering': ['-date'],
+                'unique_together': {('link', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
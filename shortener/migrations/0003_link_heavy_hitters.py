@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:51
+
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from urllib.parse import urlsplit
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+# LinkHeavyHitters.CAPACITY as of this migration
+CAPACITY = 50
+
+
+def referrer_domain(referrer):
+    # Frozen copy of LinkHeavyHitters.referrer_domain as of this migration
+    host = (urlsplit(referrer).hostname or '') if referrer else ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def space_saving(counter):
+    # Frozen copy of SpaceSaving.add and to_list as of this migration
+    counters = {}
+    for value, count in counter.items():
+        if value in counters:
+            counters[value][0] += count
+        elif len(counters) < CAPACITY:
+            counters[value] = [count, 0]
+        else:
+            victim = min(counters, key=lambda key: counters[key][0])
+            floor = counters.pop(victim)[0]
+            counters[value] = [floor + count, floor]
+    return [[value, count, error] for value, (count, error) in counters.items()]
+
+
+def backfill_heavy_hitters(apps, schema_editor):
+    """Top-N sketches of existing clicks, one link at a time"""
+    alias = schema_editor.connection.alias
+    Click = apps.get_model('shortener', 'Click')
+    LinkHeavyHitters = apps.get_model('shortener', 'LinkHeavyHitters')
+
+    rows = (
+        Click.objects.using(alias)
+        .order_by('link_id')
+        .values_list('link_id', 'browser', 'os', 'device_type', 'country', 'referrer')
+    )
+    batch = []
+    for link_id, group in groupby(rows.iterator(chunk_size=BATCH_SIZE), key=itemgetter(0)):
+        counters = {}
+        for _, browser, os_name, device_type, country, referrer in group:
+            values = {
+                'browser': browser,
+                'os': os_name,
+                'device_type': device_type,
+                'country': country,
+                'referrer_domain': referrer_domain(referrer),
+            }
+            for dimension, value in values.items():
+                # Empty values (unknown country, direct traffic) are not tracked
+                if value:
+                    counters.setdefault(dimension, Counter())[value] += 1
+        sketches = {dimension: space_saving(counter) for dimension, counter in counters.items()}
+        batch.append(LinkHeavyHitters(link_id=link_id, sketches=sketches))
+        if len(batch) >= BATCH_SIZE:
+            LinkHeavyHitters.objects.using(alias).bulk_create(batch)
+            batch = []
+    LinkHeavyHitters.objects.using(alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0002_daily_link_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinkHeavyHitters',
+            fields=[
+                ('link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='heavy_hitters', serialize=False, to='shortener.link')),
+                ('sketches', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'link_heavy_hitters',
+            },
+        ),
+        migrations.RunPython(backfill_heavy_hitters, migrations.RunPython.noop),
+    ]
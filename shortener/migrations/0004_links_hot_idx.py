@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0003_link_heavy_hitters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['-clicks_count'], name='links_hot_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0004_links_hot_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='click',
+            name='link',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='clicks', to='shortener.link'),
+        ),
+        migrations.AlterField(
+            model_name='dailylinkstats',
+            name='link',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='shortener.link'),
+        ),
+        migrations.AlterField(
+            model_name='linkheavyhitters',
+            name='link',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='heavy_hitters', serialize=False, to='shortener.link'),
+        ),
+    ]
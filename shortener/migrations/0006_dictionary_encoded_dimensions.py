@@ -0,0 +1,243 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 5000
+
+# Frozen copies of shortener.dimensions as of this migration: labels by code
+DEVICE_TYPES = ['', 'desktop', 'mobile', 'tablet']
+BROWSERS = ['', 'Other', 'Chrome', 'Firefox', 'Safari', 'Edge']
+OPERATING_SYSTEMS = ['', 'Other', 'Windows', 'macOS', 'Linux', 'Android', 'iOS']
+
+DIMENSIONS = [
+    ('device_type', DEVICE_TYPES),
+    ('browser', BROWSERS),
+    ('os', OPERATING_SYSTEMS),
+]
+
+
+def code_of(labels, label):
+    # Unrecognised labels map to Other where there is one, else unknown
+    if not label:
+        return 0
+    if label in labels:
+        return labels.index(label)
+    return labels.index('Other') if 'Other' in labels else 0
+
+
+def label_of(labels, code):
+    return labels[code] if 0 <= code < len(labels) else ''
+
+
+def digest(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big') - (1 << 63)
+
+
+def parse_user_agent(user_agent):
+    ua_lower = user_agent.lower()
+
+    device_type = 'desktop'
+    if 'mobile' in ua_lower or 'android' in ua_lower:
+        device_type = 'mobile'
+    elif 'tablet' in ua_lower or 'ipad' in ua_lower:
+        device_type = 'tablet'
+
+    browser = 'Other'
+    if 'chrome' in ua_lower:
+        browser = 'Chrome'
+    elif 'firefox' in ua_lower:
+        browser = 'Firefox'
+    elif 'safari' in ua_lower:
+        browser = 'Safari'
+    elif 'edge' in ua_lower:
+        browser = 'Edge'
+
+    os_name = 'Other'
+    if 'windows' in ua_lower:
+        os_name = 'Windows'
+    elif 'mac' in ua_lower:
+        os_name = 'macOS'
+    elif 'linux' in ua_lower:
+        os_name = 'Linux'
+    elif 'android' in ua_lower:
+        os_name = 'Android'
+    elif 'iphone' in ua_lower or 'ipad' in ua_lower:
+        os_name = 'iOS'
+
+    return DEVICE_TYPES.index(device_type), BROWSERS.index(browser), OPERATING_SYSTEMS.index(os_name)
+
+
+def clicks_in_batches(Click, alias, fields):
+    """Keyset-ordered batches of clicks on one database"""
+    clicks = Click.objects.using(alias).order_by('pk').only(*fields)
+    last_pk = None
+    while True:
+        batch = list((clicks if last_pk is None else clicks.filter(pk__gt=last_pk))[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        yield batch
+
+
+def encode_dimensions(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Click = apps.get_model('shortener', 'Click')
+    UserAgent = apps.get_model('shortener', 'UserAgent')
+    Referrer = apps.get_model('shortener', 'Referrer')
+    clicks = Click.objects.using(alias)
+
+    # Few distinct labels: one set-based UPDATE each, keeping the stored
+    # labels rather than re-parsing user agents
+    for name, choices in DIMENSIONS:
+        for label in clicks.values_list(name, flat=True).distinct().order_by():
+            clicks.filter(**{name: label}).update(**{f'{name}_code': code_of(choices, label)})
+
+    # Strings: fill the dictionaries, then point each batch at them with one
+    # UPDATE per distinct (user agent, referrer) pair in the batch
+    for batch in clicks_in_batches(Click, alias, ['user_agent', 'referrer']):
+        agents = {}
+        referrers = {}
+        pairs = {}
+        for click in batch:
+            agent_key = referrer_key = None
+            if click.user_agent:
+                agent_key = digest(click.user_agent)
+                if agent_key not in agents:
+                    device_type, browser, os_name = parse_user_agent(click.user_agent)
+                    agents[agent_key] = UserAgent(
+                        id=agent_key, user_agent=click.user_agent,
+                        device_type=device_type, browser=browser, os=os_name,
+                    )
+            if click.referrer:
+                referrer_key = digest(click.referrer)
+                referrers.setdefault(referrer_key, Referrer(id=referrer_key, url=click.referrer))
+            pairs.setdefault((agent_key, referrer_key), []).append(click.pk)
+
+        UserAgent.objects.using(alias).bulk_create(agents.values(), ignore_conflicts=True)
+        Referrer.objects.using(alias).bulk_create(referrers.values(), ignore_conflicts=True)
+        for (agent_key, referrer_key), ids in pairs.items():
+            clicks.filter(pk__in=ids).update(user_agent_ref_id=agent_key, referrer_ref_id=referrer_key)
+
+
+def decode_dimensions(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Click = apps.get_model('shortener', 'Click')
+    UserAgent = apps.get_model('shortener', 'UserAgent')
+    Referrer = apps.get_model('shortener', 'Referrer')
+    clicks = Click.objects.using(alias)
+
+    for name, choices in DIMENSIONS:
+        for code in clicks.values_list(f'{name}_code', flat=True).distinct().order_by():
+            clicks.filter(**{f'{name}_code': code}).update(**{name: label_of(choices, code)})
+
+    for batch in clicks_in_batches(Click, alias, ['user_agent_ref_id', 'referrer_ref_id']):
+        pairs = {}
+        for click in batch:
+            pairs.setdefault((click.user_agent_ref_id, click.referrer_ref_id), []).append(click.pk)
+        agents = UserAgent.objects.using(alias).in_bulk({agent_key for agent_key, _ in pairs})
+        referrers = Referrer.objects.using(alias).in_bulk({referrer_key for _, referrer_key in pairs})
+        for (agent_key, referrer_key), ids in pairs.items():
+            agent = agents.get(agent_key)
+            referrer = referrers.get(referrer_key)
+            clicks.filter(pk__in=ids).update(
+                user_agent=agent.user_agent if agent else '',
+                referrer=referrer.url if referrer else '',
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0005_shardable_click_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Referrer',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('url', models.TextField()),
+            ],
+            options={
+                'db_table': 'referrers',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_agent', models.TextField()),
+                ('device_type', models.PositiveSmallIntegerField(choices=[(0, ''), (1, 'desktop'), (2, 'mobile'), (3, 'tablet')], default=0)),
+                ('browser', models.PositiveSmallIntegerField(choices=[(0, ''), (1, 'Other'), (2, 'Chrome'), (3, 'Firefox'), (4, 'Safari'), (5, 'Edge')], default=0)),
+                ('os', models.PositiveSmallIntegerField(choices=[(0, ''), (1, 'Other'), (2, 'Windows'), (3, 'macOS'), (4, 'Linux'), (5, 'Android'), (6, 'iOS')], default=0)),
+            ],
+            options={
+                'db_table': 'user_agents',
+            },
+        ),
+        migrations.AddField(
+            model_name='click',
+            name='user_agent_ref',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shortener.useragent'),
+        ),
+        migrations.AddField(
+            model_name='click',
+            name='referrer_ref',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shortener.referrer'),
+        ),
+        migrations.AddField(
+            model_name='click',
+            name='device_type_code',
+            field=models.PositiveSmallIntegerField(choices=[(0, ''), (1, 'desktop'), (2, 'mobile'), (3, 'tablet')], default=0),
+        ),
+        migrations.AddField(
+            model_name='click',
+            name='browser_code',
+            field=models.PositiveSmallIntegerField(choices=[(0, ''), (1, 'Other'), (2, 'Chrome'), (3, 'Firefox'), (4, 'Safari'), (5, 'Edge')], default=0),
+        ),
+        migrations.AddField(
+            model_name='click',
+            name='os_code',
+            field=models.PositiveSmallIntegerField(choices=[(0, ''), (1, 'Other'), (2, 'Windows'), (3, 'macOS'), (4, 'Linux'), (5, 'Android'), (6, 'iOS')], default=0),
+        ),
+        migrations.RunPython(encode_dimensions, decode_dimensions),
+        migrations.RemoveField(
+            model_name='click',
+            name='user_agent',
+        ),
+        migrations.RemoveField(
+            model_name='click',
+            name='referrer',
+        ),
+        migrations.RemoveField(
+            model_name='click',
+            name='device_type',
+        ),
+        migrations.RemoveField(
+            model_name='click',
+            name='browser',
+        ),
+        migrations.RemoveField(
+            model_name='click',
+            name='os',
+        ),
+        migrations.RenameField(
+            model_name='click',
+            old_name='device_type_code',
+            new_name='device_type',
+        ),
+        migrations.RenameField(
+            model_name='click',
+            old_name='browser_code',
+            new_name='browser',
+        ),
+        migrations.RenameField(
+            model_name='click',
+            old_name='os_code',
+            new_name='os',
+        ),
+    ]
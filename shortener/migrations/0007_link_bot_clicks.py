@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0006_dictionary_encoded_dimensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='bot_clicks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
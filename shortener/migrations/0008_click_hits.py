@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0007_link_bot_clicks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='click',
+            name='hits',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:29
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def digest(value):
+    # Frozen copy of shortener.dimensions.digest as of this migration
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big') - (1 << 63)
+
+
+def normalize_url(url):
+    # Frozen copy of Link.normalize_url as of this migration
+    from urllib.parse import urlsplit, urlunsplit
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if ':' in netloc:
+        netloc = f'[{netloc}]'
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != {'http': 80, 'https': 443}.get(scheme):
+        netloc = f'{netloc}:{port}'
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f'{parts.username}:{parts.password}'
+        netloc = f'{userinfo}@{netloc}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+
+def fill_url_digests(apps, schema_editor):
+    Link = apps.get_model('shortener', 'Link')
+    links = Link.objects.using(schema_editor.connection.alias).order_by('pk').only('original_url')
+    last_pk = 0
+    while True:
+        batch = list(links.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        for link in batch:
+            link.url_digest = digest(normalize_url(link.original_url)) if link.original_url else None
+        Link.objects.using(schema_editor.connection.alias).bulk_update(batch, ['url_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0008_click_hits'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='url_digest',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_url_digests, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['url_digest', 'user'], name='links_url_digest_idx'),
+        ),
+    ]
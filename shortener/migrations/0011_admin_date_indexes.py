@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0010_link_deleted_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='click',
+            index=models.Index(fields=['clicked_at', 'id'], name='clicks_clicked_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['created_at', 'id'], name='links_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0011_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='click',
+            index=models.Index(fields=['link', 'id'], name='clicks_link_cursor_idx'),
+        ),
+    ]
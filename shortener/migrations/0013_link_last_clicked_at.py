@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0012_click_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='last_clicked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,13 +1,55 @@
 """
 URL Shortener Models - Link and Click tracking
 """
-from django.db import models
+import atexit
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from urllib.parse import urlsplit, urlunsplit
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, models, transaction, IntegrityError
+from django.db.models import F, Q
+from django.db.models.signals import post_delete
 from django.conf import settings
 from django.utils import timezone
 import shortuuid
-import qrcode
-from io import BytesIO
-import base64
+
+from . import archive, bots, dedup, geoip, purge, sharding
+from .dimensions import Browser, DeviceType, OperatingSystem, digest, label_of, parse_user_agent
+from .sharding import ShardedManager
+from .sketches import HyperLogLog, SpaceSaving
+
+
+class LinkQuerySet(models.QuerySet):
+
+    def soft_delete(self):
+        """
+        Hide these links from resolution and listings now and purge their
+        clicks in the background (shortener.purge); returns the count
+        """
+        links = list(self.filter(deleted_at__isnull=True))
+        ids = [link.pk for link in links]
+        now = timezone.now()
+        Link.all_objects.filter(pk__in=ids).update(deleted_at=now, is_active=False)
+        for link in links:
+            link.deleted_at = now
+            link.is_active = False
+            link.invalidate_redirect_cache(deleted=True)
+        user_ids = {link.user_id for link in links} - {None}
+        get_user_model().objects.filter(pk__in=user_ids).update(links_version=F('links_version') + 1)
+        purge.schedule(ids)
+        return len(ids)
+
+
+class LinkManager(models.Manager.from_queryset(LinkQuerySet)):
+    """Links that are not soft-deleted"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class Link(models.Model):
@@ -21,30 +63,153 @@ class Link(models.Model):
         blank=True  # Allow anonymous links
     )
     original_url = models.URLField(max_length=2048)
+    # Digest of the normalized URL, for reusing links (see find_reusable)
+    url_digest = models.BigIntegerField(null=True, blank=True, editable=False)
     short_code = models.CharField(max_length=20, unique=True, db_index=True)
     custom_alias = models.CharField(max_length=50, unique=True, null=True, blank=True)
     title = models.CharField(max_length=200, blank=True)
 
     # Stats
     clicks_count = models.PositiveIntegerField(default=0)
+    bot_clicks = models.PositiveIntegerField(default=0)  # Counted instead of recorded (shortener.bots)
+    # Moves with every click, hit and bot count (shortener.conditional)
+    last_clicked_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     # Settings
     is_active = models.BooleanField(default=True)
     expires_at = models.DateTimeField(null=True, blank=True)
+    # Set by soft_delete; the row goes once its clicks are purged
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LinkManager()
+    all_objects = LinkQuerySet.as_manager()  # Soft-deleted links included
 
     class Meta:
         db_table = 'links'
         ordering = ['-created_at']
+        indexes = [
+            # Hot-link warm-up walks links by popularity and stops after N
+            models.Index(fields=['-clicks_count'], name='links_hot_idx'),
+            # Repeat shortening finds the owner's link to a URL in one lookup
+            models.Index(fields=['url_digest', 'user'], name='links_url_digest_idx'),
+            # Admin changelist order and date hierarchy
+            models.Index(fields=['created_at', 'id'], name='links_created_idx'),
+            # The purge only ever looks for soft-deleted links
+            models.Index(
+                fields=['deleted_at'],
+                condition=Q(deleted_at__isnull=False),
+                name='links_deleted_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.short_code} -> {self.original_url[:50]}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the codes as loaded so renamed aliases are evicted too
+        instance._loaded_codes = (
+            instance.__dict__.get('short_code'),
+            instance.__dict__.get('custom_alias'),
+        )
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.short_code:
             self.short_code = self.generate_short_code()
+        self.url_digest = self.digest_url(self.original_url)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'original_url' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'url_digest'}
         super().save(*args, **kwargs)
+        self.invalidate_redirect_cache()
+        if self.user_id is not None:
+            get_user_model().objects.filter(pk=self.user_id).update(links_version=F('links_version') + 1)
+
+    def delete(self, *args, **kwargs):
+        self.invalidate_redirect_cache(deleted=True)
+        return super().delete(*args, **kwargs)
+
+    def soft_delete(self):
+        """Delete without blocking on the clicks (see LinkQuerySet.soft_delete)"""
+        Link.objects.filter(pk=self.pk).soft_delete()
+        self.deleted_at = timezone.now()
+        self.is_active = False
+
+    def invalidate_redirect_cache(self, deleted=False):
+        """
+        Once the change commits, evict this link's cached redirect records
+        and patch the shared link table (if enabled)
+        """
+        from . import link_table, redirect_cache
+
+        codes = (self.short_code, self.custom_alias, *getattr(self, '_loaded_codes', ()))
+        # Later saves of this instance must evict what this save stored
+        self._loaded_codes = (self.short_code, self.custom_alias)
+        row = None if deleted else {
+            'id': self.pk,
+            'short_code': self.short_code,
+            'custom_alias': self.custom_alias,
+            'original_url': self.original_url,
+            'is_active': self.is_active,
+            'expires_at': self.expires_at,
+        }
+
+        link_id = self.pk
+
+        def apply():
+            redirect_cache.invalidate(*codes)
+            link_table.apply_link_change(row, stale_codes=codes)
+            bots.forget(link_id)
+
+        transaction.on_commit(apply)
+
+    @staticmethod
+    def normalize_url(url):
+        """Canonical form of a destination URL: case-insensitive parts lowered, default port dropped"""
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        netloc = (parts.hostname or '').lower()
+        if ':' in netloc:
+            netloc = f'[{netloc}]'  # IPv6
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        if port is not None and port != {'http': 80, 'https': 443}.get(scheme):
+            netloc = f'{netloc}:{port}'
+        if parts.username is not None:
+            userinfo = parts.username if parts.password is None else f'{parts.username}:{parts.password}'
+            netloc = f'{userinfo}@{netloc}'
+        return urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+    @classmethod
+    def digest_url(cls, url):
+        return digest(cls.normalize_url(url)) if url else None
+
+    @classmethod
+    def find_reusable(cls, user, url):
+        """
+        The newest active, unexpired link without a custom alias that user
+        (None: anonymous) already has for this URL, or None
+        """
+        normalized = cls.normalize_url(url)
+        candidates = cls.objects.filter(
+            Q(expires_at=None) | Q(expires_at__gt=timezone.now()),
+            url_digest=digest(normalized),
+            user=user if user is not None and user.is_authenticated else None,
+            is_active=True,
+        ).order_by('-created_at')
+        # Aliased links and digest collisions are ruled out here: filtering
+        # custom_alias IS NULL in SQL lets SQLite walk the unique alias index
+        # over every link without one instead of using links_url_digest_idx
+        for link in candidates[:5]:
+            if link.custom_alias is None and cls.normalize_url(link.original_url) == normalized:
+                return link
+        return None
 
     @staticmethod
     def generate_short_code(length=7):
@@ -66,63 +231,199 @@ class Link(models.Model):
 
     def increment_clicks(self):
         """Increment click counter"""
+        # Atomic in the database; works on the minimal instances built
+        # from cached redirect records
+        Link.objects.filter(pk=self.pk).update(clicks_count=F('clicks_count') + 1, last_clicked_at=timezone.now())
         self.clicks_count += 1
-        self.save(update_fields=['clicks_count'])
 
     def generate_qr_code(self, size=200):
         """Generate QR code as base64 string"""
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        # Use full URL for QR code
-        full_url = f"https://your-domain.vercel.app{self.short_url}"
-        qr.add_data(full_url)
-        qr.make(fit=True)
+        return qr_code(self.short_url)
+
+
+# Memoized: rendering QR codes dominated link listings
+@lru_cache(maxsize=1024)
+def qr_code(short_url):
+    """QR code of a short URL path as a base64 PNG data URI"""
+    # Imported lazily: qrcode pulls in PIL, which redirects never need
+    import base64
+    from io import BytesIO
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    # Use full URL for QR code
+    full_url = f"https://your-domain.vercel.app{short_url}"
+    qr.add_data(full_url)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    img_str = base64.b64encode(buffer.getvalue()).decode()
+
+    return f"data:image/png;base64,{img_str}"
+
+
+class DictionaryEntry(models.Model):
+    """
+    Distinct string keyed by its 64-bit hash, stored on the same database as
+    the clicks referencing it
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+
+    # Field holding the string
+    VALUE_FIELD = None
+
+    # Keys known to exist per database alias (bounded)
+    MAX_KNOWN_KEYS = 100_000
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def entry(cls, key, value):
+        """Unsaved row for a value; override to store what is derived from it"""
+        return cls(id=key, **{cls.VALUE_FIELD: value})
+
+    @classmethod
+    def key_for(cls, value, using=DEFAULT_DB_ALIAS):
+        """Key of a value (None when empty), inserting it on first use"""
+        if not value:
+            return None
+        key = digest(value)
+        if (using, key) not in cls._known:
+            cls.objects.using(using).bulk_create([cls.entry(key, value)], ignore_conflicts=True)
+            if len(cls._known) >= cls.MAX_KNOWN_KEYS:
+                cls._known.clear()
+            cls._known.add((using, key))
+        return key
+
+
+class UserAgent(DictionaryEntry):
+    """User-agent string with its parsed dimensions"""
+
+    user_agent = models.TextField()
+    device_type = models.PositiveSmallIntegerField(choices=DeviceType.choices, default=DeviceType.UNKNOWN)
+    browser = models.PositiveSmallIntegerField(choices=Browser.choices, default=Browser.UNKNOWN)
+    os = models.PositiveSmallIntegerField(choices=OperatingSystem.choices, default=OperatingSystem.UNKNOWN)
+
+    VALUE_FIELD = 'user_agent'
+    _known = set()
+
+    class Meta:
+        db_table = 'user_agents'
+
+    def __str__(self):
+        return self.user_agent
+
+    @classmethod
+    def entry(cls, key, value):
+        row = super().entry(key, value)
+        row.device_type, row.browser, row.os = parse_user_agent(value)
+        return row
 
-        img = qr.make_image(fill_color="black", back_color="white")
 
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+class Referrer(DictionaryEntry):
+    """Referrer URL"""
 
-        return f"data:image/png;base64,{img_str}"
+    url = models.TextField()
+
+    VALUE_FIELD = 'url'
+    _known = set()
+
+    class Meta:
+        db_table = 'referrers'
+
+    def __str__(self):
+        return self.url
 
 
 class Click(models.Model):
     """Click tracking model"""
 
+    # No DB constraint: clicks may live on a different shard than links
     link = models.ForeignKey(
         Link,
         on_delete=models.CASCADE,
-        related_name='clicks'
+        related_name='clicks',
+        db_constraint=False
     )
     clicked_at = models.DateTimeField(auto_now_add=True)
+    # Requests collapsed into this click by the dedup window (shortener.dedup)
+    hits = models.PositiveIntegerField(default=1)
 
-    # Analytics data
+    # Analytics data (strings are dictionary-encoded, see shortener.dimensions)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
-    referrer = models.URLField(max_length=2048, blank=True)
+    user_agent_ref = models.ForeignKey(
+        UserAgent,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        null=True,
+        blank=True,
+        db_constraint=False
+    )
+    referrer_ref = models.ForeignKey(
+        Referrer,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        null=True,
+        blank=True,
+        db_constraint=False
+    )
 
     # Parsed data
     country = models.CharField(max_length=100, blank=True)
     city = models.CharField(max_length=100, blank=True)
-    device_type = models.CharField(max_length=50, blank=True)  # mobile, desktop, tablet
-    browser = models.CharField(max_length=100, blank=True)
-    os = models.CharField(max_length=100, blank=True)
+    device_type = models.PositiveSmallIntegerField(choices=DeviceType.choices, default=DeviceType.UNKNOWN)
+    browser = models.PositiveSmallIntegerField(choices=Browser.choices, default=Browser.UNKNOWN)
+    os = models.PositiveSmallIntegerField(choices=OperatingSystem.choices, default=OperatingSystem.UNKNOWN)
+
+    objects = ShardedManager()
 
     class Meta:
         db_table = 'clicks'
         ordering = ['-clicked_at']
+        indexes = [
+            # Admin changelist order and date hierarchy
+            models.Index(fields=['clicked_at', 'id'], name='clicks_clicked_at_idx'),
+            # Live cursors: a link's clicks after an id (shortener.live)
+            models.Index(fields=['link', 'id'], name='clicks_link_cursor_idx'),
+        ]
 
     def __str__(self):
-        return f"Click on {self.link.short_code} at {self.clicked_at}"
+        # Only name the code when the link is loaded (it may be on another database)
+        link = self.link.short_code if Click.link.is_cached(self) else f'link {self.link_id}'
+        return f"Click on {link} at {self.clicked_at}"
+
+    @property
+    def user_agent(self):
+        return self.user_agent_ref.user_agent if self.user_agent_ref_id else ''
+
+    @property
+    def referrer(self):
+        return self.referrer_ref.url if self.referrer_ref_id else ''
 
     @classmethod
     def record_click(cls, link, request):
-        """Record a click with analytics data"""
+        """
+        Record a click with analytics data; None if the request was bot
+        traffic that is not recorded or a repeat within the dedup window
+        """
+        # Classify first: bot traffic is written per the owner's plan
+        if bots.classify(request) is not None:
+            policy = bots.policy_for(link.pk)
+            if policy == bots.COUNT:
+                Link.objects.filter(pk=link.pk).update(bot_clicks=F('bot_clicks') + 1, last_clicked_at=timezone.now())
+            if policy != bots.RECORD:
+                return None
+
         # Get IP
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
@@ -131,53 +432,386 @@ class Click(models.Model):
             ip = request.META.get('REMOTE_ADDR')
 
         # Get user agent info
-        user_agent = request.META.get('HTTP_USER_AGENT', '')
-        referrer = request.META.get('HTTP_REFERER', '')
-
-        # Parse device type (basic)
-        device_type = 'desktop'
-        ua_lower = user_agent.lower()
-        if 'mobile' in ua_lower or 'android' in ua_lower:
-            device_type = 'mobile'
-        elif 'tablet' in ua_lower or 'ipad' in ua_lower:
-            device_type = 'tablet'
-
-        # Parse browser (basic)
-        browser = 'Other'
-        if 'chrome' in ua_lower:
-            browser = 'Chrome'
-        elif 'firefox' in ua_lower:
-            browser = 'Firefox'
-        elif 'safari' in ua_lower:
-            browser = 'Safari'
-        elif 'edge' in ua_lower:
-            browser = 'Edge'
-
-        # Parse OS (basic)
-        os_name = 'Other'
-        if 'windows' in ua_lower:
-            os_name = 'Windows'
-        elif 'mac' in ua_lower:
-            os_name = 'macOS'
-        elif 'linux' in ua_lower:
-            os_name = 'Linux'
-        elif 'android' in ua_lower:
-            os_name = 'Android'
-        elif 'iphone' in ua_lower or 'ipad' in ua_lower:
-            os_name = 'iOS'
-
-        # Create click record
+        user_agent = request.META.get('HTTP_USER_AGENT', '')[:500]  # Limit length
+        referrer = request.META.get('HTTP_REFERER', '')[:2048]
+
+        # A repeat of a recent click only counts as another hit on it
+        fingerprint = None
+        if dedup.enabled():
+            fingerprint = dedup.fingerprint(link.pk, ip, user_agent)
+            click_id = dedup.seen(fingerprint)
+            if click_id is not None:
+                cls.objects.for_link(link).filter(pk=click_id).update(hits=F('hits') + 1)
+                Link.objects.filter(pk=link.pk).update(last_clicked_at=timezone.now())
+                return None
+
+        # Parse device type, browser and OS (cached per distinct user agent)
+        device_type, browser, os_name = parse_user_agent(user_agent)
+
+        # Resolve location from the local GeoIP database (no network)
+        country, city = geoip.lookup(ip)
+
+        # Create click record (dictionary rows go to the click's database)
+        alias = sharding.write_alias(link.pk)
         click = cls.objects.create(
             link=link,
             ip_address=ip,
-            user_agent=user_agent[:500],  # Limit length
-            referrer=referrer[:2048] if referrer else '',
+            user_agent_ref_id=UserAgent.key_for(user_agent, using=alias),
+            referrer_ref_id=Referrer.key_for(referrer, using=alias),
+            country=country[:100],
+            city=city[:100],
             device_type=device_type,
             browser=browser,
             os=os_name,
         )
+        if fingerprint is not None:
+            dedup.remember(fingerprint, click.pk)
 
         # Increment link counter
         link.increment_clicks()
 
+        # Update daily rollup and unique-visitor sketch
+        DailyLinkStats.record(link, click.clicked_at, ip)
+
+        # Feed top-N dimension sketches (persisted periodically)
+        LinkHeavyHitters.record(link.pk, LinkHeavyHitters._dimensions(
+            browser.label, os_name.label, device_type.label, country, referrer,
+        ))
+
         return click
+
+
+def archived_links_on(alias, link_ids=None):
+    """Links with archived clicks whose rollups are stored on alias"""
+    if not archive.enabled():
+        return []
+    ids = archive.archived_links() if link_ids is None else link_ids
+    return [link_id for link_id in ids if (sharding.shard_for(link_id) or DEFAULT_DB_ALIAS) == alias]
+
+
+class DailyLinkStatsQuerySet(models.QuerySet):
+
+    def visitors_sketch(self):
+        """Merged HyperLogLog of all selected link-days"""
+        return HyperLogLog.union(self.values_list('visitors', flat=True).iterator())
+
+    def unique_visitors(self):
+        """Estimated unique visitors across all selected link-days"""
+        return self.visitors_sketch().count()
+
+
+class DailyLinkStats(models.Model):
+    """Per-link daily rollup with a HyperLogLog sketch of visitor IPs"""
+
+    link = models.ForeignKey(
+        Link,
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        db_constraint=False
+    )
+    date = models.DateField()
+    clicks = models.PositiveIntegerField(default=0)
+    visitors = models.BinaryField(default=bytes, blank=True)  # Serialized HyperLogLog
+
+    objects = ShardedManager.from_queryset(DailyLinkStatsQuerySet)()
+
+    class Meta:
+        db_table = 'link_daily_stats'
+        ordering = ['-date']
+        unique_together = [('link', 'date')]
+
+    def __str__(self):
+        return f"Stats for link {self.link_id} on {self.date}"
+
+    @classmethod
+    def record(cls, link, clicked_at, visitor):
+        """Count one click and add its visitor to the day's sketch"""
+        day = timezone.localdate(clicked_at)
+        alias = sharding.write_alias(link.pk)
+        row = cls.objects.db_manager(alias).filter(link=link, date=day)
+
+        # The day's first click creates the row; every other one is a single UPDATE
+        if not row.update(clicks=F('clicks') + 1):
+            sketch = HyperLogLog()
+            sketch.add(visitor or '')
+            try:
+                with transaction.atomic(using=alias):
+                    cls.objects.db_manager(alias).create(link=link, date=day, clicks=1, visitors=sketch.to_bytes())
+                return
+            except IntegrityError:
+                # Another worker created it first
+                row.update(clicks=F('clicks') + 1)
+
+        # Most visitors leave every register as it is, so the sketch is read
+        # without a lock and only written when one changes, compare-and-set:
+        # if another click rewrote it meanwhile, re-read and try again
+        while True:
+            stored = row.values_list('visitors', flat=True).first()
+            if stored is None:
+                # Deleted along with its link
+                return
+            sketch = HyperLogLog.from_bytes(stored)
+            if not sketch.add(visitor or '') or row.filter(visitors=stored).update(visitors=sketch.to_bytes()):
+                return
+
+    @classmethod
+    def rebuild(cls, link_ids=None, batch_size=1000):
+        """Recompute rollups from raw clicks (all links, or only link_ids)"""
+        for alias, ids in sharding.partition(link_ids):
+            cls._rebuild(alias or DEFAULT_DB_ALIAS, ids, batch_size)
+
+    @classmethod
+    def _rebuild(cls, alias, link_ids, batch_size):
+        clicks = Click.objects.using(alias).order_by('link_id', 'clicked_at')
+        stats = cls.objects.using(alias)
+        if link_ids is not None:
+            clicks = clicks.filter(link_id__in=link_ids)
+            stats = stats.filter(link_id__in=link_ids)
+
+        with transaction.atomic(using=alias):
+            stats.delete()
+
+            pending = {}
+            rows = clicks.values_list('link_id', 'clicked_at', 'ip_address')
+            for link_id, clicked_at, ip in rows.iterator(chunk_size=batch_size):
+                key = (link_id, timezone.localdate(clicked_at))
+                entry = pending.get(key)
+                if entry is None:
+                    entry = pending[key] = [0, HyperLogLog()]
+                entry[0] += 1
+                entry[1].add(ip or '')
+
+                if len(pending) >= batch_size:
+                    cls._bulk_store(alias, pending, batch_size)
+                    pending = {}
+            cls._bulk_store(alias, pending, batch_size)
+
+            # Archived clicks, merged into the rows stored above
+            pending = {}
+            for link_id in archived_links_on(alias, link_ids):
+                for day, count, sketch in archive.daily_rollups(link_id):
+                    entry = pending.get((link_id, day))
+                    if entry is None:
+                        pending[(link_id, day)] = [count, sketch]
+                    else:
+                        entry[0] += count
+                        entry[1].merge(sketch)
+                if len(pending) >= batch_size:
+                    cls._bulk_store(alias, pending, batch_size)
+                    pending = {}
+            cls._bulk_store(alias, pending, batch_size)
+
+    @classmethod
+    def _bulk_store(cls, alias, pending, batch_size):
+        # A link-day split across two batches is merged into the stored row
+        existing = {}
+        if pending:
+            links = {link_id for link_id, _ in pending}
+            dates = {day for _, day in pending}
+            for row in cls.objects.using(alias).filter(link_id__in=links, date__in=dates):
+                if (row.link_id, row.date) in pending:
+                    existing[(row.link_id, row.date)] = row
+
+        to_create = []
+        to_update = []
+        for (link_id, day), (count, sketch) in pending.items():
+            row = existing.get((link_id, day))
+            if row is None:
+                to_create.append(cls(link_id=link_id, date=day, clicks=count, visitors=sketch.to_bytes()))
+            else:
+                row.clicks += count
+                row.visitors = sketch.merge(HyperLogLog.from_bytes(row.visitors)).to_bytes()
+                to_update.append(row)
+        cls.objects.using(alias).bulk_create(to_create, batch_size=batch_size)
+        cls.objects.using(alias).bulk_update(to_update, ['clicks', 'visitors'], batch_size=batch_size)
+
+
+class LinkHeavyHitters(models.Model):
+    """Per-link Space-Saving sketches answering top-N dimension queries"""
+
+    DIMENSIONS = ['browser', 'os', 'device_type', 'country', 'referrer_domain']
+    CAPACITY = 50
+    MAX_PENDING_CLICKS = 1000
+
+    link = models.OneToOneField(
+        Link,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='heavy_hitters',
+        db_constraint=False
+    )
+    # {dimension: [[value, count, error], ...]}
+    sketches = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    # In-process buffer: {link_id: {dimension: Counter}}
+    _pending = {}
+    _pending_clicks = 0
+    _last_flush = time.monotonic()
+    _lock = threading.Lock()
+
+    class Meta:
+        db_table = 'link_heavy_hitters'
+
+    def __str__(self):
+        return f"Heavy hitters for link {self.link_id}"
+
+    @staticmethod
+    def referrer_domain(referrer):
+        """Host of a referrer URL without a leading www."""
+        host = (urlsplit(referrer).hostname or '') if referrer else ''
+        return host[4:] if host.startswith('www.') else host
+
+    @classmethod
+    def dimensions_of(cls, click):
+        """Dimension values of a click"""
+        return cls._dimensions(
+            click.get_browser_display(),
+            click.get_os_display(),
+            click.get_device_type_display(),
+            click.country,
+            click.referrer,
+        )
+
+    @classmethod
+    def _dimensions(cls, browser, os_name, device_type, country, referrer):
+        return {
+            'browser': browser,
+            'os': os_name,
+            'device_type': device_type,
+            'country': country,
+            'referrer_domain': cls.referrer_domain(referrer),
+        }
+
+    @staticmethod
+    def _add(counters, dimension, value, count=1):
+        # Empty values (unknown country, direct traffic) are not tracked
+        if value:
+            counters.setdefault(dimension, Counter())[value] += count
+
+    @classmethod
+    def _count(cls, counters, values):
+        for dimension, value in values.items():
+            cls._add(counters, dimension, value)
+
+    @classmethod
+    def for_link(cls, link):
+        """Stored sketches of a link (empty if it has never been flushed)"""
+        try:
+            return cls.objects.for_link(link).get(link=link)
+        except cls.DoesNotExist:
+            return cls(link=link)
+
+    def top(self, dimension, n=5):
+        """Top values as [{dimension: value, 'count': count}, ...]"""
+        sketch = SpaceSaving.from_list(self.sketches.get(dimension), self.CAPACITY)
+        return [{dimension: value, 'count': count} for value, count in sketch.top(n)]
+
+    def update(self, counters):
+        """Apply {dimension: Counter} to the stored sketches"""
+        for dimension, counter in counters.items():
+            sketch = SpaceSaving.from_list(self.sketches.get(dimension), self.CAPACITY)
+            for value, count in counter.items():
+                sketch.add(value, count)
+            self.sketches[dimension] = sketch.to_list()
+
+    @classmethod
+    def record(cls, link_id, values):
+        """Buffer one click's dimension values; flush when the buffer is due"""
+        with cls._lock:
+            cls._count(cls._pending.setdefault(link_id, {}), values)
+            cls._pending_clicks += 1
+            due = (
+                cls._pending_clicks >= cls.MAX_PENDING_CLICKS
+                or time.monotonic() - cls._last_flush >= settings.HEAVY_HITTERS_FLUSH_SECONDS
+            )
+        if due:
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        """Persist buffered counts into the per-link sketches"""
+        with cls._lock:
+            pending, cls._pending = cls._pending, {}
+            cls._pending_clicks = 0
+            cls._last_flush = time.monotonic()
+
+        for link_id, counters in pending.items():
+            alias = sharding.write_alias(link_id)
+            try:
+                with transaction.atomic(using=alias):
+                    row, _ = cls.objects.db_manager(alias).select_for_update().get_or_create(link_id=link_id)
+                    row.update(counters)
+                    row.save()
+            except IntegrityError:
+                # Link was deleted before its counts were flushed
+                continue
+
+    @classmethod
+    def rebuild(cls, link_ids=None, batch_size=1000):
+        """Recompute sketches from raw clicks (all links, or only link_ids)"""
+        for alias, ids in sharding.partition(link_ids):
+            cls._rebuild(alias or DEFAULT_DB_ALIAS, ids, batch_size)
+
+    @classmethod
+    def _rebuild(cls, alias, link_ids, batch_size):
+        clicks = Click.objects.using(alias).order_by('link_id')
+        rows = cls.objects.using(alias)
+        if link_ids is not None:
+            clicks = clicks.filter(link_id__in=link_ids)
+            rows = rows.filter(link_id__in=link_ids)
+
+        # Archived clicks are counted up front, vectorized
+        archived = {link_id: cls._archived_counters(alias, link_id) for link_id in archived_links_on(alias, link_ids)}
+
+        values = clicks.values_list('link_id', 'browser', 'os', 'device_type', 'country', 'referrer_ref__url')
+        with transaction.atomic(using=alias):
+            rows.delete()
+            batch = []
+
+            def store(link_id, counters):
+                row = cls(link_id=link_id)
+                row.update(counters)
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    cls.objects.using(alias).bulk_create(batch)
+                    batch.clear()
+
+            for link_id, group in groupby(values.iterator(chunk_size=batch_size), key=itemgetter(0)):
+                counters = archived.pop(link_id, {})
+                for _, browser, os_name, device_type, country, referrer in group:
+                    cls._count(counters, cls._dimensions(
+                        label_of(Browser, browser),
+                        label_of(OperatingSystem, os_name),
+                        label_of(DeviceType, device_type),
+                        country,
+                        referrer,
+                    ))
+                store(link_id, counters)
+            for link_id, counters in archived.items():
+                store(link_id, counters)
+            cls.objects.using(alias).bulk_create(batch)
+
+    @classmethod
+    def _archived_counters(cls, alias, link_id):
+        """{dimension: Counter} of a link's archived clicks"""
+        counters = {}
+        for dimension, choices in (('browser', Browser), ('os', OperatingSystem), ('device_type', DeviceType)):
+            for code, count in archive.value_counts([link_id], dimension).items():
+                cls._add(counters, dimension, label_of(choices, code), count)
+        for country, count in archive.value_counts([link_id], 'country').items():
+            cls._add(counters, 'country', country, count)
+
+        referrers = archive.value_counts([link_id], 'referrer')
+        urls = Referrer.objects.using(alias).in_bulk([key for key in referrers if key])
+        for key, count in referrers.items():
+            referrer = urls[key].url if key in urls else ''
+            cls._add(counters, 'referrer_domain', cls.referrer_domain(referrer), count)
+        return counters
+
+
+atexit.register(LinkHeavyHitters.flush)
+post_delete.connect(sharding.delete_link_rows, sender=Link, dispatch_uid='shortener.delete_link_rows')
+post_delete.connect(archive.delete_link_files, sender=Link, dispatch_uid='shortener.delete_link_files')
@@ -0,0 +1,84 @@
+"""
+Purge of soft-deleted links
+
+Deleting a link only stamps Link.deleted_at, which hides it at once. Its
+clicks, rollups, sketches and archive are removed afterwards in primary-key
+ordered batches of raw DELETEs, each committing on its own, so no request
+or transaction ever holds a link's whole click history. The link row goes
+last, when nothing is left to cascade to.
+
+Purges run on a background thread once the soft delete commits
+(settings.LINK_PURGE_IN_BACKGROUND); `manage.py purge_deleted_links` picks
+up whatever an exiting or serverless process left behind.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import archive, sharding
+
+logger = logging.getLogger(__name__)
+
+
+def _purge_rows(model, alias, link_id, batch_size):
+    """Delete a link's rows of model, batch by batch in pk order; returns the count"""
+    rows = model._base_manager.using(alias).filter(link_id=link_id).order_by('pk')
+    purged = 0
+    last = None
+    while True:
+        batch = rows if last is None else rows.filter(pk__gt=last)
+        ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return purged
+        # No collector, no signals: nothing references these rows
+        purged += model._base_manager.using(alias).filter(pk__in=ids)._raw_delete(alias)
+        last = ids[-1]
+
+
+def purge_link(link_id, batch_size=None):
+    """Remove a soft-deleted link and everything recorded for it; returns the rows purged"""
+    from .models import Click, DailyLinkStats, Link, LinkHeavyHitters
+
+    if not Link.all_objects.filter(pk=link_id, deleted_at__isnull=False).exists():
+        return 0
+    batch_size = batch_size or settings.LINK_PURGE_BATCH_SIZE
+    alias = sharding.write_alias(link_id)
+    purged = 0
+    for model in (Click, DailyLinkStats, LinkHeavyHitters):
+        purged += _purge_rows(model, alias, link_id, batch_size)
+    archive.delete_link(link_id)
+    # Also sweeps up clicks recorded while the purge ran
+    Link.all_objects.filter(pk=link_id, deleted_at__isnull=False).delete()
+    return purged
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _run(link_ids):
+    try:
+        for link_id in link_ids:
+            purge_link(link_id)
+    except Exception:
+        # The link stays soft-deleted; purge_deleted_links retries it
+        logger.exception('Purging links %s failed', link_ids)
+    finally:
+        connections.close_all()
+
+
+def schedule(link_ids):
+    """Purge soft-deleted links in the background once the current transaction commits"""
+    global _executor
+    if not link_ids or not settings.LINK_PURGE_IN_BACKGROUND:
+        return
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # One thread: purges queue up instead of competing for locks
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='link-purge')
+    link_ids = list(link_ids)
+    transaction.on_commit(lambda: _executor.submit(_run, link_ids))
@@ -0,0 +1,118 @@
+"""
+Redirect resolution cache: short code -> minimal link record
+
+Only used with a cache shared by all workers (core.caching): edits evict
+records in the process that made them, so per-process copies would keep
+serving old destinations.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from core.caching import shared_cache
+from . import link_table
+from .models import Link
+
+
+# Bumped whenever the record layout changes
+KEY_PREFIX = 'redirect:v2:'
+
+# Fields needed to serve a redirect without loading the full Link
+RECORD_FIELDS = ['id', 'short_code', 'custom_alias', 'original_url', 'is_active', 'expires_at']
+
+
+def cache_key(code):
+    return f'{KEY_PREFIX}{code}'
+
+
+def to_record(row):
+    """Compact cache value: (id, original_url, is_active, expires epoch or None)"""
+    expires_at = row['expires_at']
+    return (
+        row['id'],
+        row['original_url'],
+        row['is_active'],
+        int(expires_at.timestamp()) if expires_at else None,
+    )
+
+
+def is_expired(record):
+    expires = record[3]
+    return expires is not None and time.time() > expires
+
+
+def resolve(code):
+    """Return the record for a short code or alias, or None if unknown"""
+    # Host-wide shared table first (when enabled), then the cache, then the DB
+    record = link_table.lookup(code)
+    if record is not None:
+        return record
+
+    key = cache_key(code)
+    cached = shared_cache()
+    record = cache.get(key) if cached else None
+    if record is not None:
+        return record
+
+    # Custom alias takes precedence over a short code with the same value
+    rows = list(
+        Link.objects
+        .filter(Q(custom_alias=code) | Q(short_code=code))
+        .values(*RECORD_FIELDS)[:2]
+    )
+    if not rows:
+        return None
+    row = next((row for row in rows if row['custom_alias'] == code), rows[0])
+    record = to_record(row)
+    if cached:
+        cache.set(key, record, settings.REDIRECT_CACHE_TIMEOUT)
+    return record
+
+
+def invalidate(*codes):
+    """Drop cached records for the given codes (None values are ignored)"""
+    keys = [cache_key(code) for code in codes if code]
+    if keys:
+        cache.delete_many(keys)
+
+
+def hot_links_queryset(limit):
+    """Active, non-expired links ordered by popularity"""
+    now = timezone.now()
+    return (
+        Link.objects
+        .filter(is_active=True)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .order_by('-clicks_count')
+        .values(*RECORD_FIELDS)[:limit]
+    )
+
+
+def warm(limit=None):
+    """Load the hottest links into the cache with two queries; returns the count"""
+    if limit is None:
+        limit = settings.REDIRECT_CACHE_WARM_LINKS
+    if limit <= 0 or not shared_cache():
+        return 0
+
+    rows = list(hot_links_queryset(limit))
+    # A custom alias wins over another link's short code with the same value,
+    # whether or not that link is hot enough to be warmed
+    aliases = set(
+        Link.objects
+        .filter(custom_alias__in=[row['short_code'] for row in rows])
+        .values_list('custom_alias', flat=True)
+    )
+
+    entries = {}
+    for row in rows:
+        record = to_record(row)
+        if row['short_code'] not in aliases or row['short_code'] == row['custom_alias']:
+            entries[cache_key(row['short_code'])] = record
+        if row['custom_alias']:
+            entries[cache_key(row['custom_alias'])] = record
+    cache.set_many(entries, settings.REDIRECT_CACHE_TIMEOUT)
+    return len(rows)
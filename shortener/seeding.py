@@ -0,0 +1,169 @@
+"""
+Synthetic dataset seeding for load tests and query budgets
+"""
+import bisect
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from . import sharding
+from .dimensions import Browser, DeviceType, OperatingSystem
+from .models import Link, Click, DailyLinkStats, LinkHeavyHitters, Referrer, UserAgent
+
+
+SEED_USER_PREFIX = 'loadtest-'
+
+SAMPLE_USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0',
+    'Mozilla/5.0 (iPad; CPU OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+]
+
+SAMPLE_REFERRERS = [
+    '',
+    'https://www.google.com/',
+    'https://t.co/',
+    'https://www.facebook.com/',
+    'https://news.ycombinator.com/',
+]
+
+
+class ZipfSampler:
+    """Draw ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** s"""
+
+    def __init__(self, n, s=1.1, rng=None):
+        if n < 1:
+            raise ValueError('Zipf population must not be empty.')
+        self.n = n
+        self.rng = rng or random.Random()
+        weights = (1.0 / (rank + 1) ** s for rank in range(n))
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def sample(self):
+        """Return a single rank, 0 being the most popular"""
+        point = self.rng.random() * self.total
+        return min(bisect.bisect_left(self.cum_weights, point), self.n - 1)
+
+    def sample_many(self, k):
+        return [self.sample() for _ in range(k)]
+
+
+@contextmanager
+def backdated(model, field_name):
+    """Allow explicit values for an auto_now_add field during bulk inserts"""
+    field = model._meta.get_field(field_name)
+    original = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = original
+
+
+def clear_dataset():
+    """Remove every user (and cascading links/clicks) created by seed_dataset"""
+    User = get_user_model()
+    User.objects.filter(username__startswith=SEED_USER_PREFIX).delete()
+
+
+def seed_dataset(users=10, links=1000, clicks=10000, zipf_s=1.1, days=90,
+                 plan='business', seed=None, batch_size=2000):
+    """
+    Create users, links and historical clicks with Zipf-skewed popularity.
+
+    Returns (users, links) ordered by popularity rank: links[0] is the
+    hottest link and users[0] owns the most links.
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+    password = make_password(None)
+
+    user_objs = User.objects.bulk_create([
+        User(
+            username=f'{SEED_USER_PREFIX}{i}',
+            email=f'{SEED_USER_PREFIX}{i}@example.com',
+            password=password,
+            plan=plan,
+            api_key=f'{rng.getrandbits(128):032x}{i:032x}',
+        )
+        for i in range(users)
+    ], batch_size=batch_size)
+    # bulk_create only returns primary keys on some backends
+    user_objs = list(
+        User.objects.filter(username__startswith=SEED_USER_PREFIX).order_by('id')
+    )
+
+    owner_sampler = ZipfSampler(len(user_objs), s=zipf_s, rng=rng)
+    now = timezone.now()
+
+    Link.objects.bulk_create([
+        Link(
+            user=user_objs[owner_sampler.sample()],
+            original_url=url,
+            url_digest=Link.digest_url(url),
+            short_code=f'lt{i:x}'[:20],
+            title=f'Load test link {i}',
+        )
+        for i, url in (
+            (i, f'https://example.com/{SEED_USER_PREFIX}{i}/{rng.getrandbits(32):08x}')
+            for i in range(links)
+        )
+    ], batch_size=batch_size)
+    link_objs = list(
+        Link.objects.filter(user__in=user_objs).order_by('id')
+    )
+
+    link_sampler = ZipfSampler(len(link_objs), s=zipf_s, rng=rng)
+    counts = [0] * len(link_objs)
+    span = timedelta(days=days).total_seconds()
+
+    with backdated(Click, 'clicked_at'):
+        remaining = clicks
+        while remaining > 0:
+            batch = []
+            for _ in range(min(batch_size, remaining)):
+                rank = link_sampler.sample()
+                counts[rank] += 1
+                batch.append(Click(
+                    link=link_objs[rank],
+                    clicked_at=now - timedelta(seconds=rng.random() * span),
+                    ip_address=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+                    user_agent_ref_id=rng.choice(SAMPLE_USER_AGENTS),
+                    referrer_ref_id=rng.choice(SAMPLE_REFERRERS),
+                    device_type=rng.choice([DeviceType.DESKTOP, DeviceType.MOBILE, DeviceType.TABLET]),
+                    browser=rng.choice([Browser.CHROME, Browser.SAFARI, Browser.FIREFOX, Browser.EDGE, Browser.OTHER]),
+                    os=rng.choice([
+                        OperatingSystem.WINDOWS, OperatingSystem.MACOS, OperatingSystem.LINUX,
+                        OperatingSystem.ANDROID, OperatingSystem.IOS,
+                    ]),
+                ))
+            by_shard = {}
+            for click in batch:
+                by_shard.setdefault(sharding.write_alias(click.link_id), []).append(click)
+            for alias, shard_batch in by_shard.items():
+                # Swap the sampled strings for their dictionary keys on this database
+                for click in shard_batch:
+                    click.user_agent_ref_id = UserAgent.key_for(click.user_agent_ref_id, using=alias)
+                    click.referrer_ref_id = Referrer.key_for(click.referrer_ref_id, using=alias)
+                Click.objects.using(alias).bulk_create(shard_batch, batch_size=batch_size)
+            remaining -= len(batch)
+
+    for link, count in zip(link_objs, counts):
+        link.clicks_count = count
+    Link.objects.bulk_update(link_objs, ['clicks_count'], batch_size=batch_size)
+
+    # Bulk inserts bypass ingestion, so build the daily rollups afterwards
+    link_ids = [link.pk for link in link_objs]
+    DailyLinkStats.rebuild(link_ids=link_ids)
+    LinkHeavyHitters.rebuild(link_ids=link_ids)
+
+    return user_objs, link_objs
@@ -0,0 +1,184 @@
+"""
+Hash sharding of clicks and their rollups by link id
+
+Optional (settings.CLICK_SHARDS). Click, DailyLinkStats and LinkHeavyHitters
+rows live on the shard picked by a hash of their link id, so per-link
+analytics hit exactly one database, as do the user-agent and referrer
+dictionary rows their clicks reference. Links, users and everything else
+stay on the default database; per-user aggregates fan out to the shards in
+parallel.
+"""
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models
+
+from core.db_routers import current_read_alias
+from .sketches import hash64
+
+
+# Models stored on the shard of their link
+SHARDED_MODELS = {'click', 'dailylinkstats', 'linkheavyhitters'}
+
+# Dictionaries stored on the shard of the clicks referencing them
+DICTIONARY_MODELS = {'useragent', 'referrer'}
+
+
+def is_sharded():
+    return bool(settings.CLICK_SHARDS)
+
+
+def shard_for(link_id):
+    """Shard alias holding a link's clicks, or None when sharding is off"""
+    shards = settings.CLICK_SHARDS
+    if not shards:
+        return None
+    return shards[hash64(link_id) % len(shards)]
+
+
+def write_alias(link_id):
+    """Database to write a link's clicks and rollups to"""
+    return shard_for(link_id) or DEFAULT_DB_ALIAS
+
+
+def partition(link_ids=None):
+    """
+    [(alias, ids)] covering link_ids (None: every link). The alias is None
+    when sharding is off, leaving the choice to the other routers.
+    """
+    if not is_sharded():
+        return [(None, link_ids)]
+    if link_ids is None:
+        return [(alias, None) for alias in settings.CLICK_SHARDS]
+    groups = {}
+    for link_id in link_ids:
+        groups.setdefault(shard_for(link_id), []).append(link_id)
+    return list(groups.items())
+
+
+def merge_counts(results, key, count='count'):
+    """Sum [{key: value, count: n}, ...] lists returned by several shards"""
+    totals = Counter()
+    for rows in results:
+        for row in rows:
+            totals[row[key]] += row[count]
+    return [{key: value, count: total} for value, total in totals.items()]
+
+
+def link_ids_of(links):
+    """Ids of a Link queryset (or of a list of ids)"""
+    if isinstance(links, models.QuerySet):
+        return list(links.values_list('pk', flat=True))
+    return list(links)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _run_on_shard(alias, fn, *args):
+    # Pool threads keep their connections between requests
+    connections[alias].close_if_unusable_or_obsolete()
+    return fn(*args)
+
+
+def run_parallel(tasks):
+    """Run [(alias, fn, *args)] concurrently, one thread per shard query"""
+    global _executor
+    if len(tasks) <= 1:
+        return [fn(*args) for _, fn, *args in tasks]
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=len(settings.CLICK_SHARDS),
+                    thread_name_prefix='click-shard',
+                )
+    futures = [_executor.submit(_run_on_shard, alias, fn, *args) for alias, fn, *args in tasks]
+    return [future.result() for future in futures]
+
+
+class ShardedManager(models.Manager):
+    """Manager for models stored on the shard of their link"""
+
+    def for_link(self, link):
+        """Manager bound to the shard of a link (or link id)"""
+        alias = shard_for(getattr(link, 'pk', link))
+        return self if alias is None else self.db_manager(alias)
+
+    def create(self, **kwargs):
+        link_id = kwargs['link'].pk if 'link' in kwargs else kwargs.get('link_id')
+        alias = shard_for(link_id)
+        if alias is not None and self._db is None:
+            return self.db_manager(alias).create(**kwargs)
+        return super().create(**kwargs)
+
+    def fan_out(self, fn, links=None):
+        """
+        Call fn(queryset) once per shard and return the results as a list.
+
+        links is a Link queryset or a list of link ids restricting the rows
+        (None: every row); without sharding fn runs once against a filter.
+        """
+        if not is_sharded():
+            queryset = self.all() if links is None else self.filter(link__in=links)
+            return [fn(queryset)]
+
+        link_ids = None if links is None else link_ids_of(links)
+        tasks = []
+        for alias, ids in partition(link_ids):
+            queryset = self.db_manager(alias).all()
+            if ids is not None:
+                queryset = queryset.filter(link_id__in=ids)
+            tasks.append((alias, fn, queryset))
+        return run_parallel(tasks)
+
+
+class ClickShardRouter:
+    """Route sharded models to their link's shard (place before ReplicaRouter)"""
+
+    @staticmethod
+    def _link_id(instance):
+        if instance is None:
+            return None
+        if instance._meta.model_name == 'link':
+            return instance.pk
+        return getattr(instance, 'link_id', None)
+
+    def _route(self, model, hints):
+        if not is_sharded():
+            return None
+        instance = hints.get('instance')
+        if model._meta.model_name in SHARDED_MODELS:
+            link_id = self._link_id(instance)
+            return shard_for(link_id) if link_id is not None else None
+        if instance is not None and instance._meta.model_name in SHARDED_MODELS:
+            if model._meta.model_name in DICTIONARY_MODELS:
+                # click.user_agent_ref / referrer_ref: written next to the click
+                link_id = self._link_id(instance)
+                return shard_for(link_id) if link_id is not None else None
+            # click.link and friends: the link is never on the click's shard
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        alias = self._route(model, hints)
+        if alias == DEFAULT_DB_ALIAS:
+            return current_read_alias() or alias
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+
+def delete_link_rows(sender, instance, **kwargs):
+    """Cascade a link deletion to its shard (FKs cannot cross databases)"""
+    alias = shard_for(instance.pk)
+    if alias is None:
+        return
+    from .models import Click, DailyLinkStats, LinkHeavyHitters
+
+    for model in (Click, DailyLinkStats, LinkHeavyHitters):
+        model._base_manager.using(alias).filter(link_id=instance.pk).delete()
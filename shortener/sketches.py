@@ -0,0 +1,135 @@
+"""
+Probabilistic sketches for click analytics
+"""
+import hashlib
+import math
+import zlib
+
+
+def hash64(value):
+    """Stable 64-bit hash of a value (same result in every process)"""
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality estimator.
+
+    With the default precision (4096 one-byte registers) the standard error
+    is about 1.6%. Sketches with the same precision merge losslessly, so
+    daily per-link sketches can be combined over any window or set of links.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError('HyperLogLog precision must be between 4 and 16.')
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.size)
+        else:
+            if len(registers) != self.size:
+                raise ValueError('Register count does not match precision.')
+            self.registers = bytearray(registers)
+
+    def add(self, value):
+        """Add a value; return True if the sketch changed"""
+        h = hash64(value)
+        index = h >> (64 - self.precision)
+        remaining = 64 - self.precision
+        w = h & ((1 << remaining) - 1)
+        rank = remaining - w.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        """Merge another sketch into this one (register-wise max)"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision.')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added"""
+        m = self.size
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Small range correction (linear counting)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_bytes(self):
+        """Serialize as precision byte + zlib-compressed registers"""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=12):
+        """Load a sketch stored by to_bytes; empty data gives an empty sketch"""
+        if not data:
+            return cls(precision)
+        data = bytes(data)
+        return cls(data[0], zlib.decompress(data[1:]))
+
+    @classmethod
+    def union(cls, blobs, precision=12):
+        """Merge serialized sketches into one"""
+        result = cls(precision)
+        for blob in blobs:
+            if blob:
+                result.merge(cls.from_bytes(blob))
+        return result
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters summary (Metwally et al.).
+
+    Keeps at most `capacity` monitored values with an overestimated count and
+    its maximum error. Any value whose true frequency exceeds N / capacity is
+    guaranteed to be monitored, and dimensions with fewer distinct values than
+    the capacity (browsers, devices, OS) are counted exactly.
+    """
+
+    def __init__(self, capacity=50, counters=None):
+        self.capacity = capacity
+        self.counters = counters if counters is not None else {}
+
+    def add(self, value, count=1):
+        counters = self.counters
+        if value in counters:
+            counters[value][0] += count
+        elif len(counters) < self.capacity:
+            counters[value] = [count, 0]
+        else:
+            victim = min(counters, key=lambda key: counters[key][0])
+            floor = counters.pop(victim)[0]
+            counters[value] = [floor + count, floor]
+
+    def top(self, n=5):
+        """Return [(value, count), ...] for the n most frequent values"""
+        ranked = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(value, count) for value, (count, _) in ranked[:n]]
+
+    def to_list(self):
+        """JSON-friendly [[value, count, error], ...]"""
+        return [[value, count, error] for value, (count, error) in self.counters.items()]
+
+    @classmethod
+    def from_list(cls, data, capacity=50):
+        return cls(capacity, {value: [count, error] for value, count, error in (data or [])})
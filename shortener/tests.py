@@ -0,0 +1,40 @@
+"""
+Shortener tests
+
+The sharding tests only run with shards configured, e.g.
+CLICK_SHARD_URLS=sqlite:///clicks_0.sqlite3,sqlite:///clicks_1.sqlite3 python manage.py test shortener
+"""
+from unittest import skipUnless
+
+from django.conf import settings
+from django.test import RequestFactory, TestCase
+
+from . import sharding
+from .models import Click, Link, LinkHeavyHitters
+
+
+@skipUnless(settings.CLICK_SHARDS, 'CLICK_SHARD_URLS is not set')
+class ShardedClickTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Write buffered heavy-hitter counts while the test databases exist
+        self.addCleanup(LinkHeavyHitters.flush)
+
+    def test_fresh_click_reads_its_dictionaries_from_its_shard(self):
+        link = Link.objects.create(original_url='https://example.com/', short_code='shardua')
+        request = RequestFactory().get(
+            '/shardua',
+            HTTP_USER_AGENT='Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0',
+            HTTP_REFERER='https://news.example.org/post',
+            REMOTE_ADDR='203.0.113.7',
+        )
+        click = Click.record_click(link, request)
+
+        # Loaded without select_related: the dictionary rows are read lazily
+        fresh = Click.objects.for_link(link).get(pk=click.pk)
+        self.assertEqual(fresh._state.db, sharding.shard_for(link.pk))
+        self.assertEqual(fresh.user_agent, 'Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0')
+        self.assertEqual(fresh.referrer, 'https://news.example.org/post')
+        # The link itself is still read from the default database
+        self.assertEqual(fresh.link, link)
@@ -0,0 +1,174 @@
+"""
+Click time series
+
+Series are bucketed at minute, hour, day or week granularity in the
+caller's timezone and gap-filled. Day and week series in the server
+timezone are summed from the daily rollups. Everything else counts live
+clicks per UTC minute in the database and buckets the minutes; archived
+clicks are bucketed with NumPy by shortener.archive. Timezone offsets are
+whole quarter hours, so a UTC minute never straddles a local bucket edge.
+"""
+from bisect import bisect_right
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from . import archive
+from .models import Click, DailyLinkStats
+from .sharding import link_ids_of
+
+
+GRANULARITIES = ['minute', 'hour', 'day', 'week']
+MAX_BUCKETS = 5000
+
+
+def get_timezone(name=None):
+    """Timezone by IANA name (the server's when empty)"""
+    if not name:
+        return timezone.get_current_timezone()
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'Unknown timezone: {name}')
+
+
+def _midnight(day, tz):
+    return timezone.make_aware(datetime.combine(day, time()), tz)
+
+
+def floor(moment, granularity, tz):
+    """Start of the bucket containing moment (weeks start on Monday)"""
+    local = moment.astimezone(tz)
+    if granularity == 'minute':
+        return local.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    day = local.date()
+    if granularity == 'week':
+        day -= timedelta(days=day.weekday())
+    return _midnight(day, tz)
+
+
+def _next(edge, granularity, tz):
+    if granularity == 'minute':
+        return (edge.astimezone(dt_timezone.utc) + timedelta(minutes=1)).astimezone(tz)
+    if granularity == 'hour':
+        return (edge.astimezone(dt_timezone.utc) + timedelta(hours=1)).astimezone(tz)
+    # Calendar days, so DST days are 23 or 25 hours long
+    step = timedelta(days=7 if granularity == 'week' else 1)
+    return _midnight(edge.date() + step, tz)
+
+
+def bucket_edges(start, end, granularity, tz):
+    """Bucket boundaries covering [start, end); one more than the buckets"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity: {granularity}')
+    edges = [floor(start, granularity, tz)]
+    while edges[-1] < end:
+        if len(edges) > MAX_BUCKETS:
+            raise ValueError(f'More than {MAX_BUCKETS} buckets; use a coarser granularity.')
+        edges.append(_next(edges[-1], granularity, tz))
+    if len(edges) == 1:
+        edges.append(_next(edges[0], granularity, tz))
+    return edges
+
+
+def _click_points(links, start, end):
+    """[(epoch seconds, clicks), ...] per UTC minute of live clicks in [start, end)"""
+    def per_minute(clicks):
+        return list(
+            clicks.filter(clicked_at__gte=start, clicked_at__lt=end)
+            .annotate(minute=TruncMinute('clicked_at', tzinfo=dt_timezone.utc))
+            .values_list('minute')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+
+    return [
+        (int(minute.timestamp()), count)
+        for rows in Click.objects.fan_out(per_minute, links=links)
+        for minute, count in rows
+    ]
+
+
+def _rollup_points(links, start, end, tz):
+    """[(local midnight epoch seconds, clicks), ...] per day from the daily rollups"""
+    def per_day(daily_stats):
+        return list(
+            daily_stats.filter(date__gte=start.date(), date__lt=end.date())
+            .values_list('date')
+            .annotate(clicks=Sum('clicks'))
+            .order_by()
+        )
+
+    return [
+        (int(_midnight(day, tz).timestamp()), clicks)
+        for rows in DailyLinkStats.objects.fan_out(per_day, links=links)
+        for day, clicks in rows
+    ]
+
+
+def _bucket(points, boundaries):
+    """Sum of counts per [boundaries[i], boundaries[i + 1]) of (epoch seconds, count) points"""
+    counts = [0] * (len(boundaries) - 1)
+    for ts, count in points:
+        index = bisect_right(boundaries, ts) - 1
+        if 0 <= index < len(counts):
+            counts[index] += count
+    return counts
+
+
+def series(links, granularity, start, end, tz=None):
+    """
+    Gap-filled [{'start': bucket start, 'count': clicks}, ...] of the clicks
+    of links (a Link queryset or id list) in the buckets covering [start, end)
+    """
+    tz = tz or timezone.get_current_timezone()
+    edges = bucket_edges(start, end, granularity, tz)
+    boundaries = [int(edge.timestamp()) for edge in edges]
+    # Rollup days are server-local dates
+    if granularity in ('day', 'week') and getattr(tz, 'key', None) == settings.TIME_ZONE:
+        counts = _bucket(_rollup_points(links, edges[0], edges[-1], tz), boundaries)
+    else:
+        counts = _bucket(_click_points(links, edges[0], edges[-1]), boundaries)
+        if archive.covers(edges[0]):
+            archived = archive.bucket_counts(link_ids_of(links), boundaries)
+            counts = [count + more for count, more in zip(counts, archived)]
+    return [{'start': edge, 'count': count} for edge, count in zip(edges, counts)]
+
+
+def daily(links, days, tz=None):
+    """Gap-filled [{'date': date, 'count': clicks}, ...] for the last `days` days, today included"""
+    tz = tz or timezone.get_current_timezone()
+    start = _midnight(timezone.localdate(timezone=tz) - timedelta(days=days - 1), tz)
+    return [
+        {'date': row['start'].date(), 'count': row['count']}
+        for row in series(links, 'day', start, timezone.now(), tz)
+    ]
+
+
+def hour_of_week(moment):
+    """0 for Monday 00:00-01:00 up to 167 for Sunday 23:00-24:00"""
+    return moment.weekday() * 24 + moment.hour
+
+
+def heatmap(links, start, end, tz=None):
+    """Clicks per local hour of week in [start, end): 7 rows (Monday first) of 24"""
+    tz = tz or timezone.get_current_timezone()
+    counts = [0] * (7 * 24)
+    # Offsets only change on quarter-hour boundaries: convert each distinct
+    # quarter hour once instead of every minute
+    hours = {}
+    for ts, count in _click_points(links, start, end):
+        slot = ts // 900
+        if slot not in hours:
+            hours[slot] = hour_of_week(datetime.fromtimestamp(slot * 900, dt_timezone.utc).astimezone(tz))
+        counts[hours[slot]] += count
+    if archive.covers(start):
+        archived = archive.key_counts(link_ids_of(links), start, end, tz, hour_of_week, 7 * 24)
+        counts = [count + more for count, more in zip(counts, archived)]
+    return [counts[day * 24:(day + 1) * 24] for day in range(7)]
@@ -1,18 +1,22 @@
 """
 URL Shortener Views
 """
+import functools
 import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseRedirect, HttpResponse
-from django.db.models import Count, Q
-from django.db.models.functions import TruncDate
-from django.utils import timezone
+from django.http import JsonResponse, HttpResponseRedirect, HttpResponse, Http404
+from django.db.models import Count, Q, Sum
 from django.views.decorators.cache import cache_page
-from datetime import timedelta
 
-from .models import Link, Click
+from core.db_routers import replica_reads
+from .models import Link, Click, LinkHeavyHitters
+from . import archive, fragments, redirect_cache, timeseries
+from .conditional import DAY, MINUTE, conditional, link_etag, user_etag
+from .dimensions import DeviceType, label_of
+from .fragments import deferred
+from .sharding import merge_counts
 from .forms import LinkForm, QuickLinkForm
 
 
@@ -60,12 +64,12 @@ def home(request):
         form = QuickLinkForm(request.POST)
         if form.is_valid():
             url = form.cleaned_data['url']
+            user = request.user if request.user.is_authenticated else None
 
-            # Create link
-            link = Link.objects.create(
-                original_url=url,
-                user=request.user if request.user.is_authenticated else None
-            )
+            # Opt-in: hand back the caller's existing link to this URL
+            link = Link.find_reusable(user, url) if form.cleaned_data['reuse'] else None
+            if link is None:
+                link = Link.objects.create(original_url=url, user=user)
 
             # Return JSON for AJAX or redirect
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -83,7 +87,8 @@ def home(request):
     # Stats for homepage
     stats = {
         'total_links': Link.objects.count(),
-        'total_clicks': Click.objects.count(),
+        # Counters include archived clicks; no scan of the clicks table
+        'total_clicks': Link.objects.aggregate(total=Sum('clicks_count'))['total'] or 0,
     }
 
     return render(request, 'shortener/home.html', {
@@ -94,80 +99,100 @@ def home(request):
 
 def redirect_link(request, code):
     """Redirect short URL to original URL"""
-    # Try custom alias first, then short code
-    link = Link.objects.filter(custom_alias=code).first()
-    if not link:
-        link = get_object_or_404(Link, short_code=code)
+    # Resolve through the cache (custom alias first, then short code)
+    record = redirect_cache.resolve(code)
+    if record is None:
+        raise Http404('No Link matches the given query.')
+    link_id, original_url, is_active, _ = record
 
     # Check if active and not expired
-    if not link.is_active:
+    if not is_active:
+        link = get_object_or_404(Link, pk=link_id)
         return render(request, 'shortener/link_inactive.html', {'link': link})
 
-    if link.is_expired:
+    if redirect_cache.is_expired(record):
+        link = get_object_or_404(Link, pk=link_id)
         return render(request, 'shortener/link_expired.html', {'link': link})
 
-    # Record click
+    # Record click against a minimal instance (no extra query)
+    link = Link(pk=link_id, original_url=original_url)
     Click.record_click(link, request)
 
     # Redirect
-    return HttpResponseRedirect(link.original_url)
+    return HttpResponseRedirect(original_url)
 
 
 @login_required
+@replica_reads
+@conditional(user_etag(DAY))
 def dashboard(request):
     """User dashboard with links and stats"""
     user = request.user
     links = user.links.all()[:10]  # Latest 10 links
 
-    # Calculate stats
-    total_links = user.links.count()
-    total_clicks = Click.objects.filter(link__user=user).count()
+    # The figures below are computed on first use, so only for fragments
+    # missing from the cache (see shortener.fragments)
+    @functools.cache
+    def total_links():
+        return user.links.count()
+
+    # Click aggregates per click shard (queried in parallel when sharded)
+    def click_aggregates(clicks):
+        device_stats = clicks.values('device_type').annotate(count=Count('id'))
+        return clicks.count(), list(device_stats)
+
+    @functools.cache
+    def click_stats():
+        results = Click.objects.fan_out(click_aggregates, links=user.links.all())
+
+        # Clicks moved to the columnar archive count too
+        archived_devices = []
+        total_clicks = sum(result[0] for result in results)
+        if archive.enabled():
+            link_ids = list(user.links.values_list('pk', flat=True))
+            total_clicks += archive.count(link_ids)
+            archived_devices = [
+                {'device_type': code, 'count': count}
+                for code, count in archive.value_counts(link_ids, 'device_type').items()
+            ]
+
+        # Device breakdown
+        device_stats = merge_counts([result[1] for result in results] + [archived_devices], 'device_type')
+        for row in device_stats:
+            row['device_type'] = label_of(DeviceType, row['device_type'])
+        return total_clicks, device_stats
 
     # Clicks over last 7 days
-    last_week = timezone.now() - timedelta(days=7)
-    clicks_by_day = (
-        Click.objects
-        .filter(link__user=user, clicked_at__gte=last_week)
-        .annotate(date=TruncDate('clicked_at'))
-        .values('date')
-        .annotate(count=Count('id'))
-        .order_by('date')
-    )
-
-    # Convert dates to strings for JSON serialization
-    clicks_by_day_json = json.dumps([
-        {'date': item['date'].strftime('%Y-%m-%d'), 'count': item['count']}
-        for item in clicks_by_day
-    ])
+    def clicks_by_day():
+        # Convert dates to strings for JSON serialization
+        return json.dumps([
+            {'date': item['date'].strftime('%Y-%m-%d'), 'count': item['count']}
+            for item in timeseries.daily(user.links.all(), days=7)
+        ])
 
     # Top links
     top_links = user.links.order_by('-clicks_count')[:5]
 
-    # Device breakdown
-    device_stats = (
-        Click.objects
-        .filter(link__user=user)
-        .values('device_type')
-        .annotate(count=Count('id'))
-    )
-
-    # Convert to JSON for template
-    device_stats_json = json.dumps(list(device_stats))
-
     # Calculate links remaining
     links_limit = user.plan_config['links_limit']
-    links_remaining = max(0, links_limit - total_links) if links_limit != -1 else 0
+
+    def links_remaining():
+        return max(0, links_limit - total_links()) if links_limit != -1 else 0
 
     context = {
         'links': links,
-        'total_links': total_links,
-        'total_clicks': total_clicks,
-        'clicks_by_day': clicks_by_day_json,
+        'total_links': deferred(total_links),
+        'total_clicks': deferred(lambda: click_stats()[0]),
+        'clicks_by_day': deferred(clicks_by_day),
         'top_links': top_links,
-        'device_stats': device_stats_json,
+        # Convert to JSON for template
+        'device_stats': deferred(lambda: json.dumps(click_stats()[1])),
         'plan_config': user.plan_config,
-        'can_create': user.can_create_link(),
-        'links_remaining': links_remaining,
+        'can_create': deferred(user.can_create_link),
+        'links_remaining': deferred(links_remaining),
+        'fragment_version': fragments.user_version(request),
+        'fragment_day': fragments.today(),
+        'fragment_timeout': fragments.timeout(),
     }
 
     return render(request, 'shortener/dashboard.html', context)
@@ -177,28 +202,32 @@ def dashboard(request):
 def create_link(request):
     """Create new short link"""
     user = request.user
+    form = LinkForm(request.POST) if request.method == 'POST' else LinkForm()
+
+    # Opt-in: reusing the user's existing link to the URL needs no free slot
+    if form.is_bound and form.is_valid() and form.cleaned_data['reuse'] and not form.cleaned_data.get('custom_alias'):
+        link = Link.find_reusable(user, form.cleaned_data['original_url'])
+        if link is not None:
+            messages.info(request, 'You already have a short link for this URL.')
+            return redirect('link_detail', code=link.short_code)
 
     # Check limit
     if not user.can_create_link():
         messages.error(request, f'You have reached your link limit ({user.links_limit}). Upgrade your plan!')
         return redirect('profile')
 
-    if request.method == 'POST':
-        form = LinkForm(request.POST)
-        if form.is_valid():
-            # Check custom alias permission
-            if form.cleaned_data.get('custom_alias') and not user.can_use_custom_alias:
-                messages.error(request, 'Custom aliases require Pro or Business plan.')
-                return redirect('create_link')
+    if form.is_bound and form.is_valid():
+        # Check custom alias permission
+        if form.cleaned_data.get('custom_alias') and not user.can_use_custom_alias:
+            messages.error(request, 'Custom aliases require Pro or Business plan.')
+            return redirect('create_link')
 
-            link = form.save(commit=False)
-            link.user = user
-            link.save()
+        link = form.save(commit=False)
+        link.user = user
+        link.save()
 
-            messages.success(request, 'Link created successfully!')
-            return redirect('link_detail', code=link.short_code)
-    else:
-        form = LinkForm()
+        messages.success(request, 'Link created successfully!')
+        return redirect('link_detail', code=link.short_code)
 
     return render(request, 'shortener/create_link.html', {
         'form': form,
@@ -207,71 +236,49 @@ def create_link(request):
 
 
 @login_required
+@replica_reads
+@conditional(link_etag(MINUTE, sketches=True))
 def link_detail(request, code):
     """Link details and statistics"""
     link = get_object_or_404(Link, short_code=code)
 
     # Check ownership (allow viewing own links or public stats)
-    if link.user and link.user != request.user:
+    if link.user_id and link.user_id != request.user.pk:
         messages.error(request, 'You do not have permission to view this link.')
         return redirect('dashboard')
 
-    # Get analytics
-    last_30_days = timezone.now() - timedelta(days=30)
-
-    clicks_by_day = (
-        link.clicks
-        .filter(clicked_at__gte=last_30_days)
-        .annotate(date=TruncDate('clicked_at'))
-        .values('date')
-        .annotate(count=Count('id'))
-        .order_by('date')
-    )
-
-    # Convert dates to strings for JSON serialization
-    clicks_by_day_json = json.dumps([
-        {'date': item['date'].strftime('%Y-%m-%d'), 'count': item['count']}
-        for item in clicks_by_day
-    ])
-
-    browser_stats = (
-        link.clicks
-        .values('browser')
-        .annotate(count=Count('id'))
-        .order_by('-count')[:5]
-    )
-
-    device_stats = (
-        link.clicks
-        .values('device_type')
-        .annotate(count=Count('id'))
-    )
-
-    # Convert to JSON for template
-    device_stats_json = json.dumps(list(device_stats))
-
-    os_stats = (
-        link.clicks
-        .values('os')
-        .annotate(count=Count('id'))
-        .order_by('-count')[:5]
-    )
-
-    recent_clicks = link.clicks.all()[:20]
-
-    # Generate QR code
-    qr_code = link.generate_qr_code()
+    # Everything below is computed on first use, so only for fragments
+    # missing from the cache (see shortener.fragments)
+    def clicks_by_day():
+        # Convert dates to strings for JSON serialization
+        return json.dumps([
+            {'date': item['date'].strftime('%Y-%m-%d'), 'count': item['count']}
+            for item in timeseries.daily([link.pk], days=30)
+        ])
+
+    # Top-N breakdowns from the link's heavy-hitter sketches
+    heavy_hitters = deferred(lambda: LinkHeavyHitters.for_link(link))
+    device_stats = deferred(lambda: heavy_hitters.top('device_type', n=LinkHeavyHitters.CAPACITY))
 
     context = {
         'link': link,
-        'qr_code': qr_code,
-        'clicks_by_day': clicks_by_day_json,
-        'browser_stats': list(browser_stats),
-        'device_stats': device_stats_json,
-        'device_stats_list': list(device_stats),
-        'os_stats': list(os_stats),
-        'recent_clicks': recent_clicks,
+        # Generate QR code
+        'qr_code': deferred(link.generate_qr_code),
+        'clicks_by_day': deferred(clicks_by_day),
+        'browser_stats': deferred(lambda: heavy_hitters.top('browser')),
+        # Convert to JSON for template
+        'device_stats': deferred(lambda: json.dumps(list(device_stats))),
+        'device_stats_list': device_stats,
+        'os_stats': deferred(lambda: heavy_hitters.top('os')),
+        'referrer_stats': deferred(lambda: heavy_hitters.top('referrer_domain')),
+        'recent_clicks': deferred(lambda: list(link.clicks.select_related('referrer_ref')[:20])),
+        # Estimated unique visitors (merged daily HyperLogLog sketches)
+        'unique_visitors': deferred(link.daily_stats.unique_visitors),
         'full_short_url': request.build_absolute_uri(link.short_url),
+        'fragment_version': fragments.link_version(link),
+        'fragment_day': fragments.today(),
+        'fragment_timeout': fragments.timeout(),
+        'sketches_timeout': fragments.timeout(sketches_of=link),
     }
 
     return render(request, 'shortener/link_detail.html', context)
@@ -283,7 +290,7 @@ def delete_link(request, code):
     link = get_object_or_404(Link, short_code=code, user=request.user)
 
     if request.method == 'POST':
-        link.delete()
+        link.soft_delete()
         messages.success(request, 'Link deleted successfully.')
         return redirect('dashboard')
 